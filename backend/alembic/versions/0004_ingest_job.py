@@ -0,0 +1,31 @@
+"""add ingest_job table"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ingest_job",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("collection", sa.String(), nullable=False),
+        sa.Column("is_temp", sa.Boolean(), nullable=False),
+        sa.Column("doc_id", sa.String(), nullable=True),
+        sa.Column("pages_total", sa.Integer(), nullable=True),
+        sa.Column("pages_done", sa.Integer(), nullable=False),
+        sa.Column("chunks_embedded", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_job")
@@ -0,0 +1,20 @@
+"""add indexes for keyset pagination by owner"""
+
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_conversation_session_id_id", "conversation", ["session_id", "id"])
+    op.create_index("ix_chat_message_conversation_id_id", "chat_message", ["conversation_id", "id"])
+    op.create_index("ix_document_session_id_id", "document", ["session_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_document_session_id_id", table_name="document")
+    op.drop_index("ix_chat_message_conversation_id_id", table_name="chat_message")
+    op.drop_index("ix_conversation_session_id_id", table_name="conversation")
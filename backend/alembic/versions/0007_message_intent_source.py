@@ -0,0 +1,17 @@
+"""add chat_message.intent_source"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("chat_message", sa.Column("intent_source", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("chat_message", "intent_source")
@@ -1,4 +1,7 @@
+import asyncio
+import logging
 import os
+from typing import Literal, get_args
 from fastapi import APIRouter
 
 from sse_starlette.sse import EventSourceResponse
@@ -6,19 +9,27 @@ import json
 
 from pydantic import BaseModel
 
-from core.llm import LLM
-from core.rag import RAG
 from core import db
+from core.runtime import get_runtime
+from core.scheduler import LLMQueueFull
+from core.timing import StageTimer, metrics
 from external.incident_api import IncidentAPI
 
-ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-chat_model = os.getenv("OLLAMA_CHAT_MODEL", "llama3")
-embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
-chroma_url = os.getenv("CHROMA_URL", "http://localhost:8000")
+ClassifyMode = Literal["concurrent", "deferred", "off"]
+
+classify_mode = os.getenv("INTENT_CLASSIFICATION", "concurrent")
+if classify_mode not in get_args(ClassifyMode):
+    raise ValueError(
+        f"INTENT_CLASSIFICATION must be one of {', '.join(get_args(ClassifyMode))}, not {classify_mode!r}"
+    )
+history_messages = int(os.getenv("CHAT_HISTORY_MESSAGES", "6"))
+timings_event = os.getenv("CHAT_TIMINGS_EVENT", "off") == "on"
 
-llm = LLM(ollama_url, chat_model, embed_model)
-rag = RAG(llm, chroma_url)
 incident_api = IncidentAPI()
+logger = logging.getLogger(__name__)
+
+# Keeps deferred classification tasks referenced until they finish.
+_background: set[asyncio.Task] = set()
 
 router = APIRouter()
 
@@ -31,6 +42,12 @@ class ChatIn(BaseModel):
     user: str
     message: str
 
+    # Defaults to INTENT_CLASSIFICATION.
+    classify: ClassifyMode | None = None
+
+    # Send a "timings" event before "done"; defaults to CHAT_TIMINGS_EVENT.
+    timings: bool | None = None
+
 
 def render_sources(sources: list[dict]) -> str:
     links = [
@@ -40,43 +57,155 @@ def render_sources(sources: list[dict]) -> str:
     return "\n".join(links)
 
 
+async def _timed(timer: StageTimer, name: str, coro):
+    with timer.stage(name):
+        return await coro
+
+
+async def _load_history(conversation_id: int | None) -> list[dict]:
+    if conversation_id is None or history_messages <= 0:
+        return []
+    messages = await db.recent_messages(conversation_id, history_messages)
+    return [
+        {"role": "assistant" if m.sender == "assistant" else "user", "content": m.content}
+        for m in messages
+    ]
+
+
+def _collect_incident(session_id: int, message: str, intent: str | None, conf: float | None) -> None:
+    if intent in {"incident_report", "maintenance_query"} and conf is not None and conf > 0.6:
+        incident_api.collect(session_id, message, intent)
+
+
+async def _classify_later(message_id: int, session_id: int, text: str) -> None:
+    try:
+        label: dict = {}
+        intent, conf = await get_runtime().classifier.classify(text, meta=label)
+        await db.aset_message_intent(message_id, intent, conf, label.get("source"))
+        _collect_incident(session_id, text, intent, conf)
+    except Exception:
+        logger.exception("Deferred intent classification failed for message %s", message_id)
+
+
 async def stream_chat(payload: ChatIn):
-    session = db.get_or_create_session(payload.session_id)
-
-    conversation = None
-    if payload.conversation_id is not None:
-        conversation = db.get_conversation(payload.conversation_id)
-    if conversation is None:
-        conversation = db.create_conversation(session.id)
-
-    intent, conf = llm.classify_intent(payload.message)
-    rag_ans, sources = rag.query(payload.message, f"temp_{session.id}", 5)
-    if intent in {"incident_report", "maintenance_query"} and conf > 0.6:
-        incident_api.collect(session.id, payload.message, intent)
-    full_answer = rag_ans
+    timer = StageTimer()
+    mode = payload.classify or classify_mode
+    runtime = get_runtime()
+
+    # Classification and retrieval don't depend on each other, so they start
+    # at once; classification may keep running while the answer streams.
+    # Nothing touches the database until the exchange is stored.
+    classify_task = None
+    label: dict = {}
+    if mode == "concurrent":
+        classify_task = asyncio.create_task(
+            _timed(timer, "classify", runtime.classifier.classify(payload.message, meta=label))
+        )
+    temp_collection = f"temp_{payload.session_id}" if payload.session_id is not None else None
+    cache_info = {"answer_cache": "off", "prompt_tokens": 0}
+    usage: dict = {}
+    try:
+        history = await _timed(timer, "history", _load_history(payload.conversation_id))
+        deltas, sources = await _timed(
+            timer,
+            "retrieval",
+            runtime.rag.aquery_stream(
+                payload.message, temp_collection, 5, meta=cache_info, history=history, usage=usage
+            ),
+        )
+    except BaseException:
+        if classify_task:
+            classify_task.cancel()
+        raise
+
+    parts: list[str] = []
+    try:
+        with timer.stage("generation"):
+            async for delta in deltas:
+                if not parts:
+                    timer.mark("first_token")
+                parts.append(delta)
+                yield {"type": "content", "content": delta}
+    except BaseException:
+        if classify_task:
+            classify_task.cancel()
+        raise
     if sources:
-        full_answer += "\n" + render_sources(sources)
-
-    db.add_message(
-        conversation_id=conversation.id,
-        sender=payload.user,
-        content=payload.message,
-        llm_intent=intent,
-        confidence=conf,
+        links = "\n" + render_sources(sources)
+        parts.append(links)
+        yield {"type": "content", "content": links}
+
+    intent = conf = None
+    if classify_task:
+        try:
+            intent, conf = await classify_task
+        except LLMQueueFull as exc:
+            # The answer has been given; only its label is lost.
+            logger.warning("Intent classification skipped: %s", exc)
+        except Exception:
+            logger.exception("Intent classification failed; storing the turn without an intent")
+
+    # Persist the exchange only once the model has finished generating it,
+    # in one transaction together with any session/conversation it creates.
+    with timer.stage("db_write"):
+        session, _, user_msg = await db.save_turn(
+            payload.session_id,
+            payload.conversation_id,
+            sender=payload.user,
+            content=payload.message,
+            answer="".join(parts),
+            llm_intent=intent,
+            confidence=conf,
+            intent_source=label.get("source") if intent is not None else None,
+        )
+    if classify_task:
+        _collect_incident(session.id, payload.message, intent, conf)
+    if mode == "deferred":
+        task = asyncio.create_task(_classify_later(user_msg.id, session.id, payload.message))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    timer.mark("total")
+    if metrics.enabled:
+        for stage, ms in timer.stages.items():
+            metrics.observe("sapid_chat_stage_seconds", ms / 1000, stage=stage)
+        metrics.inc("sapid_chat_requests_total", answer_cache=cache_info["answer_cache"])
+        metrics.observe("sapid_retrieved_chunks", len(sources))
+    logger.info(
+        "chat timings (classify=%s, answer_cache=%s, prompt_tokens=%d): %s",
+        mode,
+        cache_info["answer_cache"],
+        cache_info["prompt_tokens"],
+        timer.as_dict(),
     )
 
-    yield {"type": "content", "content": full_answer}
     for src in sources:
         doc_id = src.get("doc_id") if isinstance(src, dict) else getattr(src, "doc_id", None)
         if doc_id:
             yield {"type": "document_reference", "document_id": doc_id}
+    yield {"type": "metadata", **cache_info}
+    if payload.timings if payload.timings is not None else timings_event:
+        yield {
+            "type": "timings",
+            "stages_ms": timer.as_dict(),
+            "chunks": len(sources),
+            "prompt_eval_count": usage.get("prompt_eval_count"),
+            "eval_count": usage.get("eval_count"),
+        }
     yield {"type": "done"}
 
 
 @router.post("/")
 async def chat_endpoint(payload: ChatIn) -> EventSourceResponse:
+    events = stream_chat(payload)
+    # The response starts with the first event, so a full LLM queue met while
+    # retrieving or waiting for the first token is answered with a 503 and
+    # Retry-After (see main.py) instead of a stream that breaks off.
+    first = await events.__anext__()
+
     async def event_generator():
-        async for chunk in stream_chat(payload):
+        yield json.dumps(first)
+        async for chunk in events:
             yield json.dumps(chunk)
 
     return EventSourceResponse(event_generator())
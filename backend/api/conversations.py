@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Query, Response
 from pydantic import BaseModel
 
 from core import db
@@ -17,8 +17,15 @@ def create_conversation(payload: ConversationIn) -> dict:
 
 
 @router.get("/")
-def list_conversations(session_id: int | None = None) -> list[dict]:
-    conversations = db.list_conversations(session_id)
+def list_conversations(
+    response: Response,
+    session_id: int | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    after_id: int | None = None,
+) -> list[dict]:
+    conversations = db.list_conversations(session_id, limit, after_id)
+    if limit is not None and len(conversations) == limit:
+        response.headers["X-Next-After-Id"] = str(conversations[-1].id)
     return [
         {"id": c.id, "session_id": c.session_id, "created_at": c.created_at}
         for c in conversations
@@ -32,8 +39,15 @@ def delete_conversation(conversation_id: int) -> Response:
 
 
 @router.get("/{conversation_id}/messages")
-def get_messages(conversation_id: int) -> list[dict]:
-    messages = db.get_messages(conversation_id)
+def get_messages(
+    conversation_id: int,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000),
+    after_id: int | None = None,
+) -> list[dict]:
+    messages = db.get_messages(conversation_id, limit, after_id)
+    if limit is not None and len(messages) == limit:
+        response.headers["X-Next-After-Id"] = str(messages[-1].id)
     return [
         {
             "id": m.id,
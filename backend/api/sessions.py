@@ -2,6 +2,7 @@ from datetime import datetime
 from fastapi import APIRouter, Response
 
 from core import db
+from core.runtime import get_runtime
 
 router = APIRouter()
 
@@ -14,5 +15,5 @@ def create_session() -> dict:
 
 @router.delete("/{session_id}", status_code=204)
 def delete_session(session_id: int) -> Response:
-    db.delete_session(session_id)
+    get_runtime().cleanup.delete_session(session_id)
     return Response(status_code=204)
@@ -1,77 +1,206 @@
+import asyncio
+import hashlib
+import io
 import os
-import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from uuid import uuid4
 
 
-from fastapi import APIRouter, UploadFile, HTTPException, Response
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
-from core.llm import LLM
-from core.rag import RAG
+from core.cache import TTLCache
 from core import db
+from core.jobs import IngestQueueFull
+from core.runtime import get_runtime
 
 
-ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-chat_model = os.getenv("OLLAMA_CHAT_MODEL", "llama3")
-embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
-chroma_url = os.getenv("CHROMA_URL", "http://localhost:8000")
+max_upload_bytes = int(os.getenv("UPLOAD_MAX_MB", "200")) * 1024 * 1024
+upload_chunk_size = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
 
-rag = RAG(LLM(ollama_url, chat_model, embed_model), chroma_url)
+# Single-page PDFs cut out for source links, keyed on (doc id, etag, page).
+page_cache = TTLCache(
+    int(os.getenv("PDF_PAGE_CACHE_SIZE", "64")), float(os.getenv("PDF_PAGE_CACHE_TTL", "600"))
+)
 
 router = APIRouter()
 
 
+def _enqueue(path: str, collection: str, is_temp: bool, doc_id: str | None = None) -> db.IngestJob:
+    try:
+        return get_runtime().ingest_queue.submit(path, collection, is_temp, doc_id=doc_id)
+    except IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later")
+
+
+def _check_capacity() -> None:
+    if get_runtime().ingest_queue.full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later")
+
+
+async def _receive(file: UploadFile) -> tuple[str, int, str]:
+    """Stream *file* into the storage directory and return ``(path, size, sha256)``.
+
+    The upload is copied ``upload_chunk_size`` bytes at a time and hashed as
+    it goes, so memory use doesn't grow with the file. Files larger than
+    ``max_upload_bytes`` are discarded with a 413.
+    """
+    incoming = os.path.join(get_runtime().storage_dir, "incoming")
+    os.makedirs(incoming, exist_ok=True)
+    path = os.path.join(incoming, f"{uuid4().hex}.pdf")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while block := await file.read(upload_chunk_size):
+                size += len(block)
+                if size > max_upload_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File exceeds the {max_upload_bytes // (1024 * 1024)} MB upload limit",
+                    )
+                digest.update(block)
+                await asyncio.to_thread(out.write, block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
 @router.post("/")
-async def upload(file: UploadFile, type: str, session_id: int | None = None) -> dict:
-    data = await file.read()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(data)
-        path = tmp.name
+async def upload(
+    file: UploadFile, type: str, session_id: int | None = None, replace: int | None = None
+) -> dict:
+    """Store and ingest a PDF as a document.
 
+    A file whose content is already stored in the same place is not stored
+    twice. Pass ``replace`` with a document id to upload a new version of
+    that document: it keeps its id and only its changed chunks are
+    re-embedded.
+    """
     if type == "global":
         collection = "global"
-        is_temp = False
     else:
         if session_id is None:
             raise HTTPException(status_code=400, detail="session_id required for temporary documents")
         collection = f"temp_{session_id}"
-        is_temp = True
+    _check_capacity()
 
-    doc = db.add_document(file.filename, type, len(data), session_id)
-    rag.embed_pdf(path, collection, is_temp, doc_id=str(doc.id))
+    existing = None
+    if replace is not None:
+        existing = db.get_document(replace)
+        if existing is None or (existing.type, existing.session_id) != (type, session_id):
+            raise HTTPException(status_code=404, detail="Document to replace not found")
 
-    os.makedirs("./storage", exist_ok=True)
-    storage_path = f"./storage/{doc.id}.pdf"
+    path, size, content_hash = await _receive(file)
+    if existing is None:
+        existing = db.find_document_by_hash(content_hash, type, session_id)
+    # Identical content needs no ingestion once it has been ingested, and
+    # joins the pending job while it is still queued or running.
+    if existing and existing.content_hash == content_hash:
+        last_job = db.latest_ingest_job(str(existing.id))
+        if last_job is not None and last_job.status != "failed":
+            os.remove(path)
+            done = last_job.status == "done"
+            return {
+                "id": existing.id,
+                "collection": collection,
+                "url": f"/upload/documents/{existing.id}/view",
+                "job_id": None if done else last_job.id,
+                "status": "unchanged" if done else "queued",
+            }
+
+    if existing:
+        doc = db.update_document(
+            existing.id,
+            name=file.filename,
+            size=size,
+            content_hash=content_hash,
+            uploaded_at=datetime.utcnow(),
+        )
+    else:
+        doc = db.add_document(file.filename, type, size, session_id, content_hash)
+
+    # Same directory tree, so this is a rename rather than a copy.
+    storage_path = get_runtime().storage_path(doc.id)
     os.replace(path, storage_path)
+    get_runtime().document_cache.discard(doc.id)
 
-    return {"id": doc.id, "collection": collection, "url": f"/upload/documents/{doc.id}/view"}
+    # The stored copy backs the viewer, so the job must not delete it.
+    job = _enqueue(storage_path, collection, is_temp=False, doc_id=str(doc.id))
+
+    return {
+        "id": doc.id,
+        "collection": collection,
+        "url": f"/upload/documents/{doc.id}/view",
+        "job_id": job.id,
+        "status": "queued",
+    }
 
 @router.post("/global")
-async def upload_global(file: UploadFile) -> dict:
-    """Upload a PDF to the global knowledge base."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        path = tmp.name
+async def upload_global(file: UploadFile, replace: int | None = None) -> dict:
+    """Upload a PDF to the global knowledge base.
 
-    rag.embed_pdf(path, "global", is_temp=False)
-    return {"status": "ok", "collection": "global"}
+    Same as ``POST /upload/?type=global``: the file is stored as a document
+    with a stable id, so a new version sent with ``replace`` replaces the old
+    one's chunks instead of being ingested next to them.
+    """
+    return await upload(file, "global", replace=replace)
 
 
 @router.post("/temp/{session_id}")
 async def upload_temp(session_id: int, file: UploadFile) -> dict:
     """Upload a PDF to a session-scoped temporary collection."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        path = tmp.name
+    _check_capacity()
+    path, _, _ = await _receive(file)
 
     collection = f"temp_{session_id}"
-    rag.embed_pdf(path, collection, is_temp=True)
-    return {"status": "ok", "collection": collection}
+    job = _enqueue(path, collection, is_temp=True)
+    return {"status": "queued", "collection": collection, "job_id": job.id}
+
+
+def _job_dict(job: db.IngestJob) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "collection": job.collection,
+        "doc_id": job.doc_id,
+        "pages_total": job.pages_total,
+        "pages_done": job.pages_done,
+        "chunks_embedded": job.chunks_embedded,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+@router.get("/jobs")
+def list_jobs(status: str | None = None) -> list[dict]:
+    return [_job_dict(job) for job in db.list_ingest_jobs(status)]
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int) -> dict:
+    job = db.get_ingest_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Not found")
+    return _job_dict(job)
 
 
 
 @router.get("/documents")
-def list_docs(session_id: int | None = None) -> list[dict]:
-    docs = db.list_documents(session_id)
+def list_docs(
+    response: Response,
+    session_id: int | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    after_id: int | None = None,
+) -> list[dict]:
+    docs = db.list_documents(session_id, limit, after_id)
+    if limit is not None and len(docs) == limit:
+        response.headers["X-Next-After-Id"] = str(docs[-1].id)
     return [
         {
             "id": d.id,
@@ -80,6 +209,7 @@ def list_docs(session_id: int | None = None) -> list[dict]:
             "size": d.size,
             "uploaded_at": d.uploaded_at,
             "session_id": d.session_id,
+            "content_hash": d.content_hash,
         }
         for d in docs
     ]
@@ -97,20 +227,157 @@ def get_doc(doc_id: int):
         "size": doc.size,
         "uploaded_at": doc.uploaded_at,
         "session_id": doc.session_id,
+        "content_hash": doc.content_hash,
     }
 
 
+@dataclass
+class _StoredPdf:
+    name: str
+    path: str
+    size: int
+    mtime: float
+    etag: str
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.mtime, usegmt=True)
+
+    def headers(self) -> dict:
+        return {"ETag": self.etag, "Last-Modified": self.last_modified, "Accept-Ranges": "bytes"}
+
+
+def _stored_pdf(doc_id: int) -> _StoredPdf:
+    document_cache = get_runtime().document_cache
+    stored = document_cache.get(doc_id)
+    if stored is None:
+        doc = db.get_document(doc_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Not found")
+        path = get_runtime().storage_path(doc_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Not found")
+        tag = doc.content_hash or f"{st.st_size:x}-{st.st_mtime_ns:x}"
+        stored = _StoredPdf(doc.name, path, st.st_size, st.st_mtime, f'"{tag}"')
+        document_cache.set(doc_id, stored)
+    return stored
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single-range ``Range`` header into inclusive ``(start, end)``.
+
+    Returns ``None`` for headers we don't serve partially (other units or
+    several ranges), in which case the whole file is sent.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+def _read_range(path: str, start: int, end: int, block_size: int = 64 * 1024):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            block = fh.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _disposition(name: str) -> str:
+    quoted = quote(name)
+    if quoted != name:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{name}"'
+
+
 @router.get("/documents/{doc_id}/view", response_class=FileResponse)
-def view_pdf(doc_id: int):
-    doc = db.get_document(doc_id)
-    if not doc:
-        raise HTTPException(status_code=404, detail="Not found")
-    path = f"./storage/{doc_id}.pdf"
-    return FileResponse(path, media_type="application/pdf", filename=doc.name)
+def view_pdf(doc_id: int, request: Request):
+    """Serve a stored PDF with conditional GET and single byte-range support."""
+    stored = _stored_pdf(doc_id)
+    headers = stored.headers()
+    if _not_modified(request, stored.etag, stored.mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if range_header and (if_range is None or if_range.strip() in (stored.etag, stored.last_modified)):
+        byte_range = _byte_range(range_header, stored.size)
+    if byte_range is None:
+        return FileResponse(stored.path, media_type="application/pdf", filename=stored.name, headers=headers)
+
+    start, end = byte_range
+    headers.update(
+        {
+            "Content-Range": f"bytes {start}-{end}/{stored.size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": _disposition(stored.name),
+        }
+    )
+    return StreamingResponse(
+        _read_range(stored.path, start, end), status_code=206, media_type="application/pdf", headers=headers
+    )
+
+
+@router.get("/documents/{doc_id}/pages/{page}")
+def view_pdf_page(doc_id: int, page: int, request: Request) -> Response:
+    """Serve only *page* (zero-based, as in source links) of a stored PDF."""
+    stored = _stored_pdf(doc_id)
+    etag = f'{stored.etag[:-1]}-p{page}"'
+    headers = {"ETag": etag, "Last-Modified": stored.last_modified}
+    if _not_modified(request, etag, stored.mtime):
+        return Response(status_code=304, headers=headers)
+
+    key = (doc_id, stored.etag, page)
+    body = page_cache.get(key)
+    if body is None:
+        from pypdf import PdfReader, PdfWriter
+
+        reader = PdfReader(stored.path)
+        if not 0 <= page < len(reader.pages):
+            raise HTTPException(status_code=404, detail="Page not found")
+        writer = PdfWriter()
+        writer.add_page(reader.pages[page])
+        out = io.BytesIO()
+        writer.write(out)
+        body = out.getvalue()
+        page_cache.set(key, body)
+    return Response(body, media_type="application/pdf", headers=headers)
 
 
 @router.delete("/documents/{doc_id}", status_code=204)
 def delete_doc(doc_id: int) -> Response:
-    db.delete_document(doc_id)
+    get_runtime().cleanup.delete_document(doc_id)
     return Response(status_code=204)
 
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SemanticCache:
+    """Cache values by embedding, matching lookups on cosine similarity.
+
+    Entries are grouped by a ``scope`` (e.g. the versions of the collections
+    an answer was built from); a lookup only considers entries of the same
+    scope and returns the closest one at or above ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 512, ttl: float = 3600.0) -> None:
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[int, tuple[Hashable, Any, Any, float]]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding) -> "np.ndarray":
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, embedding, scope: Hashable) -> Optional[Any]:
+        query = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            keys, vectors = [], []
+            for key, (entry_scope, vector, _, expires) in list(self._data.items()):
+                if expires <= now:
+                    del self._data[key]
+                elif entry_scope == scope:
+                    keys.append(key)
+                    vectors.append(vector)
+            if vectors:
+                sims = np.stack(vectors) @ query
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    key = keys[best]
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return self._data[key][2]
+            self.misses += 1
+            return None
+
+    def set(self, embedding, scope: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        vector = self._unit(embedding)
+        with self._lock:
+            self._data[self._next_key] = (scope, vector, value, time.monotonic() + self.ttl)
+            self._next_key += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from core import db
+from core.cache import TTLCache
+from core.rag import RAG
+
+logger = logging.getLogger(__name__)
+
+_TEMP_COLLECTION = re.compile(r"^temp_(\d+)$")
+
+
+def document_collection(doc: db.Document) -> str:
+    """Name of the Chroma collection holding *doc*'s chunks."""
+    return "global" if doc.type == "global" else f"temp_{doc.session_id}"
+
+
+class Cleanup:
+    """Delete rows together with the vectors and files that belong to them.
+
+    The database is changed first, in one transaction; the vector store and
+    the storage directory are purged afterwards. Failures there are logged
+    rather than raised, so leftovers of a failed purge are picked up by
+    :class:`TempCollectionReaper` or the next delete. Deleted documents are
+    also evicted from ``document_cache``.
+    """
+
+    def __init__(
+        self, rag: RAG, storage_path: Callable[[int], str], document_cache: Optional[TTLCache] = None
+    ) -> None:
+        self.rag = rag
+        self.storage_path = storage_path
+        self.document_cache = document_cache
+
+    def _remove_file(self, doc_id: int) -> None:
+        if self.document_cache is not None:
+            self.document_cache.discard(doc_id)
+        try:
+            os.remove(self.storage_path(doc_id))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.warning("Could not remove stored file of document %s", doc_id, exc_info=True)
+
+    def _purge_vectors(self, docs: Iterable[db.Document]) -> None:
+        for doc in docs:
+            try:
+                self.rag.delete_document_vectors(document_collection(doc), str(doc.id))
+            except Exception:
+                logger.warning("Could not delete vectors of document %s", doc.id, exc_info=True)
+
+    def delete_document(self, doc_id: int) -> Optional[db.Document]:
+        doc = db.delete_document(doc_id)
+        if doc is not None:
+            self._purge_vectors([doc])
+            self._remove_file(doc.id)
+        return doc
+
+    def delete_session(self, session_id: int) -> List[db.Document]:
+        """Delete a session and drop its temporary collection and files."""
+        docs = db.delete_session(session_id)
+        try:
+            self.rag.drop_collection(f"temp_{session_id}")
+        except Exception:
+            logger.warning("Could not drop collection temp_%s", session_id, exc_info=True)
+        for doc in docs:
+            self._remove_file(doc.id)
+        return docs
+
+
+class TempCollectionReaper:
+    """Periodically drop ``temp_{session_id}`` collections whose session is gone.
+
+    A collection is only dropped once it has been seen orphaned for longer
+    than ``ttl`` seconds, which leaves room for a session being created and
+    its first upload racing the sweep.
+    """
+
+    def __init__(self, rag: RAG, interval: float = 3600.0, ttl: float = 86400.0) -> None:
+        self.rag = rag
+        self.interval = interval
+        self.ttl = ttl
+        self._orphaned_since: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """Drop expired orphaned collections and return their names."""
+        now = time.monotonic() if now is None else now
+        temp = {}
+        for name in self.rag.collection_names():
+            match = _TEMP_COLLECTION.match(name)
+            if match:
+                temp[name] = int(match.group(1))
+        alive = db.existing_session_ids(list(temp.values())) if temp else set()
+
+        orphaned = {name for name, session_id in temp.items() if session_id not in alive}
+        self._orphaned_since = {
+            name: self._orphaned_since.get(name, now) for name in orphaned
+        }
+        dropped = []
+        for name, since in list(self._orphaned_since.items()):
+            if now - since >= self.ttl:
+                self.rag.drop_collection(name)
+                del self._orphaned_since[name]
+                dropped.append(name)
+        if dropped:
+            logger.info("Dropped %d orphaned temp collections: %s", len(dropped), dropped)
+        return dropped
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="temp-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Temp collection sweep failed")
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+SYSTEM_PROMPT = "Answer the question using the provided context."
+
+# Role/formatting tokens chat templates add around every message.
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English BPE vocabularies)."""
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class PromptContext:
+    """The messages sent to the chat model and what went into them."""
+
+    messages: List[dict]
+    tokens: int
+    sources: List[dict]
+    chunks_dropped: int = 0
+    history_dropped: int = 0
+
+
+class ContextBuilder:
+    """Fit conversation history and retrieved chunks into a token budget.
+
+    Everything is kept while the estimate stays within ``budget``. Otherwise
+    chunks are dropped lowest score first down to ``min_chunks``, then the
+    oldest history messages, then the remaining chunks.
+    """
+
+    def __init__(self, budget: int = 3072, min_chunks: int = 2) -> None:
+        self.budget = budget
+        self.min_chunks = min_chunks
+
+    @staticmethod
+    def _message_tokens(message: dict) -> int:
+        return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+    def build(
+        self,
+        question: str,
+        docs: Sequence[str],
+        sources: Sequence[dict],
+        scores: Optional[Sequence[float]] = None,
+        history: Sequence[dict] = (),
+    ) -> PromptContext:
+        """Return the prompt for *question*; *scores* are higher-is-better."""
+        if scores is None:
+            scores = [-rank for rank in range(len(docs))]
+        # Best chunks first; drops come off the end.
+        ranked = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        history = list(history)
+
+        fixed = (
+            estimate_tokens(SYSTEM_PROMPT)
+            + estimate_tokens(f"Context:\n\n\nQuestion: {question}")
+            + 2 * MESSAGE_OVERHEAD
+        )
+        chunk_tokens = [estimate_tokens(doc) + 1 for doc in docs]
+        total = (
+            fixed
+            + sum(chunk_tokens)
+            + sum(self._message_tokens(message) for message in history)
+        )
+
+        chunks_dropped = history_dropped = 0
+        while total > self.budget and len(ranked) > self.min_chunks:
+            total -= chunk_tokens[ranked.pop()]
+            chunks_dropped += 1
+        while total > self.budget and history:
+            total -= self._message_tokens(history.pop(0))
+            history_dropped += 1
+        while total > self.budget and ranked:
+            total -= chunk_tokens[ranked.pop()]
+            chunks_dropped += 1
+
+        # Chunks go into the prompt in their retrieval order.
+        kept = sorted(ranked)
+        context = "\n".join(docs[i] for i in kept)
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *history,
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"},
+        ]
+        return PromptContext(
+            messages=messages,
+            tokens=sum(self._message_tokens(message) for message in messages),
+            sources=[sources[i] for i in kept],
+            chunks_dropped=chunks_dropped,
+            history_dropped=history_dropped,
+        )
@@ -2,17 +2,49 @@
 from __future__ import annotations
 
 import os
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-from typing import Iterator, Optional
+from typing import AsyncIterator, Iterator, Optional
 
 
+from sqlalchemy import Index
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Field, SQLModel, Session, create_engine, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core.timing import metrics
 
 
 DATABASE_URL = os.getenv("POSTGRES_URL", "sqlite:///./local.db")
 
-engine = create_engine(DATABASE_URL, echo=False)
+
+def _async_url(url: str) -> str:
+    """Map a sync database URL onto the matching asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    driver = {
+        "sqlite": "sqlite+aiosqlite",
+        "postgres": "postgresql+asyncpg",
+        "postgresql": "postgresql+asyncpg",
+        "postgresql+psycopg2": "postgresql+asyncpg",
+    }.get(scheme, scheme)
+    return f"{driver}{sep}{rest}"
+
+
+def _pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1"}
+    # SQLite files get SQLAlchemy's default pool; sizing only applies to servers.
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        )
+    return options
+
+
+engine = create_engine(DATABASE_URL, echo=False, **_pool_options(DATABASE_URL))
+async_engine = create_async_engine(_async_url(DATABASE_URL), echo=False, **_pool_options(DATABASE_URL))
 
 
 class ChatSession(SQLModel, table=True):
@@ -25,6 +57,7 @@ class ChatSession(SQLModel, table=True):
 
 class Conversation(SQLModel, table=True):
     __tablename__ = "conversation"
+    __table_args__ = (Index("ix_conversation_session_id_id", "session_id", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: int = Field(foreign_key="chat_session.id")
@@ -33,6 +66,7 @@ class Conversation(SQLModel, table=True):
 
 class ChatMessage(SQLModel, table=True):
     __tablename__ = "chat_message"
+    __table_args__ = (Index("ix_chat_message_conversation_id_id", "conversation_id", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     conversation_id: int = Field(foreign_key="conversation.id")
@@ -41,12 +75,14 @@ class ChatMessage(SQLModel, table=True):
     content: str
     llm_intent: Optional[str] = None
     confidence: Optional[float] = None
+    intent_source: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
 
 class Document(SQLModel, table=True):
     __tablename__ = "document"
+    __table_args__ = (Index("ix_document_session_id_id", "session_id", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -54,6 +90,7 @@ class Document(SQLModel, table=True):
     size: int
     uploaded_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     session_id: Optional[int] = Field(default=None, foreign_key="chat_session.id")
+    content_hash: Optional[str] = None
 
 
 
@@ -67,12 +104,51 @@ class FormSubmission(SQLModel, table=True):
     submitted_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
+class IngestJob(SQLModel, table=True):
+    __tablename__ = "ingest_job"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    status: str = "queued"
+    path: str
+    collection: str
+    is_temp: bool = False
+    doc_id: Optional[str] = None
+    pages_total: Optional[int] = None
+    pages_done: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
 @contextmanager
 def get_session() -> Iterator[Session]:
     with Session(engine) as session:
         yield session
 
 
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """Yield an async session whose work is committed as one transaction."""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        async with session.begin():
+            yield session
+
+
+def _pool_stats(pool) -> dict:
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        probe = getattr(pool, name, None)
+        if callable(probe):
+            stats[name] = probe()
+    return stats
+
+
+def pool_stats() -> dict:
+    """Connection pool counters of the sync and async engines."""
+    return {"sync": _pool_stats(engine.pool), "async": _pool_stats(async_engine.pool)}
+
+
 def get_or_create_session(session_id: Optional[int]) -> ChatSession:
     """Return an existing ChatSession or create a new one."""
     with get_session() as session:
@@ -98,17 +174,39 @@ def create_session() -> ChatSession:
         return new_session
 
 
-def delete_session(session_id: int) -> None:
-    """Delete a chat session and its messages."""
+def delete_session(session_id: int) -> list[Document]:
+    """Delete a chat session with its conversations, messages and forms.
+
+    The session's temporary documents are deleted and returned so their
+    vectors and files can be purged; global documents uploaded from the
+    session are kept and detached from it.
+    """
     with get_session() as session:
 
-        conv_ids = [c.id for c in session.exec(select(Conversation.id).where(Conversation.session_id == session_id))]
+        conv_ids = list(session.exec(select(Conversation.id).where(Conversation.session_id == session_id)))
         if conv_ids:
             session.exec(delete(ChatMessage).where(ChatMessage.conversation_id.in_(conv_ids)))
             session.exec(delete(Conversation).where(Conversation.id.in_(conv_ids)))
 
+        docs = session.exec(select(Document).where(Document.session_id == session_id)).all()
+        removed = [doc for doc in docs if doc.type != "global"]
+        for doc in docs:
+            if doc.type == "global":
+                doc.session_id = None
+                session.add(doc)
+            else:
+                session.delete(doc)
+        session.exec(delete(FormSubmission).where(FormSubmission.session_id == session_id))
+
         session.exec(delete(ChatSession).where(ChatSession.id == session_id))
         session.commit()
+        return removed
+
+
+def existing_session_ids(session_ids: list[int]) -> set[int]:
+    with get_session() as session:
+        stmt = select(ChatSession.id).where(ChatSession.id.in_(session_ids))
+        return set(session.exec(stmt))
 
 
 
@@ -122,12 +220,24 @@ def create_conversation(session_id: int) -> Conversation:
         return conv
 
 
-def list_conversations(session_id: Optional[int] = None) -> list[Conversation]:
+def _page(stmt, model, limit: Optional[int], after_id: Optional[int]):
+    """Order *stmt* by id and apply keyset pagination after *after_id*."""
+    if after_id is not None:
+        stmt = stmt.where(model.id > after_id)
+    stmt = stmt.order_by(model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def list_conversations(
+    session_id: Optional[int] = None, limit: Optional[int] = None, after_id: Optional[int] = None
+) -> list[Conversation]:
     with get_session() as session:
         stmt = select(Conversation)
         if session_id is not None:
             stmt = stmt.where(Conversation.session_id == session_id)
-        return session.exec(stmt).all()
+        return session.exec(_page(stmt, Conversation, limit, after_id)).all()
 
 
 def delete_conversation(conversation_id: int) -> None:
@@ -142,53 +252,142 @@ def get_conversation(conversation_id: int) -> Conversation | None:
         return session.get(Conversation, conversation_id)
 
 
-def get_messages(conversation_id: int) -> list[ChatMessage]:
+def get_messages(
+    conversation_id: int, limit: Optional[int] = None, after_id: Optional[int] = None
+) -> list[ChatMessage]:
     with get_session() as session:
         stmt = select(ChatMessage).where(ChatMessage.conversation_id == conversation_id)
-        return session.exec(stmt).all()
+        return session.exec(_page(stmt, ChatMessage, limit, after_id)).all()
 
 
-def add_message(
-    conversation_id: int,
+async def recent_messages(conversation_id: int, limit: int) -> list[ChatMessage]:
+    """Return the last *limit* messages of a conversation, oldest first."""
+    async with AsyncSession(async_engine) as session:
+        stmt = (
+            select(ChatMessage)
+            .where(ChatMessage.conversation_id == conversation_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(limit)
+        )
+        return list(reversed((await session.exec(stmt)).all()))
+
 
+async def save_turn(
+    session_id: Optional[int],
+    conversation_id: Optional[int],
     sender: str,
     content: str,
+    answer: str,
     llm_intent: Optional[str] = None,
     confidence: Optional[float] = None,
-
-) -> ChatMessage:
-    """Persist a chat message."""
+    intent_source: Optional[str] = None,
+) -> tuple[ChatSession, Conversation, ChatMessage]:
+    """Persist one chat exchange in a single transaction.
+
+    The chat session and conversation are created if they don't exist yet.
+    Returns them together with the stored user message.
+    """
+    with metrics.time("sapid_db_write_seconds", op="save_turn"):
+        async with unit_of_work() as session:
+            chat_session = await session.get(ChatSession, session_id) if session_id is not None else None
+            if chat_session is None:
+                chat_session = ChatSession()
+                session.add(chat_session)
+                await session.flush()
+            conversation = (
+                await session.get(Conversation, conversation_id) if conversation_id is not None else None
+            )
+            if conversation is None:
+                conversation = Conversation(session_id=chat_session.id)
+                session.add(conversation)
+                await session.flush()
+            user_msg = ChatMessage(
+                conversation_id=conversation.id,
+                sender=sender,
+                content=content,
+                llm_intent=llm_intent,
+                confidence=confidence,
+                intent_source=intent_source,
+            )
+            session.add(user_msg)
+            session.add(ChatMessage(conversation_id=conversation.id, sender="assistant", content=answer))
+            await session.flush()
+    return chat_session, conversation, user_msg
+
+
+async def aset_message_intent(
+    message_id: int, llm_intent: Optional[str], confidence: Optional[float], source: Optional[str] = None
+) -> None:
+    """Attach a (possibly late) intent classification to a stored message."""
+    with metrics.time("sapid_db_write_seconds", op="set_message_intent"):
+        async with unit_of_work() as session:
+            msg = await session.get(ChatMessage, message_id)
+            if msg is not None:
+                msg.llm_intent = llm_intent
+                msg.confidence = confidence
+                msg.intent_source = source
+
+
+def labelled_messages(min_confidence: float = 0.8, limit: int = 1000) -> list[tuple[str, str]]:
+    """Return ``(content, intent)`` pairs of messages the chat model classified confidently."""
     with get_session() as session:
-        msg = ChatMessage(
-            conversation_id=conversation_id,
-
-            sender=sender,
-            content=content,
-            llm_intent=llm_intent,
-            confidence=confidence,
+        stmt = (
+            select(ChatMessage.content, ChatMessage.llm_intent)
+            .where(ChatMessage.llm_intent.is_not(None))
+            .where(ChatMessage.intent_source == "llm")
+            .where(ChatMessage.confidence >= min_confidence)
+            .order_by(ChatMessage.id.desc())
+            .limit(limit)
         )
-        session.add(msg)
+        return [(content, intent) for content, intent in session.exec(stmt)]
+
+
+
+def add_document(
+    name: str, type: str, size: int, session_id: Optional[int], content_hash: Optional[str] = None
+) -> Document:
+    with get_session() as session:
+        doc = Document(name=name, type=type, size=size, session_id=session_id, content_hash=content_hash)
+        session.add(doc)
         session.commit()
-        session.refresh(msg)
-        return msg
+        session.refresh(doc)
+        return doc
 
 
+def find_document_by_hash(content_hash: str, type: str, session_id: Optional[int]) -> Document | None:
+    """Return the most recent document with *content_hash* uploaded to the same place."""
+    with get_session() as session:
+        stmt = (
+            select(Document)
+            .where(Document.content_hash == content_hash)
+            .where(Document.type == type)
+            .where(Document.session_id == session_id)
+            .order_by(Document.id.desc())
+        )
+        return session.exec(stmt).first()
 
-def add_document(name: str, type: str, size: int, session_id: Optional[int]) -> Document:
+
+def update_document(doc_id: int, **fields) -> Document | None:
     with get_session() as session:
-        doc = Document(name=name, type=type, size=size, session_id=session_id)
+        doc = session.get(Document, doc_id)
+        if doc is None:
+            return None
+        for key, value in fields.items():
+            setattr(doc, key, value)
         session.add(doc)
         session.commit()
         session.refresh(doc)
         return doc
 
 
-def list_documents(session_id: Optional[int] = None) -> list[Document]:
+def list_documents(
+    session_id: Optional[int] = None, limit: Optional[int] = None, after_id: Optional[int] = None
+) -> list[Document]:
     with get_session() as session:
         stmt = select(Document)
         if session_id is not None:
             stmt = stmt.where(Document.session_id == session_id)
-        return session.exec(stmt).all()
+        return session.exec(_page(stmt, Document, limit, after_id)).all()
 
 
 def get_document(doc_id: int) -> Document | None:
@@ -196,10 +395,14 @@ def get_document(doc_id: int) -> Document | None:
         return session.get(Document, doc_id)
 
 
-def delete_document(doc_id: int) -> None:
+def delete_document(doc_id: int) -> Document | None:
+    """Delete a document row and return it, or ``None`` if it didn't exist."""
     with get_session() as session:
-        session.exec(delete(Document).where(Document.id == doc_id))
-        session.commit()
+        doc = session.get(Document, doc_id)
+        if doc is not None:
+            session.delete(doc)
+            session.commit()
+        return doc
 
 
 
@@ -212,3 +415,45 @@ def add_form_submission(form_id: str, session_id: int, data: str) -> FormSubmiss
         session.refresh(sub)
         return sub
 
+
+def create_ingest_job(path: str, collection: str, is_temp: bool, doc_id: Optional[str]) -> IngestJob:
+    """Record a queued ingestion job."""
+    with get_session() as session:
+        job = IngestJob(path=path, collection=collection, is_temp=is_temp, doc_id=doc_id)
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+
+def get_ingest_job(job_id: int) -> IngestJob | None:
+    with get_session() as session:
+        return session.get(IngestJob, job_id)
+
+
+def list_ingest_jobs(status: Optional[str] = None) -> list[IngestJob]:
+    with get_session() as session:
+        stmt = select(IngestJob)
+        if status is not None:
+            stmt = stmt.where(IngestJob.status == status)
+        return session.exec(stmt).all()
+
+
+def latest_ingest_job(doc_id: str) -> IngestJob | None:
+    """Return the most recently created ingestion job for *doc_id*."""
+    with get_session() as session:
+        stmt = select(IngestJob).where(IngestJob.doc_id == doc_id).order_by(IngestJob.id.desc())
+        return session.exec(stmt).first()
+
+
+def update_ingest_job(job_id: int, **fields) -> None:
+    """Apply *fields* to an ingestion job and bump its ``updated_at``."""
+    with get_session() as session:
+        job = session.get(IngestJob, job_id)
+        if job is None:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from core.splitter import RecursiveTextSplitter
+
+Chunk = Tuple[int, int, str]
+
+
+def _limit_memory(limit_mb: Optional[int]) -> None:
+    if not limit_mb:
+        return
+    import resource
+
+    limit = limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _extract_shard(
+    path: str, start: int, stop: int, chunk_size: int, chunk_overlap: int
+) -> List[Chunk]:
+    """Extract and split pages ``start``..``stop`` of *path*."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    splitter = RecursiveTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks: List[Chunk] = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        for chunk_id, chunk in enumerate(splitter.split_text(text)):
+            chunks.append((page_number, chunk_id, chunk))
+    return chunks
+
+
+class PdfExtractor:
+    """Extract and split PDF text, optionally sharding pages over processes.
+
+    Pages are split into shards of ``pages_per_task`` pages. With ``workers``
+    above zero the shards run on a process pool and at most ``max_inflight``
+    of them are parsed ahead of the consumer, which bounds the memory held by
+    extracted text; chunks are still yielded in page order so embedding can
+    start on the first shard while later ones are parsed. ``memory_limit_mb``
+    caps each worker's address space and ``max_tasks_per_child`` recycles
+    workers to release memory pypdf holds on to. With ``workers=0`` shards
+    are extracted one at a time in the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers: int = 0,
+        pages_per_task: int = 8,
+        max_inflight: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+        memory_limit_mb: Optional[int] = None,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+    ) -> None:
+        self.workers = max(0, workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self.max_inflight = max(1, max_inflight or 2 * self.workers or 1)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.memory_limit_mb = memory_limit_mb
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # "spawn" because forking a process that runs request and
+                # ingest threads can deadlock the child on inherited locks.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_limit_memory,
+                    initargs=(self.memory_limit_mb,),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+            return self._executor
+
+    def page_count(self, path: str) -> int:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages)
+
+    def iter_chunks(self, path: str, pages_total: Optional[int] = None) -> Iterator[Chunk]:
+        """Yield ``(page, chunk_id, text)`` for every chunk of *path* in order."""
+        if pages_total is None:
+            pages_total = self.page_count(path)
+        shards = [
+            (start, min(start + self.pages_per_task, pages_total))
+            for start in range(0, pages_total, self.pages_per_task)
+        ]
+        args = (self.chunk_size, self.chunk_overlap)
+        if not self.workers:
+            for start, stop in shards:
+                yield from _extract_shard(path, start, stop, *args)
+            return
+
+        pool = self._pool()
+        pending: Deque[Future] = deque()
+        remaining = iter(shards)
+        try:
+            for start, stop in remaining:
+                pending.append(pool.submit(_extract_shard, path, start, stop, *args))
+                if len(pending) >= self.max_inflight:
+                    break
+            while pending:
+                chunks = pending.popleft().result()
+                for start, stop in remaining:
+                    pending.append(pool.submit(_extract_shard, path, start, stop, *args))
+                    break
+                yield from chunks
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from core.llm import AsyncLLM
+from core.scheduler import INTENT
+
+logger = logging.getLogger(__name__)
+
+
+# Labelled utterances the local classifier starts from before any history
+# has been collected. Intents match the ones ``api.chat`` reacts to.
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("The pump on line 3 has stopped working", "incident_report"),
+    ("There is an oil leak under the compressor", "incident_report"),
+    ("Alarm E42 keeps going off on the conveyor", "incident_report"),
+    ("I want to report a broken valve", "incident_report"),
+    ("Smoke is coming out of the generator", "incident_report"),
+    ("How often should the filters be replaced?", "maintenance_query"),
+    ("What torque should I use on the flange bolts?", "maintenance_query"),
+    ("When is the next scheduled service for the boiler?", "maintenance_query"),
+    ("Which lubricant does the gearbox need?", "maintenance_query"),
+    ("What is the procedure to recalibrate the sensor?", "maintenance_query"),
+    ("Hello", "general"),
+    ("Thanks for the help", "general"),
+    ("What can you do?", "general"),
+    ("Summarise the uploaded document", "general"),
+    ("Who wrote this report?", "general"),
+]
+
+
+class IntentClassifier(Protocol):
+    async def classify(self, text: str, meta: Optional[dict] = None) -> Tuple[str, float]:
+        """Return ``(intent, confidence)`` for *text*.
+
+        ``meta["source"]`` is set to the classifier that produced the label
+        (``"llm"`` or ``"centroid"``), so stored labels can be told apart.
+        """
+        ...
+
+
+class LLMIntentClassifier:
+    """Ask the chat model for the intent; accurate but costs a full generation."""
+
+    def __init__(self, llm: AsyncLLM) -> None:
+        self.llm = llm
+
+    async def classify(self, text: str, meta: Optional[dict] = None) -> Tuple[str, float]:
+        result = await self.llm.classify_intent(text)
+        if meta is not None:
+            meta["source"] = "llm"
+        return result
+
+
+class CentroidIntentClassifier:
+    """Nearest-centroid classifier over embeddings of labelled utterances.
+
+    Each intent is represented by the normalised mean embedding of its
+    examples; a message is assigned to the most similar centroid and the
+    softmax over the cosine similarities is reported as confidence.
+    ``history`` may return extra ``(text, intent)`` pairs, e.g. chat
+    messages the chat model labelled, to train on alongside ``examples``.
+    Its own past predictions don't belong there: they would reinforce its
+    mistakes. Once the centroids are ``refit_interval`` seconds old they are
+    rebuilt in the background, so new labels are picked up without a restart.
+
+    Messages are embedded with ``embed`` when given, e.g.
+    :meth:`core.rag.RAG.aembed_query`, so a chat message that is also used
+    for retrieval is only embedded once.
+    """
+
+    def __init__(
+        self,
+        llm: AsyncLLM,
+        examples: Optional[Iterable[Tuple[str, str]]] = None,
+        temperature: float = 0.05,
+        history: Optional[Callable[[], Iterable[Tuple[str, str]]]] = None,
+        embed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None,
+        refit_interval: float = 3600.0,
+    ) -> None:
+        self.llm = llm
+        self.examples = list(examples if examples is not None else SEED_EXAMPLES)
+        self.history = history
+        self.embed = embed or (lambda text: llm.embed(text, lane=INTENT))
+        self.refit_interval = refit_interval
+        self.temperature = temperature
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.fitted_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refit: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _normalise(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def fit_embeddings(self, embeddings: Sequence[Sequence[float]], labels: Sequence[str]) -> None:
+        """Build the centroids from precomputed *embeddings*."""
+        vectors = self._normalise(np.asarray(embeddings, dtype=np.float32))
+        label_array = np.asarray(labels)
+        self.labels = sorted(set(labels))
+        self.centroids = self._normalise(
+            np.stack([vectors[label_array == label].mean(axis=0) for label in self.labels])
+        )
+        self.fitted_at = time.monotonic()
+
+    async def fit(self) -> None:
+        examples = list(self.examples)
+        if self.history is not None:
+            examples.extend(await asyncio.to_thread(lambda: list(self.history())))
+        texts = [text for text, _ in examples]
+        labels = [label for _, label in examples]
+        self.fit_embeddings(await self.llm.embed_batch(texts, lane=INTENT), labels)
+
+    def predict(self, embedding: Sequence[float]) -> Tuple[str, float]:
+        vector = self._normalise(np.asarray(embedding, dtype=np.float32))
+        sims = self.centroids @ vector
+        scaled = np.exp((sims - sims.max()) / self.temperature)
+        probs = scaled / scaled.sum()
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+    async def _refit_in_background(self) -> None:
+        try:
+            await self.fit()
+        except Exception:
+            logger.exception("Refitting the intent centroids failed")
+            # Keep the old centroids for another interval.
+            self.fitted_at = time.monotonic()
+        finally:
+            self._refit = None
+
+    async def classify(self, text: str, meta: Optional[dict] = None) -> Tuple[str, float]:
+        if self.centroids is None:
+            async with self._lock:
+                if self.centroids is None:
+                    await self.fit()
+        elif (
+            self.refit_interval > 0
+            and self._refit is None
+            and time.monotonic() - self.fitted_at >= self.refit_interval
+        ):
+            self._refit = asyncio.create_task(self._refit_in_background())
+        result = self.predict(await self.embed(text))
+        if meta is not None:
+            meta["source"] = "centroid"
+        return result
+
+
+class FallbackIntentClassifier:
+    """Use *primary* and only consult *fallback* when it is unsure or fails."""
+
+    def __init__(
+        self, primary: IntentClassifier, fallback: IntentClassifier, threshold: float = 0.6
+    ) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.threshold = threshold
+
+    async def classify(self, text: str, meta: Optional[dict] = None) -> Tuple[str, float]:
+        try:
+            intent, conf = await self.primary.classify(text, meta)
+            if conf >= self.threshold:
+                return intent, conf
+        except Exception:
+            logger.exception("Primary intent classifier failed, falling back")
+        return await self.fallback.classify(text, meta)
+
+
+def build_intent_classifier(
+    llm: AsyncLLM,
+    backend: str = "centroid",
+    threshold: float = 0.6,
+    examples: Optional[Iterable[Tuple[str, str]]] = None,
+    history: Optional[Callable[[], Iterable[Tuple[str, str]]]] = None,
+    embed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None,
+    refit_interval: float = 3600.0,
+) -> IntentClassifier:
+    """Return the classifier for *backend* (``centroid`` or ``llm``)."""
+    if backend == "llm":
+        return LLMIntentClassifier(llm)
+    if backend == "centroid":
+        local = CentroidIntentClassifier(
+            llm, examples, history=history, embed=embed, refit_interval=refit_interval
+        )
+        return FallbackIntentClassifier(local, LLMIntentClassifier(llm), threshold)
+    raise ValueError(f"Unknown intent classifier backend: {backend}")
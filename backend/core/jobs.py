@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core import db
+from core.rag import RAG, IngestStats
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion backlog is at capacity."""
+
+
+class IngestQueue:
+    """Run ``RAG.embed_pdf`` jobs on a bounded pool of worker threads.
+
+    Job state is kept in the ``ingest_job`` table so progress can be polled
+    from any worker and unfinished jobs can be picked up again on restart.
+    """
+
+    def __init__(self, rag: RAG, workers: int = 2, max_pending: int = 32) -> None:
+        self.rag = rag
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def full(self) -> bool:
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def submit(
+        self, path: str, collection: str, is_temp: bool, doc_id: str | None = None
+    ) -> db.IngestJob:
+        """Queue *path* for embedding and return the persisted job."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise IngestQueueFull()
+            self._pending += 1
+        try:
+            job = db.create_ingest_job(path, collection, is_temp, doc_id)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._executor.submit(self._run, job.id)
+        return job
+
+    def resume(self) -> None:
+        """Re-queue jobs left queued or running by a previous process."""
+        for status in ("queued", "running"):
+            for job in db.list_ingest_jobs(status):
+                if not os.path.exists(job.path):
+                    db.update_ingest_job(job.id, status="failed", error="source file missing after restart")
+                    continue
+                with self._lock:
+                    self._pending += 1
+                db.update_ingest_job(job.id, status="queued", pages_done=0, chunks_embedded=0)
+                self._executor.submit(self._run, job.id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.rag.extractor.shutdown()
+
+    def _run(self, job_id: int) -> None:
+        job = None
+        try:
+            job = db.get_ingest_job(job_id)
+            if job is None:
+                return
+            db.update_ingest_job(job_id, status="running")
+
+            def progress(stats: IngestStats) -> None:
+                db.update_ingest_job(
+                    job_id,
+                    pages_total=stats.pages_total,
+                    pages_done=stats.pages,
+                    chunks_embedded=stats.chunks,
+                )
+
+            self.rag.embed_pdf(
+                job.path, job.collection, job.is_temp, doc_id=job.doc_id, progress=progress
+            )
+            db.update_ingest_job(job_id, status="done")
+        except Exception as exc:
+            logger.exception("Ingest job %s failed", job_id)
+            db.update_ingest_job(job_id, status="failed", error=str(exc))
+        finally:
+            # Temporary uploads are only kept for their job, whatever its outcome.
+            if job is not None and job.is_temp:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(job.path)
+            with self._lock:
+                self._pending -= 1
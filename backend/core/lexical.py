@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import math
+import re
+import sys
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from core.retrieval import Hit
+
+# Words plus joined codes such as "E-42", "6205-2RS" or "v1.2".
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT = re.compile(r"[-./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms of *text*; joined codes also yield their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = _SPLIT.split(token)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+            terms.extend(part for part in parts if part)
+    return terms
+
+
+class BM25Index:
+    """In-memory BM25 index over the chunks of one collection.
+
+    Postings are kept per term as two ``array`` buffers (chunk ordinals as
+    ``uint32`` and term frequencies as ``uint16``), which numpy reads without
+    copying at query time. Removed chunks are tombstoned and their postings
+    are dropped by :meth:`compact` once they make up a quarter of the index.
+    ``lock`` guards every read and write.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._keys: List[Optional[str]] = []
+        self._texts: List[Optional[str]] = []
+        self._sources: List[Optional[dict]] = []
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._ordinals: Dict[str, int] = {}
+        self._by_doc: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def add(self, key: str, text: str, source: dict) -> None:
+        """Index chunk *key*, replacing any previous version of it."""
+        with self.lock:
+            if key in self._ordinals:
+                self._remove(key)
+            ordinal = len(self._keys)
+            terms = Counter(tokenize(text))
+            self._keys.append(key)
+            self._texts.append(text)
+            self._sources.append(source)
+            length = sum(terms.values())
+            self._lengths.append(length)
+            self._alive.append(1)
+            self._total_length += length
+            self._ordinals[key] = ordinal
+            self._by_doc.setdefault(str(source.get("doc_id")), set()).add(key)
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("I"), array("H"))
+                postings[0].append(ordinal)
+                postings[1].append(min(tf, 0xFFFF))
+
+    def add_many(self, items: Iterable[Tuple[str, str, dict]]) -> None:
+        with self.lock:
+            for key, text, source in items:
+                self.add(key, text, source)
+
+    def _remove(self, key: str) -> None:
+        ordinal = self._ordinals.pop(key)
+        source = self._sources[ordinal] or {}
+        doc_keys = self._by_doc.get(str(source.get("doc_id")))
+        if doc_keys is not None:
+            doc_keys.discard(key)
+            if not doc_keys:
+                del self._by_doc[str(source.get("doc_id"))]
+        self._alive[ordinal] = 0
+        self._total_length -= self._lengths[ordinal]
+        self._keys[ordinal] = self._texts[ordinal] = self._sources[ordinal] = None
+
+    def remove(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            for key in keys:
+                if key in self._ordinals:
+                    self._remove(key)
+            self._maybe_compact()
+
+    def remove_document(self, doc_id: str) -> None:
+        with self.lock:
+            self.remove(list(self._by_doc.get(str(doc_id), ())))
+
+    def _maybe_compact(self) -> None:
+        dead = len(self._keys) - len(self._ordinals)
+        if dead > 1000 and dead * 4 > len(self._keys):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rebuild the postings without removed chunks."""
+        with self.lock:
+            live = [
+                (key, self._texts[i], self._sources[i])
+                for i, key in enumerate(self._keys)
+                if key is not None
+            ]
+            fresh = BM25Index(self.k1, self.b)
+            fresh.add_many(live)
+            lock = self.lock
+            self.__dict__.update(fresh.__dict__)
+            self.lock = lock
+
+    def search(self, query: str, k: int) -> List[Hit]:
+        """Return the *k* best chunks for *query*, scored by BM25."""
+        terms = set(tokenize(query))
+        with self.lock:
+            n_live = len(self._ordinals)
+            if not n_live or not terms:
+                return []
+            alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            avg_length = max(self._total_length / n_live, 1.0)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+            scores = np.zeros(len(self._keys), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ordinals = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                df = int(alive[ordinals].sum())
+                if not df:
+                    continue
+                idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+                scores[ordinals] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[ordinals])
+            scores[~alive] = 0.0
+            top = np.argsort(-scores)[:k]
+            return [
+                Hit(self._texts[i], self._sources[i], float(scores[i]))
+                for i in top
+                if scores[i] > 0
+            ]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the postings and per-chunk arrays."""
+        with self.lock:
+            postings = sum(
+                ids.itemsize * len(ids) + tfs.itemsize * len(tfs) + sys.getsizeof(term)
+                for term, (ids, tfs) in self._postings.items()
+            )
+            return postings + len(self._lengths) * self._lengths.itemsize + len(self._alive)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "chunks": len(self._ordinals),
+                "terms": len(self._postings),
+                "tombstones": len(self._keys) - len(self._ordinals),
+                "postings_bytes": self.nbytes(),
+            }
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hit]], k: int = 60) -> List[Hit]:
+    """Fuse ranked hit lists; a hit's score becomes ``sum(1 / (k + rank))``.
+
+    Hits are matched across lists by ``doc_id``, ``page`` and ``chunk_id``.
+    The returned hits carry the fused score, best first.
+    """
+    fused: Dict[tuple, Hit] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            src = hit.source
+            key = (src.get("doc_id"), src.get("page"), src.get("chunk_id"))
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = Hit(hit.text, hit.source, 0.0, hit.embedding)
+            entry.score += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: hit.score, reverse=True)
@@ -1,91 +1,371 @@
 from __future__ import annotations
 
 import json
-from typing import List, Tuple
+from contextlib import nullcontext
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+
+from core.scheduler import CHAT, INGEST, INTENT, LLMScheduler
+from core.timing import metrics
+
+_UNSCHEDULED = nullcontext()
+
+
+INTENT_SYSTEM_PROMPT = (
+    "You are an intent classifier. Respond with JSON of the form "
+    "{\"intent\":<intent>,\"confidence\":<score>} where confidence is "
+    "between 0 and 1."
+)
+
+
+def _parse_embedding(data: dict) -> List[float]:
+    if "embedding" in data:
+        return data["embedding"]
+    # Fallback to OpenAI style {data:[{embedding:[]}]}
+    return data.get("data", [{}])[0].get("embedding", [])
+
+
+def _unit(vector: List[float]) -> List[float]:
+    """Scale *vector* to unit length, as ``/api/embed`` returns them."""
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector] if norm else vector
+
+
+def _parse_embeddings(data: dict) -> List[List[float]]:
+    if "embeddings" in data:
+        return data["embeddings"]
+    # Fallback to OpenAI style {data:[{embedding:[]}, ...]}
+    return [item.get("embedding", []) for item in data.get("data", [])]
+
+
+def _parse_chat(data) -> str:
+    if isinstance(data, dict):
+        if "message" in data and isinstance(data["message"], dict):
+            return data["message"].get("content", "")
+        if "choices" in data:
+            return data["choices"][0]["message"]["content"]
+    return str(data)
+
+
+def _stream_delta(line: str | bytes) -> Tuple[str, bool]:
+    """Parse one NDJSON line of a streamed chat into ``(delta, done)``."""
+    if not line:
+        return "", False
+    data = json.loads(line)
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    delta = (data.get("message") or {}).get("content", "")
+    return delta, bool(data.get("done"))
+
+
+def _record_usage(line: str | bytes, model: str, usage: Optional[dict]) -> None:
+    """Note the token counts Ollama reports on the last line of a chat stream."""
+    if usage is None and not metrics.enabled:
+        return
+    data = json.loads(line)
+    counts = {"prompt_eval_count": data.get("prompt_eval_count", 0), "eval_count": data.get("eval_count", 0)}
+    if usage is not None:
+        usage.update(counts)
+    metrics.inc("sapid_llm_tokens_total", counts["prompt_eval_count"], model=model, kind="prompt")
+    metrics.inc("sapid_llm_tokens_total", counts["eval_count"], model=model, kind="completion")
+
+
+def keep_alive_value(value: str | None) -> int | str | None:
+    """Ollama's ``keep_alive``: seconds (``-1`` = forever) or a duration like ``"30m"``."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _intent_messages(text: str) -> List[dict]:
+    return [
+        {"role": "system", "content": INTENT_SYSTEM_PROMPT},
+        {"role": "user", "content": text},
+    ]
+
+
+def _parse_intent(response: str) -> Tuple[str, float]:
+    try:
+        result = json.loads(response)
+        return result.get("intent", ""), float(result.get("confidence", 0))
+    except Exception:
+        return response.strip(), 0.0
 
 
 class LLM:
-    """Simple client for interacting with an LLM service."""
+    """Simple client for interacting with an LLM service.
 
-    def __init__(self, base_url: str, chat_model: str, embed_model: str) -> None:
+    Creating a client makes no requests; :meth:`has_model`, :meth:`pull_model`
+    and :meth:`warm` are there for whoever manages the models (see
+    :class:`core.runtime.ModelReadiness`). With ``keep_alive`` set, every
+    request asks Ollama to keep the model loaded for that long.
+
+    With a ``scheduler``, each request first takes a slot for its model in
+    the given ``lane`` (see :class:`core.scheduler.LLMScheduler`) and may
+    raise :class:`core.scheduler.LLMQueueFull`. Embedding single texts and
+    chatting default to the ``chat`` lane, batch embedding to ``ingest``.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        chat_model: str,
+        embed_model: str,
+        pool_size: int = 10,
+        keep_alive: int | str | None = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
         self.chat_model = chat_model
         self.embed_model = embed_model
+        self.scheduler = scheduler
+        self._keep_alive = {"keep_alive": keep_alive} if keep_alive is not None else {}
 
-        # Ensure the required models are available on the Ollama server. If a
-        # model is missing, attempt to pull it using the API so the first
-        # request doesn't fail because of a missing model.
-        for model in {self.chat_model, self.embed_model}:
-            self._ensure_model(model)
+        # Reuse keep-alive connections instead of opening one per request.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _ensure_model(self, model: str) -> None:
-        """Verify *model* exists on the server and pull it if missing."""
-        try:
-            resp = requests.get(f"{self.base_url}/api/tags")
-            resp.raise_for_status()
-            models = [m.get("name") for m in resp.json().get("models", [])]
-            if model in models:
-                return
-        except Exception:
-            # If we can't check, just skip pulling to avoid raising during init
-            return
-
-        try:
-            # Pull the model; the API streams progress line by line which we
-            # simply consume and ignore.
-            resp = requests.post(
-                f"{self.base_url}/api/pull",
-                json={"name": model},
-                stream=True,
-            )
+    def has_model(self, model: str) -> bool:
+        """Whether *model* is installed on the server (``name`` matches ``name:latest``)."""
+        resp = self.session.get(f"{self.base_url}/api/tags")
+        resp.raise_for_status()
+        names = {m.get("name") for m in resp.json().get("models", [])}
+        return model in names or f"{model}:latest" in names
+
+    def pull_model(self, model: str) -> None:
+        """Pull *model*, blocking until the download has finished."""
+        with self.session.post(
+            f"{self.base_url}/api/pull", json={"name": model}, stream=True
+        ) as resp:
             resp.raise_for_status()
-            for _ in resp.iter_lines():
-                pass
-        except Exception:
-            # Swallow errors so initialization doesn't fail if the pull fails
-            pass
-
-    def embed(self, text: str) -> List[float]:
-        """Return the embedding vector for *text* using the embed model."""
+            # Progress is streamed line by line; only an error matters here.
+            for line in resp.iter_lines():
+                if line and "error" in (data := json.loads(line)):
+                    raise RuntimeError(data["error"])
+
+    def warm(self, model: str) -> None:
+        """Load *model* into memory so the first real request doesn't wait for it."""
+        if model == self.embed_model and model != self.chat_model:
+            url, payload = f"{self.base_url}/api/embed", {"model": model, "input": "warmup"}
+        else:
+            # A generate request without a prompt only loads the model.
+            url, payload = f"{self.base_url}/api/generate", {"model": model}
+        resp = self.session.post(url, json={**payload, **self._keep_alive})
+        resp.raise_for_status()
+
+    def _slot(self, model: str, lane: str):
+        return self.scheduler.slot(model, lane) if self.scheduler else _UNSCHEDULED
+
+    def embed(self, text: str, lane: str = CHAT) -> List[float]:
+        """Return the unit-length embedding vector for *text* using the embed model.
+
+        Goes through ``/api/embed`` like :meth:`embed_batch`, so queries and
+        stored chunks are embedded the same way.
+        """
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.embed_model, "input": [text], **self._keep_alive}
+        with self._slot(self.embed_model, lane), metrics.time(
+            "sapid_llm_request_seconds", op="embed", model=self.embed_model
+        ):
+            resp = self.session.post(url, json=payload)
+        if resp.status_code == 404:
+            return self._embed_legacy(text, lane)
+        resp.raise_for_status()
+        return _parse_embeddings(resp.json())[0]
+
+    def _embed_legacy(self, text: str, lane: str) -> List[float]:
+        """Embed *text* via ``/api/embeddings`` for servers without ``/api/embed``."""
         url = f"{self.base_url}/api/embeddings"
-        resp = requests.post(url, json={"model": self.embed_model, "prompt": text})
+        payload = {"model": self.embed_model, "prompt": text, **self._keep_alive}
+        with self._slot(self.embed_model, lane), metrics.time(
+            "sapid_llm_request_seconds", op="embed", model=self.embed_model
+        ):
+            resp = self.session.post(url, json=payload)
         resp.raise_for_status()
-        data = resp.json()
-        if "embedding" in data:
-            return data["embedding"]
-        # Fallback to OpenAI style {data:[{embedding:[]}]}
-        return data.get("data", [{}])[0].get("embedding", [])
+        # The legacy endpoint doesn't normalise; similarities assume it.
+        return _unit(_parse_embedding(resp.json()))
 
-    def chat(self, messages: List[dict]) -> str:
+    def embed_batch(self, texts: List[str], lane: str = INGEST) -> List[List[float]]:
+        """Return embeddings for all *texts* in a single request.
+
+        Uses Ollama's multi-input ``/api/embed`` endpoint. Servers that predate
+        it answer 404, in which case we fall back to one legacy request per text.
+        """
+        if not texts:
+            return []
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.embed_model, "input": texts, **self._keep_alive}
+        with self._slot(self.embed_model, lane), metrics.time(
+            "sapid_llm_request_seconds", op="embed_batch", model=self.embed_model
+        ):
+            resp = self.session.post(url, json=payload)
+        if resp.status_code == 404:
+            return [self._embed_legacy(text, lane) for text in texts]
+        resp.raise_for_status()
+        return _parse_embeddings(resp.json())
+
+    def chat(self, messages: List[dict], lane: str = CHAT) -> str:
         """Chat with the model using OpenAI formatted messages."""
         url = f"{self.base_url}/api/chat"
-        payload = {"model": self.chat_model, "messages": messages}
-        resp = requests.post(url, json=payload)
+        payload = {"model": self.chat_model, "messages": messages, "stream": False}
+        payload.update(self._keep_alive)
+        with self._slot(self.chat_model, lane), metrics.time(
+            "sapid_llm_request_seconds", op="chat", model=self.chat_model
+        ):
+            resp = self.session.post(url, json=payload)
         resp.raise_for_status()
-        data = resp.json()
-        if isinstance(data, dict):
-            if "message" in data and isinstance(data["message"], dict):
-                return data["message"].get("content", "")
-            if "choices" in data:
-                return data["choices"][0]["message"]["content"]
-        return str(data)
+        return _parse_chat(resp.json())
+
+    def chat_stream(self, messages: List[dict], usage: Optional[dict] = None) -> Iterator[str]:
+        """Yield the reply to *messages* incrementally as the model generates it.
+
+        When the stream ends, *usage* (if given) gets Ollama's
+        ``prompt_eval_count`` and ``eval_count``.
+        """
+        url = f"{self.base_url}/api/chat"
+        payload = {"model": self.chat_model, "messages": messages, "stream": True}
+        payload.update(self._keep_alive)
+        with self._slot(self.chat_model, CHAT), self.session.post(url, json=payload, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                delta, done = _stream_delta(line)
+                if delta:
+                    yield delta
+                if done:
+                    _record_usage(line, self.chat_model, usage)
+                    break
+
+    async def achat_stream(self, messages: List[dict], usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """Async variant of :meth:`chat_stream`."""
+        url = f"{self.base_url}/api/chat"
+        payload = {"model": self.chat_model, "messages": messages, "stream": True}
+        payload.update(self._keep_alive)
+        slot = self.scheduler.aslot(self.chat_model, CHAT) if self.scheduler else _UNSCHEDULED
+        async with slot, httpx.AsyncClient(timeout=None) as client:
+            async with client.stream("POST", url, json=payload) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    delta, done = _stream_delta(line)
+                    if delta:
+                        yield delta
+                    if done:
+                        _record_usage(line, self.chat_model, usage)
+                        break
 
     def classify_intent(self, text: str) -> Tuple[str, float]:
         """Classify the intent of *text* using the chat model."""
-        system = (
-            "You are an intent classifier. Respond with JSON of the form "
-            "{\"intent\":<intent>,\"confidence\":<score>} where confidence is "
-            "between 0 and 1."
+        return _parse_intent(self.chat(_intent_messages(text), lane=INTENT))
+
+
+class AsyncLLM:
+    """Non-blocking counterpart of :class:`LLM` for use inside request handlers.
+
+    All calls share one pooled ``httpx.AsyncClient`` so concurrent requests
+    reuse keep-alive connections and never block the event loop. A
+    ``scheduler`` works as for :class:`LLM` and is normally the same one, so
+    both clients share the per-model limits.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        chat_model: str,
+        embed_model: str,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        timeout: float = 120.0,
+        connect_timeout: float = 5.0,
+        keep_alive: int | str | None = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.chat_model = chat_model
+        self.embed_model = embed_model
+        self.scheduler = scheduler
+        self._keep_alive = {"keep_alive": keep_alive} if keep_alive is not None else {}
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
         )
-        messages = [
-            {"role": "system", "content": system},
-            {"role": "user", "content": text},
-        ]
-        response = self.chat(messages)
-        try:
-            result = json.loads(response)
-            return result.get("intent", ""), float(result.get("confidence", 0))
-        except Exception:
-            return response.strip(), 0.0
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _slot(self, model: str, lane: str):
+        return self.scheduler.aslot(model, lane) if self.scheduler else _UNSCHEDULED
+
+    async def embed(self, text: str, lane: str = CHAT) -> List[float]:
+        """Return the unit-length embedding vector for *text* (see :meth:`LLM.embed`)."""
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.embed_model, "input": [text], **self._keep_alive}
+        async with self._slot(self.embed_model, lane):
+            with metrics.time("sapid_llm_request_seconds", op="embed", model=self.embed_model):
+                resp = await self.client.post(url, json=payload)
+        if resp.status_code == 404:
+            return await self._embed_legacy(text, lane)
+        resp.raise_for_status()
+        return _parse_embeddings(resp.json())[0]
+
+    async def _embed_legacy(self, text: str, lane: str) -> List[float]:
+        url = f"{self.base_url}/api/embeddings"
+        payload = {"model": self.embed_model, "prompt": text, **self._keep_alive}
+        async with self._slot(self.embed_model, lane):
+            with metrics.time("sapid_llm_request_seconds", op="embed", model=self.embed_model):
+                resp = await self.client.post(url, json=payload)
+        resp.raise_for_status()
+        return _unit(_parse_embedding(resp.json()))
+
+    async def embed_batch(self, texts: List[str], lane: str = INGEST) -> List[List[float]]:
+        """Return embeddings for all *texts* in a single request."""
+        if not texts:
+            return []
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.embed_model, "input": texts, **self._keep_alive}
+        async with self._slot(self.embed_model, lane):
+            with metrics.time("sapid_llm_request_seconds", op="embed_batch", model=self.embed_model):
+                resp = await self.client.post(url, json=payload)
+        if resp.status_code == 404:
+            return [await self._embed_legacy(text, lane) for text in texts]
+        resp.raise_for_status()
+        return _parse_embeddings(resp.json())
+
+    async def chat(self, messages: List[dict], lane: str = CHAT) -> str:
+        """Chat with the model using OpenAI formatted messages."""
+        url = f"{self.base_url}/api/chat"
+        payload = {"model": self.chat_model, "messages": messages, "stream": False}
+        payload.update(self._keep_alive)
+        async with self._slot(self.chat_model, lane):
+            with metrics.time("sapid_llm_request_seconds", op="chat", model=self.chat_model):
+                resp = await self.client.post(url, json=payload)
+        resp.raise_for_status()
+        return _parse_chat(resp.json())
+
+    async def chat_stream(self, messages: List[dict], usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield the reply to *messages* incrementally (see :meth:`LLM.chat_stream`)."""
+        url = f"{self.base_url}/api/chat"
+        payload = {"model": self.chat_model, "messages": messages, "stream": True}
+        payload.update(self._keep_alive)
+        async with self._slot(self.chat_model, CHAT), self.client.stream("POST", url, json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                delta, done = _stream_delta(line)
+                if delta:
+                    yield delta
+                if done:
+                    _record_usage(line, self.chat_model, usage)
+                    break
+
+    async def classify_intent(self, text: str) -> Tuple[str, float]:
+        """Classify the intent of *text* using the chat model."""
+        return _parse_intent(await self.chat(_intent_messages(text), lane=INTENT))
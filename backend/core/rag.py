@@ -1,99 +1,609 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List, Tuple
-from uuid import uuid4
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 
-import chromadb
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pypdf import PdfReader
+import requests
 
-from core.llm import LLM
+from core.cache import SemanticCache, TTLCache
+from core.context import ContextBuilder, PromptContext
+from core.extract import PdfExtractor
+from core.lexical import BM25Index, reciprocal_rank_fusion
+from core.llm import LLM, AsyncLLM
+from core.retrieval import Hit, hits_from_result, merge_hits
+from core.timing import metrics
+from core.vectorstore import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# chromadb takes most of a second to import and isn't needed with the local
+# vector store, so it is imported on first use (see _chromadb).
+chromadb: Any = None
+
+
+def _chromadb():
+    global chromadb
+    if chromadb is None:
+        import chromadb as module
+
+        chromadb = module
+    return chromadb
+
+# Bumped whenever a collection's contents change. Kept at module level so that
+# ingestion through one ``RAG`` (api.upload) invalidates answers cached by
+# another (api.chat).
+_collection_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def collection_version(name: str) -> int:
+    with _versions_lock:
+        return _collection_versions.get(name, 0)
+
+
+def bump_collection_version(name: str) -> None:
+    """Mark *name* as changed so cached answers built from it are not reused."""
+    with _versions_lock:
+        _collection_versions[name] = _collection_versions.get(name, 0) + 1
+
+
+# Lexical indexes by collection name, shared by every ``RAG`` in the process
+# for the same reason. An index is built from Chroma on first search and then
+# kept in step by ``embed_pdf`` and the delete helpers.
+_lexical_indexes: Dict[str, BM25Index] = {}
+_lexical_lock = threading.Lock()
+
+
+def _collection_kind(name: str) -> str:
+    # Per-session collection names would make a metric label per session.
+    return "temp" if name.startswith("temp_") else name
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestStats:
+    """Throughput figures for a single ``embed_pdf`` run."""
+
+    pages: int = 0
+    pages_total: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+    file_hash: str = ""
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
 
 
 class RAG:
-    """Minimal helper around a Chroma database and an LLM."""
+    """Minimal helper around a vector store and an LLM.
+
+    Vectors go to the Chroma server at ``chroma_url`` unless another
+    :class:`~core.vectorstore.VectorStore` is passed as ``store``. The Chroma
+    client is only created on first use, so the server may start later.
+    """
 
-    def __init__(self, llm: LLM, chroma_url: str) -> None:
+    def __init__(
+        self,
+        llm: LLM,
+        chroma_url: str,
+        embed_batch_size: int = 32,
+        allm: AsyncLLM | None = None,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 600.0,
+        answer_cache: SemanticCache | None = None,
+        extractor: PdfExtractor | None = None,
+        context: ContextBuilder | None = None,
+        min_similarity: float | None = None,
+        mmr_diversity: float | None = None,
+        mmr_fetch_factor: int = 3,
+        distance_space: str = "l2",
+        query_workers: int = 4,
+        hybrid: bool = False,
+        rrf_k: int = 60,
+        lexical_page_size: int = 1000,
+        store: VectorStore | None = None,
+        metadata_text: bool = True,
+    ) -> None:
         self.llm = llm
-        parsed = urlparse(chroma_url)
-        host = parsed.hostname or "localhost"
-        port = parsed.port or 8000
-        self.client = chromadb.HttpClient(host=host, port=port)
+        self.extractor = extractor or PdfExtractor()
+        self.context = context or ContextBuilder()
+        self.allm = allm
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.query_cache = TTLCache(query_cache_size, query_cache_ttl)
+        self._embedding: Dict[Hashable, Future] = {}
+        self._embedding_lock = threading.Lock()
+        self.answer_cache = answer_cache
+        self.min_similarity = min_similarity
+        self.mmr_diversity = mmr_diversity
+        self.mmr_fetch_factor = max(1, mmr_fetch_factor)
+        self.distance_space = distance_space
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.lexical_page_size = max(1, lexical_page_size)
+        self.metadata_text = metadata_text
+        self._query_pool = ThreadPoolExecutor(
+            max_workers=max(1, query_workers), thread_name_prefix="chroma-query"
+        )
+        self.chroma_url = chroma_url
+        self._uses_chroma = store is None
+        self._client = store
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The vector store. A Chroma client is created, and connects, on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    parsed = urlparse(self.chroma_url)
+                    self._client = _chromadb().HttpClient(
+                        host=parsed.hostname or "localhost", port=parsed.port or 8000
+                    )
+        return self._client
+
+    def store_status(self, timeout: float = 2.0) -> dict:
+        """Report whether the vector store can be reached, without connecting a client.
+
+        An in-process store is always ready. The Chroma server is probed
+        through its heartbeat endpoint, so ``chromadb`` isn't imported for it.
+        """
+        if not self._uses_chroma:
+            return {"backend": "local", "state": "ready"}
+        base = self.chroma_url.rstrip("/")
+        try:
+            for version in ("v2", "v1"):
+                resp = requests.get(f"{base}/api/{version}/heartbeat", timeout=timeout)
+                if resp.status_code != 404:
+                    resp.raise_for_status()
+                    return {"backend": "chroma", "state": "ready"}
+            return {"backend": "chroma", "state": "error", "error": "no heartbeat endpoint"}
+        except requests.RequestException as exc:
+            return {"backend": "chroma", "state": "error", "error": str(exc)}
 
     def _collection(self, name: str):
         return self.client.get_or_create_collection(name)
 
+    def collection_names(self) -> List[str]:
+        # Older Chroma clients return Collection objects, newer ones names.
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def delete_document_vectors(self, collection_name: str, doc_id: str) -> None:
+        """Remove every chunk of *doc_id* from *collection_name*."""
+        self._collection(collection_name).delete(where={"doc_id": doc_id})
+        index = _lexical_indexes.get(collection_name)
+        if index is not None:
+            index.remove_document(doc_id)
+        bump_collection_version(collection_name)
+
+    def drop_collection(self, name: str) -> None:
+        try:
+            self.client.delete_collection(name)
+        except Exception:
+            # Chroma raises a version-dependent error for unknown collections.
+            logger.debug("Collection %s not dropped", name, exc_info=True)
+        with _lexical_lock:
+            _lexical_indexes.pop(name, None)
+        bump_collection_version(name)
+
+    def lexical_index(self, name: str) -> BM25Index:
+        """Return the BM25 index of *name*, building it from Chroma if needed."""
+        with _lexical_lock:
+            index = _lexical_indexes.get(name)
+            if index is not None:
+                return index
+            index = _lexical_indexes[name] = BM25Index()
+            # Held until loaded: searches wait for the full index, and chunks
+            # written by ``embed_pdf`` meanwhile are applied after the load.
+            index.lock.acquire()
+        try:
+            collection = self._collection(name)
+            offset = 0
+            while True:
+                page = collection.get(
+                    include=["documents", "metadatas"],
+                    limit=self.lexical_page_size,
+                    offset=offset,
+                )
+                ids = page.get("ids") or []
+                documents = page.get("documents") or [None] * len(ids)
+                metadatas = page.get("metadatas") or [{}] * len(ids)
+                for chunk_key, text, metadata in zip(ids, documents, metadatas):
+                    metadata = metadata or {}
+                    # Share the string with the metadata copy rather than hold it twice.
+                    text = metadata.get("text") or text or ""
+                    index.add(chunk_key, text, metadata)
+                if len(ids) < self.lexical_page_size:
+                    break
+                offset += len(ids)
+        except Exception:
+            with _lexical_lock:
+                _lexical_indexes.pop(name, None)
+            raise
+        finally:
+            index.lock.release()
+        logger.info("Built lexical index for %s: %s", name, index.stats())
+        return index
+
 
     def embed_pdf(
-        self, path: str, collection_name: str, is_temp: bool, doc_id: str | None = None
-    ) -> None:
+        self,
+        path: str,
+        collection_name: str,
+        is_temp: bool,
+        doc_id: str | None = None,
+        progress: Optional[Callable[[IngestStats], None]] = None,
+    ) -> IngestStats:
+
+        """Embed the given PDF into the specified Chroma collection.
 
-        """Embed the given PDF into the specified Chroma collection."""
+        Chunk ids are derived from the document id, page and position, and
+        each chunk's text hash is stored in its metadata. Chunks already
+        stored with the same hash are skipped, so re-ingesting an unchanged
+        document embeds nothing and a changed one only re-embeds what
+        differs; chunks the new version no longer has are deleted. Without a
+        ``doc_id`` the document is identified by the hash of the file, so a
+        changed file is ingested as a new document and the old version's
+        chunks stay until its collection is dropped. The
+        text is also copied into the metadata unless ``metadata_text`` is off;
+        :meth:`retrieve` restores it from the stored document either way.
 
-        reader = PdfReader(path)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+        Text comes from ``self.extractor`` as a stream, so changed chunks are
+        embedded ``embed_batch_size`` at a time while later pages are still
+        being parsed, each batch being written with a single
+        ``collection.upsert``. ``progress`` is called with the running stats
+        after every page.
+        """
+
+        started = time.perf_counter()
+        file_hash = file_sha256(path)
         collection = self._collection(collection_name)
 
-        doc_identifier = doc_id or os.path.basename(path)
+        doc_identifier = doc_id or f"sha256-{file_hash[:16]}"
+        stats = IngestStats(pages_total=self.extractor.page_count(path), file_hash=file_hash)
 
+        stored = collection.get(where={"doc_id": doc_identifier}, include=["metadatas"])
+        stored_hashes = {
+            chunk_key: (metadata or {}).get("hash")
+            for chunk_key, metadata in zip(stored.get("ids", []), stored.get("metadatas") or [])
+        }
+        seen: set[str] = set()
 
-        for page_number, page in enumerate(reader.pages):
-            text = page.extract_text() or ""
-            chunks = splitter.split_text(text)
-            for chunk_id, chunk in enumerate(chunks):
-                embedding = self.llm.embed(chunk)
-                metadata = {
+        batch: List[Tuple[str, str, dict]] = []
 
-                    "doc_id": doc_identifier,
+        def flush() -> None:
+            texts = [chunk for _, chunk, _ in batch]
+            embeddings = self.llm.embed_batch(texts)
+            collection.upsert(
+                ids=[chunk_key for chunk_key, _, _ in batch],
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=[metadata for _, _, metadata in batch],
+            )
+            index = _lexical_indexes.get(collection_name)
+            if index is not None:
+                index.add_many(batch)
+            stats.chunks += len(batch)
+            batch.clear()
 
-                    "page": page_number,
-                    "chunk_id": chunk_id,
-                    "text": chunk,
-                }
-                collection.add(
-                    ids=[str(uuid4())],
-                    embeddings=[embedding],
-                    documents=[chunk],
-                    metadatas=[metadata],
-                )
+        for page_number, chunk_id, chunk in self.extractor.iter_chunks(path, stats.pages_total):
+            if page_number > stats.pages:
+                # Pages without text yield no chunks, so catch up here.
+                stats.pages = page_number
+                if progress:
+                    progress(stats)
+            chunk_key = f"{doc_identifier}:{page_number}:{chunk_id}"
+            chunk_hash = chunk_sha256(chunk)
+            seen.add(chunk_key)
+            if stored_hashes.get(chunk_key) == chunk_hash:
+                stats.skipped += 1
+                continue
+            metadata = {
+
+                "doc_id": doc_identifier,
+
+                "page": page_number,
+                "chunk_id": chunk_id,
+                "hash": chunk_hash,
+            }
+            if self.metadata_text:
+                metadata["text"] = chunk
+            batch.append((chunk_key, chunk, metadata))
+            if len(batch) >= self.embed_batch_size:
+                flush()
+        if batch:
+            flush()
+        stats.pages = stats.pages_total
+        if progress:
+            progress(stats)
+
+        stale = [chunk_key for chunk_key in stored_hashes if chunk_key not in seen]
+        if stale:
+            collection.delete(ids=stale)
+            index = _lexical_indexes.get(collection_name)
+            if index is not None:
+                index.remove(stale)
+            stats.removed = len(stale)
+
+        if stats.chunks or stats.removed:
+            bump_collection_version(collection_name)
 
         if is_temp:
             os.remove(path)
 
-    def query(
+        stats.seconds = time.perf_counter() - started
+        if metrics.enabled:
+            kind = _collection_kind(collection_name)
+            metrics.inc("sapid_ingest_pages_total", stats.pages, collection=kind)
+            for result, count in (
+                ("embedded", stats.chunks), ("unchanged", stats.skipped), ("removed", stats.removed)
+            ):
+                metrics.inc("sapid_ingest_chunks_total", count, collection=kind, result=result)
+            metrics.observe("sapid_ingest_seconds", stats.seconds, collection=kind)
+            if stats.chunks:
+                metrics.observe("sapid_ingest_chunks_per_second", stats.chunks_per_sec, collection=kind)
+        logger.info(
+            "Embedded %s: %d pages, %d chunks (%d unchanged, %d removed) in %.2fs (%.1f chunks/sec)",
+            doc_identifier,
+            stats.pages,
+            stats.chunks,
+            stats.skipped,
+            stats.removed,
+            stats.seconds,
+            stats.chunks_per_sec,
+        )
+        return stats
+
+    def embed_query(self, question: str) -> List[float]:
+        """Return the embedding of *question*, reusing recent results.
+
+        Concurrent calls for the same question (retrieval and intent
+        classification of one chat message) share a single request.
+        """
+        key = (" ".join(question.split()).casefold(), self.llm.embed_model)
+        with self._embedding_lock:
+            # The cache is filled before a finished request is withdrawn.
+            embedding = self.query_cache.get(key)
+            if embedding is not None:
+                return embedding
+            pending = self._embedding.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._embedding[key] = Future()
+        if not owner:
+            return pending.result()
+        try:
+            embedding = self.llm.embed(question)
+            self.query_cache.set(key, embedding)
+            pending.set_result(embedding)
+            return embedding
+        except BaseException as exc:
+            pending.set_exception(exc)
+            raise
+        finally:
+            with self._embedding_lock:
+                del self._embedding[key]
+
+    async def aembed_query(self, question: str) -> List[float]:
+        """Async variant of :meth:`embed_query`, sharing its cache."""
+        return await asyncio.to_thread(self.embed_query, question)
+
+    def _query_collection(self, name: str, embedding: List[float], n_results: int) -> List[Hit]:
+        include = ["documents", "metadatas", "distances"]
+        if self.mmr_diversity:
+            include.append("embeddings")
+        with metrics.time("sapid_search_seconds", kind="vector", collection=_collection_kind(name)):
+            res = self._collection(name).query(
+                query_embeddings=[embedding], n_results=n_results, include=include
+            )
+        return hits_from_result(res, self.distance_space)
+
+    def _search_lexical(self, name: str, question: str, n_results: int) -> List[Hit]:
+        with metrics.time("sapid_search_seconds", kind="lexical", collection=_collection_kind(name)):
+            return self.lexical_index(name).search(question, n_results)
+
+    def retrieve(
         self, question: str, temp_collection: str | None, top_k: int = 5
-    ) -> Tuple[str, List[dict]]:
-        """Query the RAG system and return the answer and source metadata."""
+    ) -> Tuple[List[str], List[dict], List[float]]:
+        """Return the chunks, source metadata and scores relevant to *question*.
 
-        collections = [self._collection("global")]
+        The collections are queried concurrently and their hits merged into a
+        single top-*top_k* by similarity (higher is better), after dropping
+        hits below ``min_similarity``. With ``mmr_diversity`` set, a larger
+        candidate set is fetched and re-ranked by maximal marginal relevance.
+
+        With ``hybrid`` on, each collection's BM25 index is searched alongside
+        Chroma and the two rankings are fused by reciprocal rank fusion, so
+        the returned scores are fused scores rather than similarities.
+        """
+
+        names = ["global"]
         if temp_collection:
-            collections.append(self._collection(temp_collection))
-
-        docs: List[str] = []
-        sources: List[dict] = []
-        for coll in collections:
-            res = coll.query(
-                query_texts=[question],
-                n_results=top_k,
-                include=["documents", "metadatas"],
-            )
-            docs.extend(res.get("documents", [[]])[0])
-            sources.extend(res.get("metadatas", [[]])[0])
-
-        context = "\n".join(docs)
-        messages = [
-            {
-                "role": "system",
-                "content": "Answer the question using the provided context.",
-            },
-            {
-                "role": "user",
-                "content": f"Context:\n{context}\n\nQuestion: {question}",
-            },
+            names.append(temp_collection)
+
+        # Embed once and reuse the vector for every collection instead of
+        # letting Chroma embed the question again per collection.
+        embedding = self.embed_query(question)
+        n_results = top_k * self.mmr_fetch_factor if self.mmr_diversity else top_k
+        vector_futures = [
+            self._query_pool.submit(self._query_collection, name, embedding, n_results)
+            for name in names
         ]
-        answer = self.llm.chat(messages)
-        return answer, sources
+        lexical_futures = [
+            self._query_pool.submit(self._search_lexical, name, question, n_results)
+            for name in names
+        ] if self.hybrid else []
+        per_collection = [future.result() for future in vector_futures]
+        if lexical_futures:
+            vector = merge_hits(per_collection, n_results, self.min_similarity, self.mmr_diversity)
+            lexical = merge_hits([future.result() for future in lexical_futures], n_results)
+            hits = reciprocal_rank_fusion([vector, lexical], self.rrf_k)[:top_k]
+        else:
+            hits = merge_hits(per_collection, top_k, self.min_similarity, self.mmr_diversity)
+        sources = [h.source if "text" in h.source else {**h.source, "text": h.text} for h in hits]
+        return [h.text for h in hits], sources, [h.score for h in hits]
+
+    def _prompt(
+        self,
+        question: str,
+        temp_collection: str | None,
+        top_k: int,
+        history: List[dict],
+    ) -> PromptContext:
+        docs, sources, scores = self.retrieve(question, temp_collection, top_k)
+        prompt = self.context.build(question, docs, sources, scores, history)
+        logger.debug(
+            "prompt: ~%d tokens, %d chunks dropped, %d history messages dropped",
+            prompt.tokens,
+            prompt.chunks_dropped,
+            prompt.history_dropped,
+        )
+        return prompt
+
+    def _lookup_answer(
+        self, question: str, temp_collection: str | None, history: List[dict]
+    ) -> Tuple[Optional[Hashable], Optional[List[float]], Optional[Tuple[str, List[dict]]]]:
+        """Return ``(scope, embedding, cached)`` for *question*.
+
+        Only answers built from the global collection alone are cached, so
+        ``scope`` is ``None`` when the cache is off, the session has
+        documents of its own or there is history the answer may depend on.
+        ``cached`` is the stored ``(answer, sources)``.
+        """
+
+        if self.answer_cache is None or history:
+            return None, None, None
+        if temp_collection and self._collection(temp_collection).count():
+            return None, None, None
+        scope = ("global", collection_version("global"), self.llm.chat_model)
+        embedding = self.embed_query(question)
+        return scope, embedding, self.answer_cache.get(embedding, scope)
+
+    def query(
+        self,
+        question: str,
+        temp_collection: str | None,
+        top_k: int = 5,
+        history: Optional[List[dict]] = None,
+    ) -> Tuple[str, List[dict]]:
+        """Query the RAG system and return the answer and source metadata.
+
+        *history* holds earlier ``{"role", "content"}`` messages of the
+        conversation, oldest first; they share the prompt's token budget with
+        the retrieved chunks.
+        """
+
+        history = history or []
+        scope, embedding, cached = self._lookup_answer(question, temp_collection, history)
+        if cached is not None:
+            answer, sources = cached
+            return answer, list(sources)
+        prompt = self._prompt(question, temp_collection, top_k, history)
+        answer = self.llm.chat(prompt.messages)
+        if scope is not None:
+            self.answer_cache.set(embedding, scope, (answer, prompt.sources))
+        return answer, prompt.sources
+
+    def query_stream(
+        self,
+        question: str,
+        temp_collection: str | None,
+        top_k: int = 5,
+        history: Optional[List[dict]] = None,
+    ) -> Tuple[Iterator[str], List[dict]]:
+        """Like :meth:`query` but return the answer as an iterator of deltas."""
+
+        history = history or []
+        scope, embedding, cached = self._lookup_answer(question, temp_collection, history)
+        if cached is not None:
+            answer, sources = cached
+            return iter([answer]), list(sources)
+        prompt = self._prompt(question, temp_collection, top_k, history)
+        deltas = self.llm.chat_stream(prompt.messages)
+        if scope is not None:
+            deltas = self._store_stream(deltas, embedding, scope, prompt.sources)
+        return deltas, prompt.sources
+
+    async def aquery_stream(
+        self,
+        question: str,
+        temp_collection: str | None,
+        top_k: int = 5,
+        meta: Optional[Dict[str, Any]] = None,
+        history: Optional[List[dict]] = None,
+        usage: Optional[dict] = None,
+    ) -> Tuple[AsyncIterator[str], List[dict]]:
+        """Async variant of :meth:`query_stream`.
+
+        Retrieval still goes through the blocking Chroma client, so it runs in
+        a worker thread to keep the event loop free. If *meta* is given, its
+        ``answer_cache`` key is set to ``"hit"``, ``"miss"`` or ``"off"`` and
+        ``prompt_tokens`` to the estimated size of the prompt sent (``0`` on
+        a cache hit). *usage* is passed on to the LLM's ``chat_stream`` and
+        gets Ollama's token counts once the answer has streamed.
+        """
+
+        history = history or []
+        scope, embedding, cached = await asyncio.to_thread(
+            self._lookup_answer, question, temp_collection, history
+        )
+        if meta is not None:
+            meta["answer_cache"] = "off" if scope is None else "hit" if cached else "miss"
+            meta["prompt_tokens"] = 0
+        if cached is not None:
+            answer, sources = cached
+            return _replay(answer), list(sources)
+        prompt = await asyncio.to_thread(self._prompt, question, temp_collection, top_k, history)
+        if meta is not None:
+            meta["prompt_tokens"] = prompt.tokens
+        chat_stream = self.allm.chat_stream if self.allm else self.llm.achat_stream
+        deltas = chat_stream(prompt.messages, usage=usage)
+        if scope is not None:
+            deltas = self._astore_stream(deltas, embedding, scope, prompt.sources)
+        return deltas, prompt.sources
+
+    def _store_stream(
+        self, deltas: Iterator[str], embedding, scope: Hashable, sources: List[dict]
+    ) -> Iterator[str]:
+        parts: List[str] = []
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+        self.answer_cache.set(embedding, scope, ("".join(parts), sources))
+
+    async def _astore_stream(
+        self, deltas: AsyncIterator[str], embedding, scope: Hashable, sources: List[dict]
+    ) -> AsyncIterator[str]:
+        # Only a fully streamed answer is stored; an aborted stream never
+        # reaches the ``set``.
+        parts: List[str] = []
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+        self.answer_cache.set(embedding, scope, ("".join(parts), sources))
+
 
+async def _replay(answer: str) -> AsyncIterator[str]:
+    yield answer
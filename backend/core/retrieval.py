@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class Hit:
+    """One retrieved chunk with its similarity to the question."""
+
+    text: str
+    source: dict
+    score: float
+    embedding: Optional[Sequence[float]] = None
+
+
+def similarity(distance: float, space: str = "l2") -> float:
+    """Turn a Chroma distance into a similarity in ``[-1, 1]`` (higher is closer).
+
+    Chroma reports squared L2 for ``l2`` collections, which on unit vectors is
+    ``2 - 2 * cos``; ``cosine`` and ``ip`` report ``1 - cos``.
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+
+def hits_from_result(result: dict, space: str = "l2") -> List[Hit]:
+    """Unpack the first query of a Chroma ``query`` result into hits."""
+    docs = (result.get("documents") or [[]])[0]
+    metadatas = (result.get("metadatas") or [[]])[0] or [{}] * len(docs)
+    distances = (result.get("distances") or [[]])[0]
+    embeddings = result.get("embeddings")
+    embeddings = embeddings[0] if embeddings is not None and len(embeddings) else None
+    hits = []
+    for i, text in enumerate(docs):
+        # Without distances, fall back to the collection's own ranking.
+        score = similarity(distances[i], space) if distances is not None and len(distances) else -float(i)
+        embedding = embeddings[i] if embeddings is not None else None
+        hits.append(Hit(text, metadatas[i] or {}, score, embedding))
+    return hits
+
+
+def mmr(hits: Sequence[Hit], k: int, diversity: float = 0.3) -> List[Hit]:
+    """Pick *k* hits by maximal marginal relevance.
+
+    Each step takes the hit maximising ``(1 - diversity) * score -
+    diversity * max_similarity_to_already_picked``; ``diversity=0`` keeps the
+    plain score order. Hits without embeddings can't be compared and are
+    ranked by score alone.
+    """
+    if not hits or any(hit.embedding is None for hit in hits):
+        return sorted(hits, key=lambda hit: hit.score, reverse=True)[:k]
+    vectors = np.asarray([hit.embedding for hit in hits], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    pairwise = vectors @ vectors.T
+    scores = np.asarray([hit.score for hit in hits], dtype=np.float32)
+
+    picked: List[int] = []
+    redundancy = np.full(len(hits), -np.inf, dtype=np.float32)
+    candidates = np.ones(len(hits), dtype=bool)
+    while len(picked) < min(k, len(hits)):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        value = (1.0 - diversity) * scores - diversity * penalty
+        value[~candidates] = -np.inf
+        best = int(np.argmax(value))
+        picked.append(best)
+        candidates[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return [hits[i] for i in picked]
+
+
+def merge_hits(
+    per_collection: Sequence[Sequence[Hit]],
+    top_k: int,
+    min_similarity: Optional[float] = None,
+    diversity: Optional[float] = None,
+) -> List[Hit]:
+    """Merge hits of several collections into one global top-k by score."""
+    hits = [hit for hits in per_collection for hit in hits]
+    if min_similarity is not None:
+        hits = [hit for hit in hits if hit.score >= min_similarity]
+    if diversity:
+        return mmr(hits, top_k, diversity)
+    return sorted(hits, key=lambda hit: hit.score, reverse=True)[:top_k]
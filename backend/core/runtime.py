@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from core import db
+from core.cache import SemanticCache, TTLCache
+from core.cleanup import Cleanup, TempCollectionReaper
+from core.context import ContextBuilder
+from core.extract import PdfExtractor
+from core.intent import IntentClassifier, build_intent_classifier
+from core.jobs import IngestQueue
+from core.llm import LLM, AsyncLLM, keep_alive_value
+from core.rag import RAG
+from core.scheduler import LLMScheduler, parse_limits
+from core.vectorstore import vector_store
+
+logger = logging.getLogger(__name__)
+
+
+class ModelReadiness:
+    """Check, pull and optionally warm the chat and embed models in the background.
+
+    Each model moves through ``pending``, ``checking``, ``pulling`` (only if
+    the server doesn't have it) and ``warming`` (only with ``warmup``) to
+    ``ready``. A model whose step fails is marked ``error`` and retried every
+    ``retry_interval`` seconds, e.g. while Ollama is still starting.
+    """
+
+    def __init__(self, llm: LLM, warmup: bool = False, retry_interval: float = 30.0) -> None:
+        self.llm = llm
+        self.warmup = warmup
+        self.retry_interval = retry_interval
+        self.models: Dict[str, Dict[str, str]] = {
+            model: {"state": "pending"} for model in dict.fromkeys((llm.chat_model, llm.embed_model))
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(status["state"] == "ready" for status in self.models.values())
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "models": {name: dict(status) for name, status in self.models.items()}}
+
+    def _set(self, model: str, state: str, error: Optional[str] = None) -> None:
+        self.models[model] = {"state": state, **({"error": error} if error else {})}
+
+    async def _prepare(self, model: str) -> None:
+        self._set(model, "checking")
+        if not await asyncio.to_thread(self.llm.has_model, model):
+            self._set(model, "pulling")
+            logger.info("Pulling model %s", model)
+            await asyncio.to_thread(self.llm.pull_model, model)
+        if self.warmup:
+            self._set(model, "warming")
+            await asyncio.to_thread(self.llm.warm, model)
+        self._set(model, "ready")
+
+    async def run(self) -> None:
+        pending = list(self.models)
+        while True:
+            for model in list(pending):
+                try:
+                    await self._prepare(model)
+                    pending.remove(model)
+                except Exception as exc:
+                    logger.warning("Model %s not ready: %s", model, exc)
+                    self._set(model, "error", str(exc))
+            if not pending or self.retry_interval <= 0:
+                return
+            await asyncio.sleep(self.retry_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class Runtime:
+    """The model clients, RAG pipeline and background workers of one process.
+
+    Built once and shared by every router, so there is a single connection
+    pool per service, a single vector store client and a single
+    :class:`~core.scheduler.LLMScheduler` (``scheduler``, ``None`` when
+    unlimited) in front of Ollama. Constructing it makes no network calls
+    (the Chroma client connects on first use); :meth:`start` (run from the
+    app's lifespan) resumes ingestion, starts the reaper and prepares the
+    models in the background.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        allm: AsyncLLM,
+        rag: RAG,
+        classifier: IntentClassifier,
+        storage_dir: str = "./storage",
+        ingest_workers: int = 2,
+        ingest_queue_size: int = 32,
+        reaper_interval: float = 3600.0,
+        temp_collection_ttl: float = 86400.0,
+        warmup: bool = False,
+        model_retry_interval: float = 30.0,
+        document_cache_size: int = 1024,
+        document_cache_ttl: float = 300.0,
+    ) -> None:
+        self.llm = llm
+        self.allm = allm
+        self.rag = rag
+        self.classifier = classifier
+        self.scheduler = llm.scheduler
+        self.storage_dir = storage_dir
+        # Viewer lookups by document id, so repeat fetches of a PDF skip the DB.
+        self.document_cache = TTLCache(document_cache_size, document_cache_ttl)
+        self.ingest_queue = IngestQueue(rag, workers=ingest_workers, max_pending=ingest_queue_size)
+        self.cleanup = Cleanup(rag, self.storage_path, self.document_cache)
+        self.reaper = TempCollectionReaper(rag, interval=reaper_interval, ttl=temp_collection_ttl)
+        self.models = ModelReadiness(llm, warmup=warmup, retry_interval=model_retry_interval)
+
+    def status(self) -> dict:
+        """Readiness of the models and the vector store, as reported by ``/health``."""
+        status = self.models.status()
+        status["vector_store"] = self.rag.store_status()
+        status["ready"] = status["ready"] and status["vector_store"]["state"] == "ready"
+        return status
+
+    def storage_path(self, doc_id: int) -> str:
+        """Where the PDF of document *doc_id* is kept."""
+        return os.path.join(self.storage_dir, f"{doc_id}.pdf")
+
+    async def start(self) -> None:
+        # Pick up ingestion jobs interrupted by the previous shutdown.
+        self.ingest_queue.resume()
+        self.reaper.start()
+        self.models.start()
+
+    async def aclose(self) -> None:
+        await self.models.stop()
+        self.reaper.stop()
+        self.ingest_queue.shutdown()
+        await self.allm.aclose()
+
+
+def _optional_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def build_runtime() -> Runtime:
+    """Build the runtime from the environment (see the README for the variables)."""
+    ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    chat_model = os.getenv("OLLAMA_CHAT_MODEL", "llama3")
+    embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+    keep_alive = keep_alive_value(os.getenv("OLLAMA_KEEP_ALIVE"))
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    scheduler = (
+        LLMScheduler(
+            limit=max_concurrency,
+            limits=parse_limits(os.getenv("LLM_MODEL_CONCURRENCY")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+        )
+        if max_concurrency > 0
+        else None
+    )
+
+    llm = LLM(ollama_url, chat_model, embed_model, keep_alive=keep_alive, scheduler=scheduler)
+    allm = AsyncLLM(
+        ollama_url,
+        chat_model,
+        embed_model,
+        max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20")),
+        max_keepalive=int(os.getenv("OLLAMA_MAX_KEEPALIVE", "10")),
+        timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")),
+        connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+        keep_alive=keep_alive,
+        scheduler=scheduler,
+    )
+    extractor = PdfExtractor(
+        workers=int(os.getenv("PDF_EXTRACT_WORKERS", "2")),
+        pages_per_task=int(os.getenv("PDF_EXTRACT_PAGES_PER_TASK", "8")),
+        max_inflight=_optional_int("PDF_EXTRACT_MAX_INFLIGHT"),
+        max_tasks_per_child=_optional_int("PDF_EXTRACT_TASKS_PER_CHILD"),
+        memory_limit_mb=_optional_int("PDF_EXTRACT_MEMORY_MB"),
+    )
+    rag = RAG(
+        llm,
+        os.getenv("CHROMA_URL", "http://localhost:8000"),
+        int(os.getenv("EMBED_BATCH_SIZE", "32")),
+        allm=allm,
+        query_cache_size=int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024")),
+        query_cache_ttl=float(os.getenv("QUERY_EMBED_CACHE_TTL", "600")),
+        answer_cache=SemanticCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        )
+        if os.getenv("ANSWER_CACHE", "off") == "on"
+        else None,
+        extractor=extractor,
+        context=ContextBuilder(
+            budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "3072")),
+            min_chunks=int(os.getenv("PROMPT_MIN_CHUNKS", "2")),
+        ),
+        min_similarity=float(os.environ["RETRIEVAL_MIN_SIMILARITY"])
+        if os.getenv("RETRIEVAL_MIN_SIMILARITY")
+        else None,
+        mmr_diversity=float(os.getenv("RETRIEVAL_MMR_DIVERSITY", "0")) or None,
+        distance_space=os.getenv("CHROMA_DISTANCE_SPACE", "l2"),
+        hybrid=os.getenv("HYBRID_SEARCH", "off") == "on",
+        rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+        store=vector_store(),
+        metadata_text=os.getenv("CHUNK_TEXT_IN_METADATA", "on") == "on",
+    )
+    classifier = build_intent_classifier(
+        allm,
+        backend=os.getenv("INTENT_CLASSIFIER", "centroid"),
+        threshold=float(os.getenv("INTENT_FALLBACK_THRESHOLD", "0.6")),
+        history=lambda: db.labelled_messages(float(os.getenv("INTENT_TRAINING_MIN_CONFIDENCE", "0.8"))),
+        embed=rag.aembed_query,
+        refit_interval=float(os.getenv("INTENT_REFIT_INTERVAL", "3600")),
+    )
+    return Runtime(
+        llm,
+        allm,
+        rag,
+        classifier,
+        storage_dir=os.getenv("STORAGE_DIR", "./storage"),
+        ingest_workers=int(os.getenv("INGEST_WORKERS", "2")),
+        ingest_queue_size=int(os.getenv("INGEST_QUEUE_SIZE", "32")),
+        reaper_interval=float(os.getenv("TEMP_REAPER_INTERVAL", "3600")),
+        temp_collection_ttl=float(os.getenv("TEMP_COLLECTION_TTL", "86400")),
+        warmup=os.getenv("MODEL_WARMUP", "off") == "on",
+        model_retry_interval=float(os.getenv("MODEL_CHECK_RETRY", "30")),
+        document_cache_size=int(os.getenv("DOC_META_CACHE_SIZE", "1024")),
+        document_cache_ttl=float(os.getenv("DOC_META_CACHE_TTL", "300")),
+    )
+
+
+_runtime: Optional[Runtime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> Runtime:
+    """Return the process-wide runtime, building it on first use."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = build_runtime()
+        return _runtime
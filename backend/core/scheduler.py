@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, Optional
+
+from core.timing import metrics
+
+# Highest priority first.
+CHAT = "chat"
+INTENT = "intent"
+INGEST = "ingest"
+LANES = (CHAT, INTENT, INGEST)
+
+
+class LLMQueueFull(RuntimeError):
+    """Raised instead of queueing a request when its model's queue is full."""
+
+    def __init__(self, model: str, lane: str, retry_after: int) -> None:
+        super().__init__(f"Too many queued {lane} requests for {model}; retry in {retry_after}s")
+        self.model = model
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake: Callable[[], None]) -> None:
+        self.wake = wake
+        self.granted = False
+
+
+class _ModelQueue:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active = 0
+        self.waiting: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        # Moving averages, in seconds, of how long a slot is held and of how
+        # long each lane waits for one.
+        self.hold = 1.0
+        self.wait = {lane: 0.0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+
+    def queued(self, exclude: Iterable[str] = ()) -> int:
+        return sum(len(waiters) for lane, waiters in self.waiting.items() if lane not in exclude)
+
+
+class LLMScheduler:
+    """Admission control for requests to the models of one Ollama server.
+
+    At most ``limit`` requests per model (or its entry in ``limits``) run at
+    once; the rest wait in lanes that are served strictly in the order of
+    :data:`LANES`, so interactive chat goes before intent classification and
+    both go before ingestion embeddings. Once ``max_queue`` requests wait for
+    a model, further requests are rejected with :class:`LLMQueueFull`, whose
+    ``retry_after`` estimates when a slot frees up. Lanes in ``unbounded``
+    (ingestion, whose concurrency the ingest workers already bound) always
+    wait instead and don't count towards ``max_queue``.
+
+    Slots are taken with :meth:`slot` from threads and :meth:`aslot` from
+    coroutines; both kinds share the same limits.
+    """
+
+    def __init__(
+        self,
+        limit: int = 4,
+        limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 64,
+        unbounded: Iterable[str] = (INGEST,),
+    ) -> None:
+        self.limit = max(1, limit)
+        self.limits = {model: max(1, n) for model, n in (limits or {}).items()}
+        self.max_queue = max_queue
+        self.unbounded = set(unbounded)
+        self._models: Dict[str, _ModelQueue] = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._models.get(model)
+        if queue is None:
+            queue = self._models[model] = _ModelQueue(self.limits.get(model, self.limit))
+        return queue
+
+    def _enter(self, model: str, lane: str, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a slot, or return the waiter queued for one."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane!r}")
+        with self._lock:
+            queue = self._queue(model)
+            if queue.active < queue.limit and not queue.queued():
+                queue.active += 1
+                return None
+            # Unbounded lanes are served last, so they neither count against
+            # the limit nor delay the requests it protects.
+            queued = queue.queued(exclude=self.unbounded)
+            if lane not in self.unbounded and queued >= self.max_queue:
+                queue.rejected[lane] += 1
+                retry_after = max(1, math.ceil(queue.hold * (queued + 1) / queue.limit))
+                metrics.inc("sapid_llm_rejected_total", model=model, lane=lane)
+                raise LLMQueueFull(model, lane, retry_after)
+            waiter = _Waiter(wake)
+            queue.waiting[lane].append(waiter)
+            metrics.set("sapid_llm_queue_depth", len(queue.waiting[lane]), model=model, lane=lane)
+            return waiter
+
+    def _granted(self, model: str, lane: str, waited: float) -> None:
+        with self._lock:
+            queue = self._queue(model)
+            queue.wait[lane] += 0.2 * (waited - queue.wait[lane])
+        metrics.observe("sapid_llm_queue_wait_seconds", waited, model=model, lane=lane)
+
+    def _leave(self, model: str, held: float) -> None:
+        """Hand the slot to the next waiter, or free it."""
+        with self._lock:
+            queue = self._queue(model)
+            queue.hold += 0.2 * (held - queue.hold)
+            for lane in LANES:
+                if queue.waiting[lane]:
+                    waiter = queue.waiting[lane].popleft()
+                    metrics.set("sapid_llm_queue_depth", len(queue.waiting[lane]), model=model, lane=lane)
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            queue.active -= 1
+
+    def _abandon(self, model: str, lane: str, waiter: _Waiter) -> None:
+        """Withdraw a cancelled waiter, passing its slot on if it was granted meanwhile."""
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queue(model)
+                queue.waiting[lane].remove(waiter)
+                metrics.set("sapid_llm_queue_depth", len(queue.waiting[lane]), model=model, lane=lane)
+                return
+        self._leave(model, 0.0)
+
+    @contextmanager
+    def slot(self, model: str, lane: str) -> Iterator[None]:
+        """Hold one of *model*'s slots for the block, waiting in *lane* if needed."""
+        started = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enter(model, lane, event.set)
+        if waiter is not None:
+            try:
+                event.wait()
+            except BaseException:
+                self._abandon(model, lane, waiter)
+                raise
+            self._granted(model, lane, time.perf_counter() - started)
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._leave(model, time.perf_counter() - acquired)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, lane: str) -> AsyncIterator[None]:
+        """Async variant of :meth:`slot`; waiting doesn't block the event loop."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(model, lane, wake)
+        if waiter is not None:
+            try:
+                await future
+            except BaseException:
+                self._abandon(model, lane, waiter)
+                raise
+            self._granted(model, lane, time.perf_counter() - started)
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._leave(model, time.perf_counter() - acquired)
+
+    def stats(self) -> dict:
+        """Per model: slot limit, requests running, queued and rejected per lane, mean wait."""
+        with self._lock:
+            return {
+                model: {
+                    "limit": queue.limit,
+                    "active": queue.active,
+                    "queued": {lane: len(queue.waiting[lane]) for lane in LANES},
+                    "wait_ms": {lane: round(queue.wait[lane] * 1000, 1) for lane in LANES},
+                    "rejected": dict(queue.rejected),
+                }
+                for model, queue in self._models.items()
+            }
+
+
+def parse_limits(value: Optional[str]) -> Dict[str, int]:
+    """Parse ``"llama3=2,nomic-embed-text=8"`` into per-model limits."""
+    limits = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            model, _, limit = item.rpartition("=")
+            limits[model.strip()] = int(limit)
+    return limits
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class RecursiveTextSplitter:
+    """Split text into chunks of at most ``chunk_size`` characters.
+
+    Produces the same chunks as langchain's ``RecursiveCharacterTextSplitter``
+    with its defaults (separators kept at the start of the following piece,
+    chunks stripped), so documents ingested before keep their chunk ids and
+    hashes, without importing langchain. Text is split on the first separator
+    it contains; pieces still too long are split on the next one, and pieces
+    are merged back up to ``chunk_size`` with ``chunk_overlap`` characters
+    carried over from the previous chunk.
+    """
+
+    def __init__(
+        self, chunk_size: int = 500, chunk_overlap: int = 50, separators: Sequence[str] = SEPARATORS
+    ) -> None:
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+
+    def split_text(self, text: str) -> List[str]:
+        return self._split(text, self.separators)
+
+    def _split(self, text: str, separators: List[str]) -> List[str]:
+        separator, remaining = separators[-1], []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if candidate in text:
+                separator, remaining = candidate, separators[i + 1 :]
+                break
+
+        if separator:
+            first, *rest = text.split(separator)
+            pieces = [first] + [separator + piece for piece in rest]
+        else:
+            pieces = list(text)
+
+        chunks: List[str] = []
+        short: List[str] = []
+        for piece in pieces:
+            if not piece:
+                continue
+            if len(piece) < self.chunk_size:
+                short.append(piece)
+                continue
+            if short:
+                chunks.extend(self._merge(short))
+                short = []
+            if remaining:
+                chunks.extend(self._split(piece, remaining))
+            else:
+                chunks.append(piece)
+        if short:
+            chunks.extend(self._merge(short))
+        return chunks
+
+    def _merge(self, pieces: List[str]) -> List[str]:
+        chunks: List[str] = []
+        current: List[str] = []
+        total = 0
+        for piece in pieces:
+            if total + len(piece) > self.chunk_size and current:
+                chunk = _join(current)
+                if chunk is not None:
+                    chunks.append(chunk)
+                while total > self.chunk_overlap or (total + len(piece) > self.chunk_size and total > 0):
+                    total -= len(current.pop(0))
+            current.append(piece)
+            total += len(piece)
+        chunk = _join(current)
+        if chunk is not None:
+            chunks.append(chunk)
+        return chunks
+
+
+def _join(pieces: List[str]) -> Optional[str]:
+    text = "".join(pieces).strip()
+    return text or None
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_UNTIMED = nullcontext()
+
+
+class StageTimer:
+    """Collect wall-clock durations of named stages of a request, in ms."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000
+
+    def mark(self, name: str) -> None:
+        """Record the time elapsed since the timer was created under *name*."""
+        self.stages[name] = (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(ms, 1) for name, ms in self.stages.items()}
+
+
+class _Family:
+    def __init__(self, kind: str, help: str, buckets: Sequence[float] = ()) -> None:
+        self.kind = kind
+        self.help = help
+        self.buckets = tuple(buckets)
+        # Counters map labels to a value; histograms to bucket counts
+        # followed by the sum and the count.
+        self.series: Dict[LabelKey, List[float]] = {}
+
+
+class _Timed:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class Metrics:
+    """Counters and histograms kept in memory and rendered for Prometheus.
+
+    Metric families are declared up front with :meth:`counter`,
+    :meth:`gauge` and :meth:`histogram`. While ``enabled`` is false,
+    :meth:`inc`, :meth:`set`, :meth:`observe` and :meth:`time` return
+    immediately, so instrumented code costs an attribute check.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> None:
+        self._families[name] = _Family("counter", help)
+
+    def gauge(self, name: str, help: str) -> None:
+        self._families[name] = _Family("gauge", help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self._families[name] = _Family("histogram", help, buckets)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        family = self._families[name]
+        with self._lock:
+            series = family.series.setdefault(key, [0.0])
+            series[0] += value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        family = self._families[name]
+        with self._lock:
+            family.series[key] = [float(value)]
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        family = self._families[name]
+        with self._lock:
+            series = family.series.get(key)
+            if series is None:
+                series = family.series[key] = [0.0] * (len(family.buckets) + 2)
+            series[bisect.bisect_left(family.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, name: str, **labels: str):
+        """Context manager observing the duration of its block, in seconds."""
+        if not self.enabled:
+            return _UNTIMED
+        return _Timed(self, name, labels)
+
+    def value(self, name: str, **labels: str) -> Optional[List[float]]:
+        """The raw series for *labels*: ``[value]`` or ``[*buckets, sum, count]``."""
+        series = self._families[name].series.get(tuple(sorted(labels.items())))
+        return list(series) if series is not None else None
+
+    def reset(self) -> None:
+        with self._lock:
+            for family in self._families.values():
+                family.series.clear()
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, family in sorted(self._families.items()):
+                lines.append(f"# HELP {name} {family.help}")
+                lines.append(f"# TYPE {name} {family.kind}")
+                for key, series in sorted(family.series.items()):
+                    if family.kind != "histogram":
+                        lines.append(f"{name}{_labels(key)} {_number(series[0])}")
+                        continue
+                    cumulative = 0.0
+                    for bound, count in zip((*family.buckets, math.inf), series):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {_number(cumulative)}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(series[-2])}")
+                    lines.append(f"{name}_count{_labels(key)} {_number(series[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = Metrics(enabled=os.getenv("METRICS", "off") == "on")
+
+metrics.histogram("sapid_chat_stage_seconds", "Duration of each stage of a /chat request.")
+metrics.counter("sapid_chat_requests_total", "Chat requests by answer cache outcome.")
+metrics.histogram("sapid_retrieved_chunks", "Chunks placed in the prompt per chat request.", COUNT_BUCKETS)
+metrics.histogram("sapid_search_seconds", "Duration of one vector or BM25 search of one collection.")
+metrics.histogram("sapid_llm_request_seconds", "Duration of non-streamed Ollama requests.")
+metrics.counter("sapid_llm_tokens_total", "Tokens evaluated by Ollama in streamed chats.")
+metrics.histogram("sapid_llm_queue_wait_seconds", "Time requests waited for an Ollama slot.")
+metrics.gauge("sapid_llm_queue_depth", "Requests waiting for an Ollama slot.")
+metrics.counter("sapid_llm_rejected_total", "Requests rejected because the Ollama queue was full.")
+metrics.histogram("sapid_db_write_seconds", "Duration of chat message writes.")
+metrics.counter("sapid_ingest_pages_total", "Pages of ingested PDFs.")
+metrics.counter("sapid_ingest_chunks_total", "Chunks of ingested PDFs by outcome.")
+metrics.histogram("sapid_ingest_seconds", "Duration of ingesting one PDF.", LATENCY_BUCKETS + (120.0, 300.0, 600.0))
+metrics.histogram("sapid_ingest_chunks_per_second", "Embedding throughput of one PDF ingestion.", RATE_BUCKETS)
@@ -0,0 +1,644 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,62}$")
+
+
+class VectorCollection(Protocol):
+    """The part of Chroma's collection API that ``RAG`` relies on."""
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None) -> None: ...
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> dict: ...
+
+    def delete(self, ids=None, where=None) -> None: ...
+
+    def count(self) -> int: ...
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None) -> dict: ...
+
+
+class VectorStore(Protocol):
+    """The part of Chroma's client API that ``RAG`` relies on.
+
+    ``chromadb.HttpClient`` satisfies it as is; :class:`LocalVectorStore` is
+    the in-process alternative.
+    """
+
+    def get_or_create_collection(self, name: str) -> VectorCollection: ...
+
+    def list_collections(self) -> Sequence[Any]: ...
+
+    def delete_collection(self, name: str) -> None: ...
+
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+
+def matches(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    """Evaluate a Chroma-style ``where`` filter against *metadata*.
+
+    Supports field equality, the ``$eq``/``$ne``/``$gt``/``$gte``/``$lt``/
+    ``$lte``/``$in``/``$nin`` operators and ``$and``/``$or``.
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, arg in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {op!r}")
+                if not _OPERATORS[op](value, arg):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _IVFIndex:
+    """Inverted-file index: rows bucketed under their nearest k-means centroid.
+
+    Searching scores the ``nprobe`` closest buckets only. Rows added after the
+    build are assigned to their nearest existing centroid.
+    """
+
+    def __init__(self, vectors: np.ndarray, rows: np.ndarray, capacity: int, iterations: int = 10) -> None:
+        nlist = max(1, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(0)
+        sample = rows[rng.choice(len(rows), min(len(rows), 64 * nlist), replace=False)]
+        data = np.asarray(vectors[sample])
+        centroids = data[rng.choice(len(data), nlist, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalise(centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.built_rows = len(rows)
+        self.assignment = np.full(capacity, -1, dtype=np.int32)
+        self.lists = [array("I") for _ in range(nlist)]
+        for start in range(0, len(rows), 65536):
+            self.assign(rows[start:start + 65536], vectors[rows[start:start + 65536]])
+
+    def assign(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        if len(self.assignment) <= rows.max(initial=-1):
+            grown = np.full(max(len(self.assignment) * 2, rows.max() + 1), -1, dtype=np.int32)
+            grown[: len(self.assignment)] = self.assignment
+            self.assignment = grown
+        labels = np.argmax(np.asarray(vectors) @ self.centroids.T, axis=1)
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            if self.assignment[row] == label:
+                continue
+            self.assignment[row] = label
+            self.lists[label].append(row)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+        parts = []
+        for label in probe.tolist():
+            rows = np.frombuffer(self.lists[label], dtype=np.uint32).astype(np.int64)
+            # Rows that were re-assigned on upsert stay in their old bucket,
+            # and one that moved back is listed there twice.
+            parts.append(rows[self.assignment[rows] == label])
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class _Int8Codec:
+    """Rows scaled to fill ``[-127, 127]``; a quarter of the float32 size."""
+
+    name = "int8"
+    dtype = np.int8
+
+    def width(self, dim: int) -> int:
+        return dim
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        scale = 127.0 / np.maximum(np.abs(vectors).max(axis=1, keepdims=True), 1e-12)
+        return np.round(vectors * scale).astype(np.int8)
+
+    def norms(self, codes: np.ndarray) -> Optional[np.ndarray]:
+        return np.linalg.norm(codes.astype(np.float32), axis=1)
+
+    def score(self, codes: np.ndarray, query: np.ndarray, norms: Optional[np.ndarray]) -> np.ndarray:
+        # Dividing by the code norm undoes the per-row scale: ~cosine.
+        return (codes.astype(np.float32) @ query) / np.maximum(norms, 1e-12)
+
+
+class _BinaryCodec:
+    """One sign bit per dimension; a 32nd of the float32 size."""
+
+    name = "binary"
+    dtype = np.uint8
+
+    def width(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=1)
+
+    def norms(self, codes: np.ndarray) -> Optional[np.ndarray]:
+        return None
+
+    def score(self, codes: np.ndarray, query: np.ndarray, norms: Optional[np.ndarray]) -> np.ndarray:
+        # Negated Hamming distance between sign patterns.
+        bits = np.packbits(query > 0)
+        return -_POPCOUNT[np.bitwise_xor(codes, bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+
+_CODECS = {"int8": _Int8Codec, "binary": _BinaryCodec}
+
+# Rows scored per block when scanning quantized codes, bounding the float32
+# copy each block needs.
+_SCAN_BLOCK = 32768
+
+
+def _map_matrix(path: str, dtype, width: int, capacity: int) -> Optional[np.memmap]:
+    # numpy can't map an empty file; the first upsert grows it.
+    if not capacity:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, width))
+
+
+def _resize_file(path: str, nbytes: int) -> None:
+    with open(path, "ab"):
+        pass
+    with open(path, "r+b") as fh:
+        fh.truncate(nbytes)
+
+
+class LocalCollection:
+    """A collection stored as a memory-mapped float32 matrix plus a log.
+
+    ``vectors.f32`` holds one unit-normalised row per chunk and grows by
+    doubling; ``log.jsonl`` records ids, documents and metadata as appended
+    ``put``/``del`` entries and is replayed on open. Search is exact cosine
+    over the live rows, or over the ``nprobe`` nearest IVF buckets once the
+    collection has ``ivf_min_rows`` rows and ``index="ivf"``. Distances are
+    reported the way Chroma does for ``space``.
+
+    With ``quantization`` set to ``"int8"`` or ``"binary"`` a second, smaller
+    matrix of codes is kept next to the floats. Searches scan the codes and
+    re-rank the best ``rerank_factor * n_results`` rows with the float
+    vectors, so only those rows of the float file are paged in.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        space: str = "l2",
+        index: str = "flat",
+        ivf_min_rows: int = 20000,
+        nprobe: int = 8,
+        quantization: Optional[str] = None,
+        rerank_factor: int = 4,
+    ) -> None:
+        self.name = name
+        self.path = path
+        self.space = space
+        self.index = index
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        if quantization and quantization not in _CODECS:
+            raise ValueError(f"Unknown quantization {quantization!r}")
+        self._codec = _CODECS[quantization]() if quantization else None
+        self.rerank_factor = max(1, rerank_factor)
+        self._lock = threading.RLock()
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[dict]] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._codes: Optional[np.memmap] = None
+        self._code_norms: Optional[np.ndarray] = None
+        self._ivf: Optional[_IVFIndex] = None
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # -- storage ---------------------------------------------------------
+
+    @property
+    def _vector_file(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _code_file(self) -> str:
+        return os.path.join(self.path, f"codes.{self._codec.name}")
+
+    @property
+    def _log_file(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+
+    def _load(self) -> None:
+        header = os.path.join(self.path, "collection.json")
+        if os.path.exists(header):
+            with open(header) as fh:
+                self._dim = json.load(fh)["dim"]
+        if os.path.exists(self._log_file):
+            with open(self._log_file) as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    row = entry["row"]
+                    while len(self._ids) <= row:
+                        self._ids.append(None)
+                        self._documents.append(None)
+                        self._metadatas.append(None)
+                    previous = self._ids[row]
+                    if previous is not None:
+                        self._rows.pop(previous, None)
+                    if entry["op"] == "put":
+                        self._ids[row] = entry["id"]
+                        self._documents[row] = entry.get("document")
+                        self._metadatas[row] = entry.get("metadata")
+                        self._rows[entry["id"]] = row
+                    else:
+                        self._ids[row] = self._documents[row] = self._metadatas[row] = None
+        if self._dim is not None:
+            self._capacity = os.path.getsize(self._vector_file) // (4 * self._dim)
+            self._map()
+            self._alive = np.zeros(self._capacity, dtype=bool)
+            self._alive[list(self._rows.values())] = True
+            if len(self._ids) - len(self._rows) > len(self._rows):
+                self._compact()
+
+    def _map(self) -> None:
+        self._vectors = _map_matrix(self._vector_file, np.float32, self._dim, self._capacity)
+        if self._codec is None:
+            return
+        width = self._codec.width(self._dim)
+        expected = self._capacity * width * np.dtype(self._codec.dtype).itemsize
+        stale = not os.path.exists(self._code_file) or os.path.getsize(self._code_file) != expected
+        if stale:
+            # Quantization was switched on (or changed) for an existing collection.
+            _resize_file(self._code_file, expected)
+        self._codes = _map_matrix(self._code_file, self._codec.dtype, width, self._capacity)
+        if self._codes is None:
+            self._code_norms = None
+            return
+        if stale:
+            for start in range(0, self._capacity, _SCAN_BLOCK):
+                self._codes[start : start + _SCAN_BLOCK] = self._codec.encode(
+                    np.asarray(self._vectors[start : start + _SCAN_BLOCK])
+                )
+            self._codes.flush()
+        norms = [
+            self._codec.norms(np.asarray(self._codes[start : start + _SCAN_BLOCK]))
+            for start in range(0, self._capacity, _SCAN_BLOCK)
+        ]
+        self._code_norms = None if norms[0] is None else np.concatenate(norms)
+
+    def _unmap(self) -> None:
+        for matrix in (self._vectors, self._codes):
+            if matrix is not None:
+                matrix.flush()
+        self._vectors = self._codes = None
+
+    def _ensure_capacity(self, rows: int, dim: int) -> None:
+        if self._dim is None:
+            self._dim = dim
+            with open(os.path.join(self.path, "collection.json"), "w") as fh:
+                json.dump({"dim": dim, "space": self.space}, fh)
+            open(self._vector_file, "wb").close()
+        elif dim != self._dim:
+            raise ValueError(f"Embedding dimension {dim} does not match collection dimension {self._dim}")
+        if rows <= self._capacity:
+            return
+        self._unmap()
+        self._capacity = max(1024, self._capacity * 2, rows)
+        _resize_file(self._vector_file, self._capacity * 4 * self._dim)
+        if self._codec is not None:
+            width = self._codec.width(self._dim)
+            _resize_file(self._code_file, self._capacity * width * np.dtype(self._codec.dtype).itemsize)
+        self._map()
+        alive = np.zeros(self._capacity, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _append_log(self, entries: List[dict]) -> None:
+        with open(self._log_file, "a") as fh:
+            fh.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def _compact(self) -> None:
+        """Rewrite the vector file and the log with live rows only."""
+        live = sorted(self._rows.values())
+        vectors = np.array(self._vectors[live]) if live else np.zeros((0, self._dim), np.float32)
+        entries = [
+            {
+                "op": "put",
+                "row": new,
+                "id": self._ids[old],
+                "document": self._documents[old],
+                "metadata": self._metadatas[old],
+            }
+            for new, old in enumerate(live)
+        ]
+        self._unmap()
+        capacity = max(1024, len(live))
+        tmp_vectors = self._vector_file + ".tmp"
+        _resize_file(tmp_vectors, capacity * 4 * self._dim)
+        staged = np.memmap(tmp_vectors, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        staged[: len(live)] = vectors
+        staged.flush()
+        del staged
+        with open(self._log_file + ".tmp", "w") as fh:
+            fh.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        os.replace(tmp_vectors, self._vector_file)
+        os.replace(self._log_file + ".tmp", self._log_file)
+        if self._codec is not None:
+            # Re-encoded from the compacted floats by ``_map``.
+            os.remove(self._code_file)
+
+        self._ids = [entry["id"] for entry in entries]
+        self._documents = [entry["document"] for entry in entries]
+        self._metadatas = [entry["metadata"] for entry in entries]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._capacity = capacity
+        self._map()
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[: len(live)] = True
+        self._ivf = None
+
+    @property
+    def capacity(self) -> int:
+        """Rows allocated in the vector file (live, dead and spare)."""
+        return self._capacity
+
+    def nbytes(self) -> Dict[str, int]:
+        """Bytes held by the float vectors, the quantized codes and the log."""
+        with self._lock:
+            sizes = {"vectors": self._capacity * 4 * (self._dim or 0), "codes": 0, "log": 0}
+            if self._codec is not None and self._dim:
+                sizes["codes"] = self._capacity * self._codec.width(self._dim) * np.dtype(self._codec.dtype).itemsize
+            if os.path.exists(self._log_file):
+                sizes["log"] = os.path.getsize(self._log_file)
+            return sizes
+
+    # -- Chroma-compatible API -------------------------------------------
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None) -> None:
+        vectors = _normalise(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            rows = []
+            for chunk_id in ids:
+                row = self._rows.get(chunk_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(chunk_id)
+                    self._documents.append(None)
+                    self._metadatas.append(None)
+                    self._rows[chunk_id] = row
+                rows.append(row)
+            self._ensure_capacity(len(self._ids), vectors.shape[1])
+            rows_array = np.asarray(rows, dtype=np.int64)
+            self._vectors[rows_array] = vectors
+            self._vectors.flush()
+            if self._codec is not None:
+                codes = self._codec.encode(vectors)
+                self._codes[rows_array] = codes
+                self._codes.flush()
+                if self._code_norms is not None:
+                    self._code_norms[rows_array] = self._codec.norms(codes)
+            self._alive[rows_array] = True
+            entries = []
+            for row, chunk_id, document, metadata in zip(rows, ids, documents, metadatas):
+                self._documents[row] = document
+                self._metadatas[row] = metadata
+                entries.append(
+                    {"op": "put", "row": row, "id": chunk_id, "document": document, "metadata": metadata}
+                )
+            self._append_log(entries)
+            if self._ivf is not None:
+                self._ivf.assign(rows_array, vectors)
+    def _select(self, ids=None, where=None) -> List[int]:
+        if ids is not None:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        else:
+            rows = sorted(self._rows.values())
+        if where:
+            rows = [row for row in rows if matches(self._metadatas[row], where)]
+        return rows
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            rows = self._select(ids, where)
+            if not rows:
+                return
+            for row in rows:
+                del self._rows[self._ids[row]]
+                self._ids[row] = self._documents[row] = self._metadatas[row] = None
+            self._alive[rows] = False
+            self._append_log([{"op": "del", "row": row} for row in rows])
+            dead = len(self._ids) - len(self._rows)
+            if dead > 1024 and dead > len(self._rows):
+                self._compact()
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> dict:
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            rows = self._select(ids, where)
+            start = offset or 0
+            rows = rows[start : start + limit if limit else None]
+            return self._result(rows, include)
+
+    def _result(self, rows: List[int], include: Sequence[str], distances=None) -> dict:
+        result: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = (
+                np.asarray(self._vectors[rows]) if rows else np.zeros((0, self._dim or 0), np.float32)
+            )
+        if distances is not None and "distances" in include:
+            result["distances"] = distances
+        return result
+
+    def _candidates(self, query: np.ndarray, where: Optional[dict]) -> np.ndarray:
+        live = len(self._rows)
+        if self.index == "ivf" and live >= self.ivf_min_rows:
+            if self._ivf is None or live > 2 * self._ivf.built_rows:
+                self._ivf = _IVFIndex(self._vectors, np.flatnonzero(self._alive), len(self._alive))
+            rows = self._ivf.candidates(query, self.nprobe)
+            rows = rows[self._alive[rows]]
+        else:
+            rows = None
+        if where:
+            allowed = np.asarray(self._select(where=where), dtype=np.int64)
+            rows = allowed if rows is None else np.intersect1d(rows, allowed)
+        return rows
+
+    def _approximate(self, query: np.ndarray, candidates: Optional[np.ndarray]) -> np.ndarray:
+        """Score *candidates* (all allocated rows if ``None``) on the codes."""
+        if candidates is not None:
+            norms = None if self._code_norms is None else self._code_norms[candidates]
+            return self._codec.score(np.asarray(self._codes[candidates]), query, norms)
+        used = len(self._ids)
+        blocks = []
+        for start in range(0, used, _SCAN_BLOCK):
+            stop = min(start + _SCAN_BLOCK, used)
+            norms = None if self._code_norms is None else self._code_norms[start:stop]
+            blocks.append(self._codec.score(np.asarray(self._codes[start:stop]), query, norms))
+        scores = np.concatenate(blocks)
+        scores[~self._alive[:used]] = -np.inf
+        return scores
+
+    def _scan(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int):
+        """Return candidate rows and their exact cosine scores (dead rows ``-inf``)."""
+        if self._codec is not None:
+            approx = self._approximate(query, candidates)
+            if candidates is None:
+                candidates = np.arange(len(approx))
+            shortlist = min(k * self.rerank_factor, int(np.isfinite(approx).sum()))
+            if not shortlist:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            best = np.argpartition(-approx, shortlist - 1)[:shortlist]
+            candidates = np.sort(candidates[best])
+            return candidates, np.asarray(self._vectors[candidates] @ query)
+        if candidates is None:
+            # Exact scan: score every allocated row, mask the dead.
+            used = len(self._ids)
+            scores = np.asarray(self._vectors[:used] @ query)
+            scores[~self._alive[:used]] = -np.inf
+            return np.arange(used), scores
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        return candidates, np.asarray(self._vectors[candidates] @ query)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None) -> dict:
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        queries = _normalise(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            for query in queries:
+                rows = np.empty(0, dtype=np.int64)
+                scores = np.empty(0, dtype=np.float32)
+                if self._rows:
+                    candidates, scores = self._scan(query, self._candidates(query, where), n_results)
+                    k = min(n_results, int(np.isfinite(scores).sum()))
+                    top = np.argpartition(-scores, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+                    top = top[np.argsort(-scores[top])]
+                    rows, scores = candidates[top], scores[top]
+                distances = (2.0 - 2.0 * scores if self.space == "l2" else 1.0 - scores).tolist()
+                result = self._result(rows.tolist(), include, distances)
+                for key in out:
+                    if key in result:
+                        out[key].append(result[key])
+        return {key: value for key, value in out.items() if key == "ids" or key in include}
+
+
+class LocalVectorStore:
+    """In-process vector store keeping each collection under ``path/<name>``."""
+
+    def __init__(self, path: str, **options: Any) -> None:
+        self.path = path
+        self.options = options
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, name: str) -> str:
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid collection name {name!r}")
+        return os.path.join(self.path, name)
+
+    def get_or_create_collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = LocalCollection(self._dir(name), name, **self.options)
+                self._collections[name] = collection
+            return collection
+
+    def list_collections(self) -> List[str]:
+        with self._lock:
+            on_disk = {
+                entry for entry in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, entry))
+            }
+            return sorted(on_disk | set(self._collections))
+
+    def delete_collection(self, name: str) -> None:
+        path = self._dir(name)
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is None and not os.path.isdir(path):
+                raise ValueError(f"Collection {name} does not exist.")
+            if collection is not None:
+                with collection._lock:
+                    collection._unmap()
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_stores: Dict[str, LocalVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_local_store(path: str, **options: Any) -> LocalVectorStore:
+    """Return the process-wide store for *path*, so every ``RAG`` shares it."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = LocalVectorStore(path, **options)
+        return store
+
+
+def vector_store() -> Optional[LocalVectorStore]:
+    """The store selected by ``VECTOR_STORE``; ``None`` means the Chroma server."""
+    if os.getenv("VECTOR_STORE", "chroma") != "local":
+        return None
+    return open_local_store(
+        os.getenv("VECTOR_STORE_PATH", "./storage/vectors"),
+        space=os.getenv("CHROMA_DISTANCE_SPACE", "l2"),
+        index=os.getenv("VECTOR_INDEX", "flat"),
+        ivf_min_rows=int(os.getenv("VECTOR_IVF_MIN_ROWS", "20000")),
+        nprobe=int(os.getenv("VECTOR_IVF_NPROBE", "8")),
+        quantization=os.getenv("VECTOR_QUANTIZATION") or None,
+        rerank_factor=int(os.getenv("VECTOR_RERANK_FACTOR", "4")),
+    )
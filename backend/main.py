@@ -1,8 +1,14 @@
 
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 
 from api import chat, upload
+from core import db
+from core.runtime import get_runtime
+from core.scheduler import LLMQueueFull
+from core.timing import metrics
 
 from api import sessions
 from api import conversations
@@ -13,7 +19,26 @@ from api import email
 APP_VERSION = "1.0.0"
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models are checked, pulled and warmed in the background, so startup
+    # doesn't wait for Ollama; /health reports when they are ready.
+    runtime = get_runtime()
+    await runtime.start()
+    yield
+    await runtime.aclose()
+    await db.async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(LLMQueueFull)
+async def llm_queue_full(request: Request, exc: LLMQueueFull) -> JSONResponse:
+    # Shed load quickly instead of letting the request time out in the queue.
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)}
+    )
 
 app.include_router(chat.router, prefix="/chat")
 app.include_router(upload.router, prefix="/upload")
@@ -26,13 +51,27 @@ app.include_router(email.router, prefix="/email")
 
 @app.get("/health")
 def health() -> dict:
+    runtime = get_runtime()
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "version": APP_VERSION,
+        **runtime.status(),
+        "query_embedding_cache": runtime.rag.query_cache.stats(),
+        "answer_cache": runtime.rag.answer_cache.stats() if runtime.rag.answer_cache else None,
+        "db_pool": db.pool_stats(),
+        "llm_queue": runtime.scheduler.stats() if runtime.scheduler else None,
     }
 
 
+@app.get("/metrics")
+def prometheus_metrics() -> Response:
+    """Stage timings, token counts and ingestion throughput for Prometheus."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (set METRICS=on)")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/demo")
 def demo() -> dict:
     """Return mock data for demo mode."""
@@ -0,0 +1,114 @@
+"""Measure how long importing the backend takes, and fail on regressions.
+
+Runs ``python -X importtime -c "import main"`` ``--runs`` times in fresh
+processes (against a throwaway SQLite database, so no server is needed) and
+reports the median total import time and the slowest top-level imports of the
+median run. It then starts the app once (running its lifespan) and requests
+``/health``. Exits non-zero if the median exceeds ``--budget-ms`` or if any of
+the ``--forbid`` modules, which should only load on first use, were imported
+by either step.
+
+    python scripts/bench_imports.py --budget-ms 1500
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+LAZY = "chromadb,langchain,langchain_text_splitters,pypdf"
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _importtime(backend: Path, module: str, env: dict) -> dict:
+    """Return ``{module: (cumulative µs, depth)}`` for one cold import of *module*."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            times[name] = (int(cumulative), len(indent) // 2)
+    return times
+
+
+_STARTUP = """
+import sys
+import main
+from core import db
+from fastapi.testclient import TestClient
+
+db.SQLModel.metadata.create_all(db.engine)
+with TestClient(main.app) as client:
+    client.get("/health")
+print("\\n".join(sys.modules))
+"""
+
+
+def _loaded_after_startup(backend: Path, env: dict) -> set:
+    """Return the modules loaded once the app has started and served ``/health``."""
+    proc = subprocess.run(
+        [sys.executable, "-c", _STARTUP], cwd=backend, env=env, capture_output=True, text=True, check=True
+    )
+    return set(proc.stdout.split())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--forbid", default=LAZY, help="comma-separated modules that must not be imported")
+    args = parser.parse_args()
+
+    backend = Path(__file__).resolve().parents[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "POSTGRES_URL": f"sqlite:///{tmp}/bench.db"}
+        # The first run warms the bytecode cache and the OS page cache.
+        _importtime(backend, args.module, env)
+        runs = [_importtime(backend, args.module, env) for _ in range(args.runs)]
+        started = _loaded_after_startup(backend, {**env, "MODEL_CHECK_RETRY": "0"})
+
+    totals = [run[args.module][0] / 1000 for run in runs]
+    median = statistics.median(totals)
+    run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    print(f"import {args.module}: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms")
+    print(f"\n{'ms':>8}  slowest imports below {args.module}")
+    children = sorted(
+        ((us, name) for name, (us, depth) in run.items() if depth == 1),
+        reverse=True,
+    )
+    for us, name in children[: args.top]:
+        print(f"{us / 1000:>8.1f}  {name}")
+
+    failures = []
+    forbid = [name for name in args.forbid.split(",") if name]
+    loaded = [name for name in forbid if name in run]
+    if loaded:
+        failures.append(f"imported eagerly: {', '.join(loaded)}")
+    loaded = [name for name in forbid if name in started]
+    if loaded:
+        failures.append(f"imported during startup: {', '.join(loaded)}")
+    if median > args.budget_ms:
+        failures.append(f"median {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure the BM25 index behind hybrid retrieval.
+
+Indexes ``--sizes`` synthetic chunks (manual-like sentences with part numbers
+and fault codes) and reports the build time, the memory the index holds, the
+median and p95 search latency and the cost of fusing a BM25 ranking with a
+vector ranking by reciprocal rank fusion. ``--heap`` also traces the Python
+heap held by the whole index (slow: tracing makes the build several times
+longer).
+
+    python scripts/bench_lexical.py --sizes 10000,100000,500000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+WORDS = (
+    "pump valve seal bearing filter pressure flow motor shaft impeller gasket "
+    "coupling housing inlet outlet leak noise vibration temperature alarm reset "
+    "replace inspect tighten bleed drain lubricate calibrate sensor relay fuse"
+).split()
+
+
+def _chunk(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(50, 90))
+    words.insert(rng.randrange(len(words)), f"E-{rng.randint(1, 999)}")
+    words.insert(rng.randrange(len(words)), f"{rng.randint(6000, 6400)}-2RS")
+    return " ".join(words)
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--heap", action="store_true", help="trace heap usage of a second build")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from core.lexical import BM25Index, reciprocal_rank_fusion
+
+    rng = random.Random(args.seed)
+    questions = [
+        f"{rng.choice(WORDS)} {rng.choice(WORDS)} fault E{rng.randint(1, 999)}"
+        for _ in range(args.queries)
+    ]
+
+    print(
+        f"{'chunks':>8} {'build s':>8} {'index MB':>9} {'heap MB':>8} "
+        f"{'p50 ms':>7} {'p95 ms':>7} {'rrf ms':>7}"
+    )
+    for size in (int(n) for n in args.sizes.split(",")):
+        texts = [_chunk(rng) for _ in range(size)]
+        items = [
+            (f"doc:{i}:0", text, {"doc_id": "doc", "page": i, "chunk_id": 0})
+            for i, text in enumerate(texts)
+        ]
+        started = time.perf_counter()
+        index = BM25Index()
+        index.add_many(items)
+        build = time.perf_counter() - started
+        heap = float("nan")
+        if args.heap:
+            # Chunk texts are allocated before tracing starts, so this is the
+            # index's own overhead (postings, key maps and bookkeeping).
+            tracemalloc.start()
+            traced = BM25Index()
+            traced.add_many(items)
+            heap = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del traced
+
+        latencies, fusion = [], []
+        for question in questions:
+            start = time.perf_counter()
+            hits = index.search(question, args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            reciprocal_rank_fusion([hits[::-1], hits])
+            fusion.append((time.perf_counter() - start) * 1000)
+
+        print(
+            f"{size:>8} {build:>8.2f} {index.nbytes() / 2**20:>9.1f} {heap / 2**20:>8.1f} "
+            f"{statistics.median(latencies):>7.2f} {_percentile(latencies, 0.95):>7.2f} "
+            f"{statistics.median(fusion):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Load-test /upload and /chat against local stand-ins for Ollama and Chroma.
+
+Starts ``scripts/fake_ollama.py`` on a thread and the backend under uvicorn
+in a subprocess, with a throwaway SQLite database and the local vector store
+(in ``/dev/shm`` when available) in place of Chroma, so nothing but this
+checkout is needed. Then:
+
+1. uploads ``--uploads`` generated PDFs of ``--pages`` pages to the global
+   collection, ``--upload-concurrency`` at a time, and waits for their
+   ingestion jobs to finish;
+2. runs ``--chat-requests`` /chat SSE streams from ``--chat-users``
+   concurrent users, after ``--warmup`` unmeasured chats per user.
+
+It reports p50/p95/p99 latency, time to first token (first ``content``
+event) and requests per second. ``--save`` writes the results as JSON;
+``--baseline`` compares against a saved run and exits non-zero when latency
+grows, or throughput drops, by more than ``--tolerance``.
+
+    python scripts/bench_load.py --chat-users 32 --save baseline.json
+    python scripts/bench_load.py --chat-users 32 --baseline baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+WORDS = (
+    "pump valve seal bearing filter pressure flow motor shaft impeller gasket "
+    "coupling housing inlet outlet leak noise vibration temperature alarm reset "
+    "replace inspect tighten bleed drain lubricate calibrate sensor relay fuse"
+).split()
+
+# Compared against a baseline: (section, metric, higher is better).
+TRACKED = (
+    ("chat", "rps", True),
+    ("chat", "latency_ms.p95", False),
+    ("chat", "latency_ms.p99", False),
+    ("chat", "ttft_ms.p95", False),
+    ("upload", "latency_ms.p95", False),
+    ("ingest", "chunks_per_sec", True),
+)
+
+
+def _pdf(pages) -> bytes:
+    """A minimal PDF with one line of text per entry in *pages*."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{off:010d} 00000 n \n" for off in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _percentiles(samples) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None}
+    return {
+        f"p{round(q * 100)}": round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+        for q in (0.50, 0.95, 0.99)
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"backend exited with {server.returncode}")
+        try:
+            if (await client.get("/health")).json().get("ready"):
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("backend did not become ready")
+
+
+async def _uploads(client: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    files = [
+        _pdf(" ".join(rng.choices(WORDS, k=60)) + f" E-{rng.randint(1, 999)}" for _ in range(args.pages))
+        for _ in range(args.uploads)
+    ]
+    latencies, job_ids, errors = [], [], 0
+    queue = asyncio.Queue()
+    for i, body in enumerate(files):
+        queue.put_nowait((i, body))
+
+    async def worker() -> None:
+        nonlocal errors
+        while not queue.empty():
+            i, body = queue.get_nowait()
+            started = time.perf_counter()
+            resp = await client.post(
+                "/upload/",
+                params={"type": "global"},
+                files={"file": (f"manual-{i}.pdf", body, "application/pdf")},
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if resp.status_code == 200 and resp.json().get("job_id"):
+                job_ids.append(resp.json()["job_id"])
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.upload_concurrency)))
+    upload_seconds = time.perf_counter() - started
+
+    chunks = failed = 0
+    for job_id in job_ids:
+        while True:
+            job = (await client.get(f"/upload/jobs/{job_id}")).json()
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.05)
+        chunks += job["chunks_embedded"]
+        failed += job["status"] == "failed"
+    ingest_seconds = time.perf_counter() - started
+
+    return {
+        "upload": {
+            "requests": len(files),
+            "errors": errors,
+            "rps": round(len(files) / upload_seconds, 1),
+            "latency_ms": _percentiles(latencies),
+        },
+        "ingest": {
+            "documents": len(job_ids),
+            "failed": failed,
+            "pages": len(job_ids) * args.pages,
+            "chunks": chunks,
+            "seconds": round(ingest_seconds, 2),
+            "pages_per_sec": round(len(job_ids) * args.pages / ingest_seconds, 1),
+            "chunks_per_sec": round(chunks / ingest_seconds, 1),
+        },
+    }
+
+
+async def _chat(client: httpx.AsyncClient, session_id: int, rng: random.Random):
+    """Stream one answer; return ``(latency ms, time to first token ms)`` or ``None`` on error."""
+    question = f"how do I {rng.choice(WORDS)} the {rng.choice(WORDS)} after E-{rng.randint(1, 999)}?"
+    payload = {"session_id": session_id, "user": "bench", "message": question}
+    started = time.perf_counter()
+    first = None
+    try:
+        async with client.stream("POST", "/chat/", json=payload) as resp:
+            if resp.status_code != 200:
+                return None
+            async for line in resp.aiter_lines():
+                if first is None and line.startswith("data:") and '"content"' in line:
+                    first = time.perf_counter()
+    except httpx.HTTPError:
+        return None
+    latency = (time.perf_counter() - started) * 1000
+    return latency, (first - started) * 1000 if first is not None else None
+
+
+async def _chats(client: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    session_ids = [(await client.post("/sessions/")).json()["id"] for _ in range(args.chat_users)]
+    # Unmeasured requests first, so cold caches and connection setup don't
+    # land in the percentiles.
+    for _ in range(args.warmup):
+        await asyncio.gather(*(_chat(client, session_id, rng) for session_id in session_ids))
+
+    remaining = args.chat_requests
+    latencies, ttfts, errors = [], [], 0
+
+    async def user(session_id: int) -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            result = await _chat(client, session_id, rng)
+            if result is None:
+                errors += 1
+                continue
+            latencies.append(result[0])
+            if result[1] is not None:
+                ttfts.append(result[1])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - started
+    return {
+        "chat": {
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": _percentiles(latencies),
+            "ttft_ms": _percentiles(ttfts),
+        }
+    }
+
+
+async def _stage_means(client: httpx.AsyncClient) -> dict:
+    """Mean server-side duration of each chat stage, in ms, from /metrics."""
+    sums, counts = {}, {}
+    for line in (await client.get("/metrics")).text.splitlines():
+        for suffix, into in (("_sum", sums), ("_count", counts)):
+            prefix = f'sapid_chat_stage_seconds{suffix}{{stage="'
+            if line.startswith(prefix):
+                stage, value = line[len(prefix):].split('"} ')
+                into[stage] = float(value)
+    return {stage: round(sums[stage] / counts[stage] * 1000, 1) for stage in sums if counts.get(stage)}
+
+
+def _lookup(results: dict, section: str, metric: str):
+    value = results.get(section, {})
+    for part in metric.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for section, metric, higher_is_better in TRACKED:
+        now, before = _lookup(results, section, metric), _lookup(baseline, section, metric)
+        if not now or not before:
+            continue
+        change = (now - before) / before
+        if (-change if higher_is_better else change) > tolerance:
+            found.append(f"{section}.{metric}: {before} -> {now} ({change:+.0%})")
+    return found
+
+
+def _report(results: dict) -> None:
+    chat, upload, ingest = results["chat"], results["upload"], results["ingest"]
+    print(f"{'':>14} {'requests':>9} {'errors':>7} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, section, key in (("upload", upload, "latency_ms"), ("chat", chat, "latency_ms"), ("chat ttft", chat, "ttft_ms")):
+        p = section[key]
+        print(
+            f"{name:>14} {section['requests']:>9} {section['errors']:>7} {section['rps']:>7} "
+            f"{p['p50']!s:>8} {p['p95']!s:>8} {p['p99']!s:>8}"
+        )
+    stages = ", ".join(f"{name} {ms}" for name, ms in chat["server_stage_mean_ms"].items())
+    print(f"\nserver chat stages (mean ms): {stages}")
+    print(
+        f"ingested {ingest['documents']} documents ({ingest['failed']} failed), {ingest['chunks']} chunks "
+        f"in {ingest['seconds']}s: {ingest['pages_per_sec']} pages/s, {ingest['chunks_per_sec']} chunks/s"
+    )
+
+
+async def _run(args, base_url: str, server: subprocess.Popen) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.chat_users + args.upload_concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        await _wait_ready(client, server)
+        results = await _uploads(client, args, rng)
+        results.update(await _chats(client, args, rng))
+        # Includes the warm-up chats.
+        results["chat"]["server_stage_mean_ms"] = await _stage_means(client)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chat-users", type=int, default=16)
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured chats per user first")
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--embed-ms", type=float, default=5)
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE")
+    args = parser.parse_args()
+
+    backend = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from fake_ollama import FakeOllama
+
+    fake = FakeOllama(
+        embed_latency=args.embed_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_ms / 1000,
+        tokens=args.tokens,
+    ).start()
+    scratch = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=scratch) as tmp:
+        env = {
+            **os.environ,
+            "POSTGRES_URL": f"sqlite:///{tmp}/bench.db",
+            "OLLAMA_URL": fake.url,
+            "VECTOR_STORE": "local",
+            "VECTOR_STORE_PATH": f"{tmp}/vectors",
+            "STORAGE_DIR": f"{tmp}/storage",
+            "METRICS": "on",
+        }
+        env.update(item.split("=", 1) for item in args.server_env)
+        os.makedirs(env["STORAGE_DIR"], exist_ok=True)
+        subprocess.run(
+            [sys.executable, "-c", "from core import db; db.SQLModel.metadata.create_all(db.engine)"],
+            cwd=backend,
+            env=env,
+            check=True,
+        )
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=backend,
+            env=env,
+        )
+        try:
+            results = asyncio.run(_run(args, f"http://127.0.0.1:{port}", server))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            fake.stop()
+
+    results["config"] = {
+        key: value for key, value in vars(args).items() if key not in ("save", "baseline", "tolerance")
+    }
+    _report(results)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = _regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
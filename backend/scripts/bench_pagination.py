@@ -0,0 +1,95 @@
+"""Measure paginated reads while the chat tables grow.
+
+Fills ``chat_message`` (spread over ``--conversations`` conversations of one
+session) up to each of ``--sizes`` rows and times a first page and a deep
+keyset page of ``db.get_messages`` plus a page of ``db.list_conversations``.
+With the indexes from migration 0006 the timings should stay flat; pass
+``--no-index`` to see the full scans they replace.
+
+    python scripts/bench_pagination.py --sizes 10000,100000,1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--url", help="database URL (defaults to a throwaway SQLite file)")
+    parser.add_argument("--no-index", action="store_true", help="drop the pagination indexes first")
+    args = parser.parse_args()
+
+    os.environ["POSTGRES_URL"] = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from core import db
+
+    db.SQLModel.metadata.create_all(db.engine)
+    if args.no_index:
+        for table in (db.Conversation, db.ChatMessage, db.Document):
+            for index in table.__table__.indexes:
+                index.drop(db.engine)
+
+    session_id = db.create_session().id
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(
+            db.Conversation.__table__.insert(),
+            [{"session_id": session_id, "created_at": now} for _ in range(args.conversations)],
+        )
+    conv_ids = [c.id for c in db.list_conversations(session_id)]
+    target = conv_ids[-1]
+
+    print(f"{'rows':>10} {'first page':>12} {'deep page':>12} {'conversations':>14}  (median ms)")
+    rows = 0
+    for size in (int(n) for n in args.sizes.split(",")):
+        while rows < size:
+            batch = min(50_000, size - rows)
+            with db.engine.begin() as conn:
+                conn.execute(
+                    db.ChatMessage.__table__.insert(),
+                    [
+                        {
+                            "conversation_id": conv_ids[(rows + i) % len(conv_ids)],
+                            "sender": "user",
+                            "content": f"message {rows + i}",
+                            "timestamp": now,
+                        }
+                        for i in range(batch)
+                    ],
+                )
+            rows += batch
+
+        messages = db.get_messages(target)
+        deep_after = messages[max(len(messages) - args.page - 1, 0)].id if messages else None
+        first = _median_ms(lambda: db.get_messages(target, args.page), args.repeat)
+        deep = _median_ms(lambda: db.get_messages(target, args.page, deep_after), args.repeat)
+        convs = _median_ms(
+            lambda: db.list_conversations(session_id, args.page, conv_ids[len(conv_ids) // 2]),
+            args.repeat,
+        )
+        print(f"{rows:>10} {first:>12.2f} {deep:>12.2f} {convs:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measure recall, latency and footprint of quantized local vector storage.
+
+Stores ``--size`` clustered ``--dim``-dimensional vectors with ~500-character
+chunk texts. Each quantization mode (none, int8, binary) is searched with the
+given ``--rerank`` factors. recall@k is measured against exact float32
+search. The footprint is scaled to one million chunks: "scan MB" is what a
+query reads (float vectors, or the codes when quantized), "disk MB" is the
+vector and code files, and "log MB" is ids, texts and metadata with and
+without the duplicated metadata ``text``.
+
+    python scripts/bench_quantization.py --size 100000 --dim 768
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rerank", default="2,4,10")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from core.vectorstore import LocalVectorStore
+
+    rng = np.random.default_rng(0)
+    topics = rng.normal(size=(args.topics, args.dim))
+    vectors = (
+        topics[rng.integers(0, args.topics, args.size)] + rng.normal(scale=0.6, size=(args.size, args.dim))
+    ).astype(np.float32)
+    queries = vectors[rng.integers(0, args.size, args.queries)] + rng.normal(
+        scale=0.5, size=(args.queries, args.dim)
+    ).astype(np.float32)
+    ids = [f"7:{i // 20}:{i % 20}" for i in range(args.size)]
+    texts = [f"chunk {i} " + "x" * 490 for i in range(args.size)]
+    scale = 1_000_000 / args.size
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for metadata_text in (True, False):
+            col = LocalVectorStore(f"{tmp}/log-{metadata_text}").get_or_create_collection("c")
+            for start in range(0, args.size, 1000):
+                stop = start + 1000
+                col.upsert(
+                    ids=ids[start:stop],
+                    embeddings=vectors[start:stop, :1],
+                    documents=texts[start:stop],
+                    metadatas=[
+                        {"doc_id": "7", "page": i // 20, "chunk_id": i % 20, "hash": "0" * 64}
+                        | ({"text": texts[i]} if metadata_text else {})
+                        for i in range(start, min(stop, args.size))
+                    ],
+                )
+            label = "with" if metadata_text else "without"
+            print(f"log MB per 1M chunks {label} metadata text: {col.nbytes()['log'] * scale / 2**20:.0f}")
+
+        exact = None
+        print(f"\n{'mode':>7} {'rerank':>6} {'recall':>7} {'p50 ms':>7} {'scan MB':>8} {'disk MB':>8}")
+        for mode in (None, "int8", "binary"):
+            for rerank in [1] if mode is None else [int(r) for r in args.rerank.split(",")]:
+                store = LocalVectorStore(f"{tmp}/{mode}-{rerank}", quantization=mode, rerank_factor=rerank)
+                col = store.get_or_create_collection("c")
+                for start in range(0, args.size, 4096):
+                    col.upsert(ids=ids[start : start + 4096], embeddings=vectors[start : start + 4096])
+                latencies, results = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    results.append(col.query(query_embeddings=[query], n_results=args.top_k)["ids"][0])
+                    latencies.append((time.perf_counter() - started) * 1000)
+                if exact is None:
+                    exact = results
+                recall = np.mean([len(set(e) & set(r)) / len(e) for e, r in zip(exact, results)])
+                sizes = col.nbytes()
+                rows = col.capacity or 1
+                scan = (sizes["codes"] or sizes["vectors"]) / rows * 1_000_000
+                disk = (sizes["codes"] + sizes["vectors"]) / rows * 1_000_000
+                print(
+                    f"{mode or 'float32':>7} {rerank:>6} {recall:>7.3f} {statistics.median(latencies):>7.2f} "
+                    f"{scan / 2**20:>8.0f} {disk / 2**20:>8.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
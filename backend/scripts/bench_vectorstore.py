@@ -0,0 +1,119 @@
+"""Compare the local vector store with a Chroma server.
+
+Writes ``--size`` random ``--dim``-dimensional vectors, clustered around
+``--topics`` centres, in batches of ``--batch`` to each backend. Reports the
+upsert throughput, the median and p95 latency of single top-``--top-k``
+queries, and queries per second. Recall is measured against the exact local
+search. Chroma is included only when ``--chroma-url`` is given; its
+collection is dropped afterwards.
+
+    python scripts/bench_vectorstore.py --size 100000 --chroma-url http://localhost:8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _run(name, collection, vectors, queries, args, exact=None):
+    ids = [f"v{i}" for i in range(len(vectors))]
+    started = time.perf_counter()
+    for start in range(0, len(vectors), args.batch):
+        stop = start + args.batch
+        collection.upsert(
+            ids=ids[start:stop],
+            embeddings=vectors[start:stop].tolist(),
+            documents=[f"chunk {i}" for i in range(start, min(stop, len(vectors)))],
+            metadatas=[{"doc_id": str(i % 100)} for i in range(start, min(stop, len(vectors)))],
+        )
+    upsert = len(vectors) / (time.perf_counter() - started)
+    # Warm up (this also builds the IVF index) outside the timings.
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=args.top_k)
+
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        res = collection.query(
+            query_embeddings=[query.tolist()],
+            n_results=args.top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(res["ids"][0])
+
+    recall = (
+        np.mean([len(set(e) & set(r)) / len(e) for e, r in zip(exact, results)])
+        if exact is not None
+        else 1.0
+    )
+    print(
+        f"{name:>10} {upsert:>12.0f} {statistics.median(latencies):>8.2f} "
+        f"{_percentile(latencies, 0.95):>8.2f} {1000 / statistics.mean(latencies):>8.0f} {recall:>7.3f}"
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--chroma-url", help="also benchmark this Chroma server")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from core.vectorstore import LocalVectorStore
+
+    rng = np.random.default_rng(0)
+    # Clustered around topics, as document embeddings are; uniform noise has
+    # no structure for IVF to exploit.
+    topics = rng.normal(size=(args.topics, args.dim))
+    vectors = (
+        topics[rng.integers(0, args.topics, args.size)] + rng.normal(scale=0.6, size=(args.size, args.dim))
+    ).astype(np.float32)
+    # Queries near stored vectors, as questions are near their answers.
+    picks = rng.integers(0, args.size, args.queries)
+    queries = vectors[picks] + rng.normal(scale=0.5, size=(args.queries, args.dim)).astype(np.float32)
+
+    print(f"{'backend':>10} {'upserts/s':>12} {'p50 ms':>8} {'p95 ms':>8} {'qps':>8} {'recall':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        flat = LocalVectorStore(f"{tmp}/flat").get_or_create_collection("bench")
+        exact = _run("flat", flat, vectors, queries, args)
+        ivf = LocalVectorStore(
+            f"{tmp}/ivf", index="ivf", ivf_min_rows=0, nprobe=args.nprobe
+        ).get_or_create_collection("bench")
+        _run("ivf", ivf, vectors, queries, args, exact)
+
+    if args.chroma_url:
+        from urllib.parse import urlparse
+
+        import chromadb
+
+        parsed = urlparse(args.chroma_url)
+        client = chromadb.HttpClient(host=parsed.hostname, port=parsed.port or 8000)
+        name = f"bench_{int(time.time())}"
+        collection = client.create_collection(name, metadata={"hnsw:space": "cosine"})
+        try:
+            _run("chroma", collection, vectors, queries, args, exact)
+        finally:
+            client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
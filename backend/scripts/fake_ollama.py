@@ -0,0 +1,193 @@
+"""A stand-in Ollama server for load tests and offline development.
+
+Speaks the parts of the Ollama API the backend uses (``/api/tags``,
+``/api/pull``, ``/api/embed``, ``/api/embeddings``, ``/api/generate`` and
+``/api/chat``, streamed or not) with configurable latencies, so throughput
+can be measured without a GPU. Embeddings are hashed bags of words, so texts
+sharing words are close and retrieval still finds related chunks; like
+Ollama's, they are unit length from ``/api/embed`` only. Streamed
+answers are ``--tokens`` words, the first after ``--first-token-ms`` and the
+rest ``--token-ms`` apart.
+
+    python scripts/fake_ollama.py --port 11434 --token-ms 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Sequence
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeOllama:
+    """An Ollama-compatible HTTP server running on a background thread."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        models: Sequence[str] = ("llama3", "nomic-embed-text"),
+        dim: int = 64,
+        embed_latency: float = 0.005,
+        first_token_latency: float = 0.05,
+        token_latency: float = 0.01,
+        tokens: int = 40,
+    ) -> None:
+        self.models = set(models)
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.requests: dict = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def embed(self, text: str, normalise: bool = True) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        if not normalise:
+            return vector
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+
+def _handler(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _json(self, body: dict, status: int = 200) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, lines) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for line in lines:
+                data = json.dumps(line).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self) -> None:
+            fake.count(self.path)
+            if self.path == "/api/tags":
+                self._json({"models": [{"name": name} for name in sorted(fake.models)]})
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def do_POST(self) -> None:
+            fake.count(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            model = body.get("model", "")
+            if self.path == "/api/pull":
+                fake.models.add(body.get("name") or model)
+                self._stream([{"status": "success"}])
+            elif self.path == "/api/embed":
+                inputs = body.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                time.sleep(fake.embed_latency)
+                self._json({"model": model, "embeddings": [fake.embed(text) for text in inputs]})
+            elif self.path == "/api/embeddings":
+                time.sleep(fake.embed_latency)
+                self._json({"embedding": fake.embed(body.get("prompt", ""), normalise=False)})
+            elif self.path == "/api/generate":
+                self._json({"model": model, "response": "", "done": True})
+            elif self.path == "/api/chat":
+                self._chat(body)
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def _chat(self, body: dict) -> None:
+            messages = body.get("messages", [])
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            if messages and "intent classifier" in messages[0].get("content", ""):
+                words = [json.dumps({"intent": "general", "confidence": 0.9})]
+            else:
+                words = [f"word{i} " for i in range(fake.tokens)]
+            final = {"done": True, "prompt_eval_count": prompt_tokens, "eval_count": len(words)}
+            if not body.get("stream", True):
+                time.sleep(fake.first_token_latency + fake.token_latency * (len(words) - 1))
+                self._json({"message": {"role": "assistant", "content": "".join(words)}, **final})
+                return
+
+            def lines():
+                time.sleep(fake.first_token_latency)
+                for i, word in enumerate(words):
+                    if i:
+                        time.sleep(fake.token_latency)
+                    yield {"message": {"role": "assistant", "content": word}, "done": False}
+                yield {"message": {"role": "assistant", "content": ""}, **final}
+
+            self._stream(lines())
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--embed-ms", type=float, default=5)
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        args.host,
+        args.port,
+        embed_latency=args.embed_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_ms / 1000,
+        tokens=args.tokens,
+    ).start()
+    print(f"fake Ollama listening on {fake.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import asyncio
 
 from pathlib import Path
 import sys
@@ -11,26 +12,22 @@ import pytest
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
 
+def _use_local_store(tmp_path, monkeypatch):
+    """Rebuild the shared runtime on a ``LocalVectorStore`` under *tmp_path*."""
+    import core.runtime as runtime_module
+
+    monkeypatch.setenv('VECTOR_STORE', 'local')
+    monkeypatch.setenv('VECTOR_STORE_PATH', str(tmp_path / 'vectors'))
+    monkeypatch.setattr(runtime_module, "_runtime", None)
+
 
 @pytest.mark.asyncio
 async def test_chat_flow(tmp_path, monkeypatch):
     os.environ['POSTGRES_URL'] = f"sqlite:///{tmp_path}/test.db"
 
 
-    import core.rag as rag_module
-
-    class DummyCollection:
-        def add(self, *args, **kwargs):
-            pass
-
-        def query(self, *args, **kwargs):
-            return {"documents": [[]], "metadatas": [[]]}
-
-    class DummyClient:
-        def get_or_create_collection(self, name):
-            return DummyCollection()
-
-    monkeypatch.setattr(rag_module, "chromadb", type("x", (), {"HttpClient": lambda *a, **k: DummyClient()})())
+    _use_local_store(tmp_path, monkeypatch)
+    import core.runtime as runtime_module
 
     import core.db as db
     import backend.api as backend_api
@@ -41,11 +38,21 @@ async def test_chat_flow(tmp_path, monkeypatch):
 
     db.SQLModel.metadata.create_all(db.engine)
 
-    monkeypatch.setattr(upload.rag, 'embed_pdf', lambda *args, **kwargs: None)
-    monkeypatch.setattr(chat.rag, 'query', lambda *args, **kwargs: (
-        'the answer', [{'doc_id': 'doc1', 'page': 0, 'chunk_id': 1}]
-    ))
-    monkeypatch.setattr(chat.llm, 'classify_intent', lambda text: ('general', 0.7))
+    runtime = runtime_module.get_runtime()
+    assert runtime.rag.store_status()['backend'] == 'local'
+    monkeypatch.setattr(runtime.rag, 'embed_pdf', lambda *args, **kwargs: None)
+    monkeypatch.setattr(runtime, 'storage_dir', str(tmp_path / 'storage'))
+    async def fake_stream(*args, **kwargs):
+        async def deltas():
+            for delta in ('the ', 'answer'):
+                yield delta
+        return deltas(), [{'doc_id': 'doc1', 'page': 0, 'chunk_id': 1}]
+
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', fake_stream)
+    async def fake_classify(text, meta=None):
+        return 'general', 0.7
+
+    monkeypatch.setattr(runtime.classifier, 'classify', fake_classify)
     collect_calls = []
 
     import backend.external.incident_api as incident_mod
@@ -77,12 +84,233 @@ async def test_chat_flow(tmp_path, monkeypatch):
                 if line.startswith("data:"):
                     events.append(json.loads(line[5:].strip()))
 
-            answer = "".join(e["content"] for e in events if e.get("type") == "content")
+            contents = [e["content"] for e in events if e.get("type") == "content"]
+            answer = "".join(contents)
 
+    # deltas are forwarded as separate events, followed by the source links
+    assert contents[:2] == ['the ', 'answer']
+    assert answer.startswith('the answer')
     assert '(#/pdf/' in answer
 
     with db.get_session() as s:
         msgs = s.exec(select(db.ChatMessage)).all()
 
-        assert len(msgs) == 1
+        assert len(msgs) == 2
         assert msgs[0].content == 'hello'
+        assert msgs[1].sender == 'assistant'
+        assert msgs[1].content == answer
+
+
+@pytest.mark.asyncio
+async def test_chat_deferred_classification(tmp_path, monkeypatch):
+    os.environ['POSTGRES_URL'] = f"sqlite:///{tmp_path}/test.db"
+
+    import core.db as db
+    import backend.api as backend_api
+    import backend.api.chat as chat
+    import core.runtime as runtime_module
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    db.SQLModel.metadata.create_all(db.engine)
+    _use_local_store(tmp_path, monkeypatch)
+    runtime = runtime_module.get_runtime()
+
+    streamed = []
+
+    async def fake_stream(*args, **kwargs):
+        async def deltas():
+            streamed.append('answer')
+            yield 'answer'
+        return deltas(), []
+
+    async def fake_classify(text, meta=None):
+        # classification must not start before the answer has streamed
+        assert streamed
+        meta['source'] = 'llm'
+        return 'maintenance_query', 0.9
+
+    collect_calls = []
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', fake_stream)
+    monkeypatch.setattr(runtime.classifier, 'classify', fake_classify)
+    monkeypatch.setattr(chat.incident_api, 'collect', lambda *a: collect_calls.append(a))
+
+    session = db.get_or_create_session(None)
+    payload = {'session_id': session.id, 'user': 'bob', 'message': 'pump broke', 'classify': 'deferred'}
+
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://test') as client:
+        async with client.stream("POST", "/chat/", json=payload) as resp:
+            assert resp.status_code == 200
+            async for _ in resp.aiter_lines():
+                pass
+
+    await asyncio.gather(*chat._background)
+
+    with db.get_session() as s:
+        msg = s.exec(select(db.ChatMessage).where(db.ChatMessage.content == 'pump broke')).one()
+        assert msg.llm_intent == 'maintenance_query'
+        assert msg.confidence == 0.9
+        assert msg.intent_source == 'llm'
+    assert collect_calls == [(session.id, 'pump broke', 'maintenance_query')]
+
+    # only the chat model's labels are used to train the local classifier
+    await db.save_turn(
+        session.id, None, sender='bob', content='valve leaks', answer='ok',
+        llm_intent='incident_report', confidence=0.95, intent_source='centroid',
+    )
+    labelled = db.labelled_messages()
+    assert ('pump broke', 'maintenance_query') in labelled
+    assert ('valve leaks', 'incident_report') not in labelled
+
+
+@pytest.mark.asyncio
+async def test_chat_timings_event_and_metrics(tmp_path, monkeypatch):
+    os.environ['POSTGRES_URL'] = f"sqlite:///{tmp_path}/test.db"
+
+    import core.db as db
+    import core.runtime as runtime_module
+    import backend.api as backend_api
+    from core.timing import metrics
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    db.SQLModel.metadata.create_all(db.engine)
+    _use_local_store(tmp_path, monkeypatch)
+    runtime = runtime_module.get_runtime()
+
+    async def fake_stream(*args, usage=None, **kwargs):
+        async def deltas():
+            yield 'answer'
+            usage.update(prompt_eval_count=40, eval_count=2)
+        return deltas(), [{'doc_id': 'doc1', 'page': 0, 'chunk_id': 1}]
+
+    async def fake_classify(text, meta=None):
+        return 'general', 0.7
+
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', fake_stream)
+    monkeypatch.setattr(runtime.classifier, 'classify', fake_classify)
+    monkeypatch.setattr(metrics, 'enabled', True)
+    metrics.reset()
+
+    session = db.get_or_create_session(None)
+    payload = {'session_id': session.id, 'user': 'carol', 'message': 'hi', 'timings': True}
+
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://test') as client:
+        async with client.stream("POST", "/chat/", json=payload) as resp:
+            events = [json.loads(line[5:]) async for line in resp.aiter_lines() if line.startswith("data:")]
+        exposition = (await client.get('/metrics')).text
+
+    timings = next(e for e in events if e['type'] == 'timings')
+    assert {'retrieval', 'generation', 'first_token', 'db_write', 'total'} <= set(timings['stages_ms'])
+    assert (timings['chunks'], timings['prompt_eval_count'], timings['eval_count']) == (1, 40, 2)
+    assert events[-1]['type'] == 'done'
+
+    assert '# TYPE sapid_chat_stage_seconds histogram' in exposition
+    assert 'sapid_chat_stage_seconds_count{stage="total"} 1' in exposition
+    assert 'sapid_chat_stage_seconds_bucket{stage="total",le="+Inf"} 1' in exposition
+    assert 'sapid_retrieved_chunks_bucket{le="1"} 1' in exposition
+    assert 'sapid_chat_requests_total{answer_cache="off"} 1' in exposition
+    assert metrics.value('sapid_db_write_seconds', op='save_turn')[-1] == 1
+
+    metrics.reset()
+    monkeypatch.setattr(metrics, 'enabled', False)
+    metrics.observe('sapid_retrieved_chunks', 3)
+    assert metrics.value('sapid_retrieved_chunks') is None
+
+
+@pytest.mark.asyncio
+async def test_chat_rejects_with_retry_after_when_llm_queue_is_full(tmp_path, monkeypatch):
+    os.environ['POSTGRES_URL'] = f"sqlite:///{tmp_path}/test.db"
+
+    import core.db as db
+    import core.runtime as runtime_module
+    import backend.api as backend_api
+    from core.scheduler import LLMQueueFull
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    db.SQLModel.metadata.create_all(db.engine)
+    _use_local_store(tmp_path, monkeypatch)
+    runtime = runtime_module.get_runtime()
+
+    async def full(*args, **kwargs):
+        raise LLMQueueFull('llama3', 'chat', 7)
+
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', full)
+    payload = {'user': 'dave', 'message': 'hi', 'classify': 'off'}
+
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://test') as client:
+        resp = await client.post('/chat/', json=payload)
+
+    assert resp.status_code == 503
+    assert resp.headers['retry-after'] == '7'
+    with db.get_session() as s:
+        assert s.exec(select(db.ChatMessage).where(db.ChatMessage.sender == 'dave')).first() is None
+
+
+@pytest.mark.asyncio
+async def test_chat_stores_turn_when_classification_fails(tmp_path, monkeypatch):
+    os.environ['POSTGRES_URL'] = f"sqlite:///{tmp_path}/test.db"
+
+    import httpx
+    import core.db as db
+    import core.runtime as runtime_module
+    import backend.api as backend_api
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    db.SQLModel.metadata.create_all(db.engine)
+    _use_local_store(tmp_path, monkeypatch)
+    runtime = runtime_module.get_runtime()
+
+    async def fake_stream(*args, **kwargs):
+        async def deltas():
+            yield 'answer'
+        return deltas(), []
+
+    async def unreachable(text, meta=None):
+        raise httpx.ConnectError('connection refused')
+
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', fake_stream)
+    monkeypatch.setattr(runtime.classifier, 'classify', unreachable)
+    payload = {'user': 'erin', 'message': 'pump broke', 'classify': 'concurrent'}
+
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://test') as client:
+        async with client.stream("POST", "/chat/", json=payload) as resp:
+            events = [json.loads(line[5:]) async for line in resp.aiter_lines() if line.startswith("data:")]
+
+    assert events[-1]['type'] == 'done'
+    with db.get_session() as s:
+        msg = s.exec(select(db.ChatMessage).where(db.ChatMessage.sender == 'erin')).one()
+        assert (msg.content, msg.llm_intent, msg.confidence) == ('pump broke', None, None)
+        answer = s.exec(
+            select(db.ChatMessage).where(
+                db.ChatMessage.conversation_id == msg.conversation_id, db.ChatMessage.sender == 'assistant'
+            )
+        ).one()
+        assert answer.content == 'answer'
+
+
+@pytest.mark.asyncio
+async def test_chat_rejects_unknown_classify_mode(tmp_path, monkeypatch):
+    import subprocess
+
+    import backend.api as backend_api
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://test') as client:
+        resp = await client.post('/chat/', json={'user': 'frank', 'message': 'hi', 'classify': 'concurent'})
+    assert resp.status_code == 422
+
+    # a misspelt default fails at startup instead of disabling classification
+    backend = Path(__file__).resolve().parents[1]
+    env = {**os.environ, 'POSTGRES_URL': f'sqlite:///{tmp_path}/db.db', 'INTENT_CLASSIFICATION': 'defered'}
+    proc = subprocess.run([sys.executable, '-c', 'import api.chat'], cwd=backend, env=env, capture_output=True, text=True)
+    assert proc.returncode != 0
+    assert 'INTENT_CLASSIFICATION must be one of' in proc.stderr
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import sys
 import json
+import asyncio
 import pytest
 from httpx import AsyncClient, ASGITransport
 
@@ -13,17 +14,27 @@ async def test_endpoints(tmp_path, monkeypatch):
 
     import core.rag as rag_module
 
+    deleted = []
+
     class DummyCollection:
+        def __init__(self, name):
+            self.name = name
         def add(self, *args, **kwargs):
             pass
         def query(self, *args, **kwargs):
             return {"documents": [[]], "metadatas": [[]]}
+        def delete(self, where):
+            deleted.append((self.name, where))
 
     class DummyClient:
         def get_or_create_collection(self, name):
-            return DummyCollection()
+            return DummyCollection(name)
+        def delete_collection(self, name):
+            deleted.append((name, None))
 
     monkeypatch.setattr(rag_module, "chromadb", type("x", (), {"HttpClient": lambda *a, **k: DummyClient()})())
+    import core.runtime as runtime_module
+    monkeypatch.setattr(runtime_module, "_runtime", None)
 
     import core.db as db
     import backend.api as backend_api
@@ -38,9 +49,19 @@ async def test_endpoints(tmp_path, monkeypatch):
 
     db.SQLModel.metadata.create_all(db.engine)
 
-    monkeypatch.setattr(upload.rag, 'embed_pdf', lambda *a, **k: None)
-    monkeypatch.setattr(chat.rag, 'query', lambda *a, **k: ('ans', []))
-    monkeypatch.setattr(chat.llm, 'classify_intent', lambda t: ('general', 0.8))
+    runtime = runtime_module.get_runtime()
+    monkeypatch.setattr(runtime.rag, 'embed_pdf', lambda *a, **k: None)
+    monkeypatch.setattr(runtime, 'storage_dir', str(tmp_path / 'storage'))
+    async def fake_stream(*a, **k):
+        async def deltas():
+            yield 'ans'
+        return deltas(), []
+
+    monkeypatch.setattr(runtime.rag, 'aquery_stream', fake_stream)
+    async def fake_classify(t, meta=None):
+        return 'general', 0.8
+
+    monkeypatch.setattr(runtime.classifier, 'classify', fake_classify)
     monkeypatch.setattr(email.email_service, 'send_email', lambda *a, **k: None)
 
     transport = ASGITransport(app=main.app)
@@ -55,17 +76,85 @@ async def test_endpoints(tmp_path, monkeypatch):
         assert conv.status_code == 200
         conv_id = conv.json()['id']
 
+        # keyset pagination over the session's conversations
+        for _ in range(2):
+            await client.post('/conversations/', json={'session_id': session_id})
+        first = await client.get(f'/conversations/?session_id={session_id}&limit=2')
+        assert [c['id'] for c in first.json()] == [conv_id, conv_id + 1]
+        after_id = first.headers['x-next-after-id']
+        rest = await client.get(f'/conversations/?session_id={session_id}&limit=2&after_id={after_id}')
+        assert [c['id'] for c in rest.json()] == [conv_id + 2]
+        assert 'x-next-after-id' not in rest.headers
+
         # upload via generic endpoint
         pdf_path = 'frontend/public/demo/financial-report.pdf'
         with open(pdf_path, 'rb') as fh:
             up = await client.post(f'/upload/?type=temp&session_id={session_id}', files={'file': ('x.pdf', fh, 'application/pdf')})
             assert up.status_code == 200
             doc_id = up.json()['id']
+            job_id = up.json()['job_id']
+
+        # poll the ingestion job until the worker finishes
+        for _ in range(50):
+            job = (await client.get(f'/upload/jobs/{job_id}')).json()
+            if job['status'] not in ('queued', 'running'):
+                break
+            await asyncio.sleep(0.05)
+        assert job['status'] == 'done'
+        assert job['doc_id'] == str(doc_id)
+
+        # the same file again is a no-op, unless its last ingestion failed
+        with open(pdf_path, 'rb') as fh:
+            again = await client.post(f'/upload/?type=temp&session_id={session_id}', files={'file': ('x.pdf', fh, 'application/pdf')})
+        assert (again.json()['status'], again.json()['job_id']) == ('unchanged', None)
+        db.update_ingest_job(job_id, status='failed')
+        with open(pdf_path, 'rb') as fh:
+            retry = await client.post(f'/upload/?type=temp&session_id={session_id}', files={'file': ('x.pdf', fh, 'application/pdf')})
+        assert retry.json()['status'] == 'queued' and retry.json()['job_id'] != job_id
+        assert retry.json()['id'] == doc_id
 
-        # also call /upload/temp endpoint
+        # different files sharing a name are kept apart; a new version of a
+        # document replaces it only when asked to, keeping its id
+        with open(pdf_path, 'rb') as fh:
+            manual = (await client.post('/upload/global', files={'file': ('g.pdf', fh, 'application/pdf')})).json()
+        other = (await client.post('/upload/global', files={'file': ('g.pdf', b'%PDF-1.4 other', 'application/pdf')})).json()
+        assert other['id'] != manual['id']
+        renamed = (await client.post('/upload/global', files={'file': ('h.pdf', b'%PDF-1.4 other', 'application/pdf')})).json()
+        assert renamed['id'] == other['id']
+        v2 = (await client.post(f"/upload/global?replace={manual['id']}", files={'file': ('g.pdf', b'%PDF-1.4 v2', 'application/pdf')})).json()
+        assert v2['id'] == manual['id']
+        assert v2['status'] == 'queued' and v2['collection'] == 'global'
+        assert (await client.get(f"/upload/documents/{other['id']}/view")).content == b'%PDF-1.4 other'
+        missing = await client.post(f'/upload/?type=temp&session_id={session_id}&replace={manual["id"]}', files={'file': ('g.pdf', b'x', 'application/pdf')})
+        assert missing.status_code == 404
+
+        # uploads over the size limit are rejected and leave nothing behind
+        max_upload_bytes = upload.max_upload_bytes
+        monkeypatch.setattr(upload, 'max_upload_bytes', 64)
+        monkeypatch.setattr(upload, 'upload_chunk_size', 16)
+        with open(pdf_path, 'rb') as fh:
+            resp = await client.post('/upload/global', files={'file': ('big.pdf', fh, 'application/pdf')})
+            assert resp.status_code == 413
+        assert os.listdir(tmp_path / 'storage' / 'incoming') == []
+        monkeypatch.setattr(upload, 'max_upload_bytes', max_upload_bytes)
+
+        # also call /upload/temp endpoint; its file goes once the job ends,
+        # even when ingestion fails
+        def failing_embed(*a, **k):
+            raise RuntimeError('boom')
+
+        monkeypatch.setattr(runtime.rag, 'embed_pdf', failing_embed)
         with open(pdf_path, 'rb') as fh:
             resp = await client.post(f'/upload/temp/{session_id}', files={'file': ('y.pdf', fh, 'application/pdf')})
             assert resp.status_code == 200
+        for _ in range(50):
+            job = (await client.get(f"/upload/jobs/{resp.json()['job_id']}")).json()
+            if job['status'] not in ('queued', 'running'):
+                break
+            await asyncio.sleep(0.05)
+        assert job['status'] == 'failed'
+        assert os.listdir(tmp_path / 'storage' / 'incoming') == []
+        monkeypatch.setattr(runtime.rag, 'embed_pdf', lambda *a, **k: None)
 
         # list documents
         resp = await client.get(f'/upload/documents?session_id={session_id}')
@@ -77,6 +166,20 @@ async def test_endpoints(tmp_path, monkeypatch):
         assert resp.status_code == 200
         assert resp.json()['id'] == doc_id
 
+        # viewer: conditional and partial fetches
+        resp = await client.get(f'/upload/documents/{doc_id}/view')
+        assert resp.status_code == 200
+        etag = resp.headers['etag']
+        resp = await client.get(f'/upload/documents/{doc_id}/view', headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+        resp = await client.get(f'/upload/documents/{doc_id}/view', headers={'Range': 'bytes=2-9'})
+        assert resp.status_code == 206
+        assert resp.headers['content-range'] == 'bytes 2-9/105'
+        with open(pdf_path, 'rb') as fh:
+            assert resp.content == fh.read()[2:10]
+        resp = await client.get(f'/upload/documents/{doc_id}/view', headers={'Range': 'bytes=500-'})
+        assert resp.status_code == 416
+
 
         # form submit
         resp = await client.post('/forms/', json={'form_id':'f1','data':{'a':1},'session_id':session_id})
@@ -86,9 +189,12 @@ async def test_endpoints(tmp_path, monkeypatch):
         resp = await client.post('/email/', json={'to':'a@test','subject':'s','body':'b','session_id':session_id})
         assert resp.status_code == 200
 
-        # delete document
+        # delete document: row, vectors and stored file go together
         resp = await client.delete(f'/upload/documents/{doc_id}')
         assert resp.status_code == 204
+        assert (f'temp_{session_id}', {'doc_id': str(doc_id)}) in deleted
+        assert not (tmp_path / 'storage' / f'{doc_id}.pdf').exists()
+        assert (await client.get(f'/upload/documents/{doc_id}/view')).status_code == 404
 
         # delete conversation
         resp = await client.delete(f'/conversations/{conv_id}')
@@ -97,7 +203,39 @@ async def test_endpoints(tmp_path, monkeypatch):
         # delete session
         resp = await client.delete(f'/sessions/{session_id}')
         assert resp.status_code == 204
+        assert (f'temp_{session_id}', None) in deleted
 
         # health/demo
         assert (await client.get('/health')).status_code == 200
         assert (await client.get('/demo')).status_code == 200
+
+
+def test_app_starts_and_reports_health_without_chroma(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import core.db as db
+    import core.runtime as runtime_module
+    import backend.api as backend_api
+    sys.modules['api'] = backend_api
+    import backend.main as main
+
+    db.SQLModel.metadata.create_all(db.engine)
+    for name, value in {
+        'VECTOR_STORE': 'chroma',
+        'CHROMA_URL': 'http://127.0.0.1:9',
+        'OLLAMA_URL': 'http://127.0.0.1:9',
+        'MODEL_CHECK_RETRY': '0',
+        'TEMP_REAPER_INTERVAL': '0',
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(runtime_module, "_runtime", None)
+
+    with TestClient(main.app) as client:
+        health = client.get('/health').json()
+        runtime = runtime_module.get_runtime()
+
+    assert health['ready'] is False
+    assert health['vector_store']['backend'] == 'chroma'
+    assert health['vector_store']['state'] == 'error'
+    # nothing has needed the vector store yet, so no client was created
+    assert runtime.rag._client is None
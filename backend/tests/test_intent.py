@@ -0,0 +1,94 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+KEYWORDS = ['broken', 'leak', 'how', 'torque', 'hello']
+
+
+class KeywordLLM:
+    """Embeds text as a bag of the keywords above."""
+
+    def __init__(self):
+        self.chat_calls = 0
+
+    async def embed(self, text, lane=None):
+        lowered = text.lower()
+        return [1.0 if k in lowered else 0.0 for k in KEYWORDS] + [0.1]
+
+    async def embed_batch(self, texts, lane=None):
+        return [await self.embed(t) for t in texts]
+
+    async def classify_intent(self, text):
+        self.chat_calls += 1
+        return 'llm_intent', 0.5
+
+
+EXAMPLES = [
+    ('the belt is broken', 'incident_report'),
+    ('oil leak near the pump', 'incident_report'),
+    ('how do I change the filter', 'maintenance_query'),
+    ('what torque for the bolts', 'maintenance_query'),
+    ('hello there', 'general'),
+]
+
+
+@pytest.mark.asyncio
+async def test_centroid_classifier_learns_from_history():
+    from core.intent import CentroidIntentClassifier
+
+    llm = KeywordLLM()
+    clf = CentroidIntentClassifier(llm, EXAMPLES, history=lambda: [('valve broken again', 'incident_report')])
+
+    intent, conf = await clf.classify('Broken hose on line 2')
+    assert intent == 'incident_report'
+    assert conf > 0.9
+    assert clf.labels == ['general', 'incident_report', 'maintenance_query']
+
+
+@pytest.mark.asyncio
+async def test_fallback_only_used_when_unsure():
+    from core.intent import build_intent_classifier
+
+    llm = KeywordLLM()
+    clf = build_intent_classifier(llm, 'centroid', threshold=0.6, examples=EXAMPLES)
+
+    label = {}
+    assert (await clf.classify('hello', meta=label))[0] == 'general'
+    assert llm.chat_calls == 0
+    assert label == {'source': 'centroid'}
+
+    # no keyword at all: every centroid is equally far away
+    assert await clf.classify('zzz', meta=label) == ('llm_intent', 0.5)
+    assert llm.chat_calls == 1
+    assert label == {'source': 'llm'}
+
+
+@pytest.mark.asyncio
+async def test_centroid_classifier_reuses_embeddings_and_refits():
+    import asyncio
+    from core.intent import CentroidIntentClassifier
+
+    llm = KeywordLLM()
+    embedded = []
+
+    async def shared_embed(text):
+        embedded.append(text)
+        return await llm.embed(text)
+
+    history = []
+    clf = CentroidIntentClassifier(
+        llm, EXAMPLES, history=lambda: list(history), embed=shared_embed, refit_interval=0.01
+    )
+    assert (await clf.classify('hello'))[0] == 'general'
+    assert embedded == ['hello']
+
+    # a label the chat model gave later is learnt without a restart
+    history.append(('torque wrench is broken', 'tooling'))
+    await asyncio.sleep(0.02)
+    await clf.classify('hello')
+    await clf._refit
+    assert 'tooling' in clf.labels
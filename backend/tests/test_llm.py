@@ -0,0 +1,217 @@
+from pathlib import Path
+import sys
+import json
+import time
+import asyncio
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+class FakeStreamResponse:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def test_chat_stream_yields_deltas(monkeypatch):
+    import core.llm as llm_module
+
+    lines = [
+        json.dumps({'message': {'role': 'assistant', 'content': 'Hel'}, 'done': False}).encode(),
+        b'',
+        json.dumps({'message': {'role': 'assistant', 'content': 'lo'}, 'done': False}).encode(),
+        json.dumps({'message': {'role': 'assistant', 'content': ''}, 'done': True}).encode(),
+    ]
+    calls = []
+
+    def fake_post(url, json=None, stream=False):
+        calls.append(json)
+        return FakeStreamResponse(lines)
+
+    llm = llm_module.LLM('http://ollama:11434', 'chat', 'embed')
+    monkeypatch.setattr(llm.session, 'post', fake_post)
+    assert list(llm.chat_stream([{'role': 'user', 'content': 'hi'}])) == ['Hel', 'lo']
+    assert calls[0]['stream'] is True
+
+
+@pytest.mark.asyncio
+async def test_async_llm_runs_requests_concurrently():
+    import httpx
+    import core.llm as llm_module
+
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={'message': {'role': 'assistant', 'content': 'ok'}})
+
+    llm = llm_module.AsyncLLM('http://ollama:11434', 'chat', 'embed')
+    llm.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    started = time.perf_counter()
+    replies = await asyncio.gather(*(llm.chat([{'role': 'user', 'content': 'hi'}]) for _ in range(5)))
+    elapsed = time.perf_counter() - started
+    await llm.aclose()
+
+    assert replies == ['ok'] * 5
+    assert elapsed < 0.3
+
+
+@pytest.mark.asyncio
+async def test_model_readiness_pulls_warms_and_retries():
+    from core.runtime import ModelReadiness
+
+    class FakeLLM:
+        chat_model = 'llama3'
+        embed_model = 'nomic-embed-text'
+
+        def __init__(self):
+            self.calls = []
+            self.down = True
+
+        def has_model(self, model):
+            if self.down and model == self.embed_model:
+                self.down = False
+                raise ConnectionError('ollama not up')
+            return model == self.chat_model
+
+        def pull_model(self, model):
+            self.calls.append(('pull', model))
+
+        def warm(self, model):
+            self.calls.append(('warm', model))
+
+    llm = FakeLLM()
+    models = ModelReadiness(llm, warmup=True, retry_interval=0.01)
+    assert models.status() == {
+        'ready': False,
+        'models': {'llama3': {'state': 'pending'}, 'nomic-embed-text': {'state': 'pending'}},
+    }
+
+    await models.run()
+
+    assert models.ready
+    # the chat model is present, the embed model is pulled after one failed check
+    assert llm.calls == [('warm', 'llama3'), ('pull', 'nomic-embed-text'), ('warm', 'nomic-embed-text')]
+
+
+@pytest.mark.asyncio
+async def test_fake_ollama_streams_tokens_with_usage():
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
+    from fake_ollama import FakeOllama
+    from core.llm import LLM, AsyncLLM
+
+    fake = FakeOllama(tokens=3, first_token_latency=0, token_latency=0).start()
+    allm = AsyncLLM(fake.url, 'llama3', 'nomic-embed-text')
+    try:
+        llm = LLM(fake.url, 'llama3', 'nomic-embed-text')
+        assert llm.has_model('llama3') and not llm.has_model('mistral')
+        usage = {}
+        deltas = [d async for d in allm.chat_stream([{'role': 'user', 'content': 'x' * 40}], usage=usage)]
+        vectors = await allm.embed_batch(['pump seal', 'seal pump', 'fuse'])
+    finally:
+        await allm.aclose()
+        fake.stop()
+
+    assert deltas == ['word0 ', 'word1 ', 'word2 ']
+    assert usage == {'prompt_eval_count': 10, 'eval_count': 3}
+    assert vectors[0] == vectors[1] != vectors[2]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_lanes_by_priority_and_sheds_load():
+    import threading
+    from core.scheduler import LLMQueueFull, LLMScheduler
+
+    scheduler = LLMScheduler(limit=1, max_queue=3)
+    order = []
+    holding = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.aslot('llama3', 'chat'):
+            holding.set()
+            await release.wait()
+
+    async def request(lane, name):
+        async with scheduler.aslot('llama3', lane):
+            order.append(name)
+
+    holder = asyncio.create_task(hold())
+    await holding.wait()
+    waiters = [
+        asyncio.create_task(request(lane, name))
+        for lane, name in (('ingest', 'embed'), ('intent', 'classify'), ('chat', 'answer'))
+    ]
+    abandoned = asyncio.create_task(request('chat', 'gone'))
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()['llama3']['queued'] == {'chat': 2, 'intent': 1, 'ingest': 1}
+
+    # the queue is full: interactive lanes are turned away, ingestion waits
+    with pytest.raises(LLMQueueFull) as exc:
+        async with scheduler.aslot('llama3', 'chat'):
+            pass
+    assert exc.value.retry_after >= 1
+
+    def ingest_from_thread():
+        with scheduler.slot('llama3', 'ingest'):
+            order.append('thread')
+
+    thread = threading.Thread(target=ingest_from_thread, daemon=True)
+    thread.start()
+
+    abandoned.cancel()
+    await asyncio.sleep(0.05)
+    assert scheduler.stats()['llama3']['queued']['chat'] == 1
+
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    await asyncio.to_thread(thread.join)
+
+    assert order == ['answer', 'classify', 'embed', 'thread']
+    stats = scheduler.stats()['llama3']
+    assert stats['rejected']['chat'] == 1
+    assert stats['active'] == 0 and sum(stats['queued'].values()) == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_ingest_backlog_does_not_reject_chat():
+    from core.scheduler import LLMQueueFull, LLMScheduler
+
+    scheduler = LLMScheduler(limit=1, max_queue=1)
+    order = []
+    release = asyncio.Event()
+
+    async def request(lane, name, hold=False):
+        async with scheduler.aslot('nomic-embed-text', lane):
+            order.append(name)
+            if hold:
+                await release.wait()
+
+    holder = asyncio.create_task(request('chat', 'held', hold=True))
+    await asyncio.sleep(0.01)
+    tasks = [asyncio.create_task(request('ingest', f'ingest{i}')) for i in range(3)]
+    await asyncio.sleep(0.01)
+
+    # three ingestion embeddings are waiting, yet a query embedding still queues
+    tasks.append(asyncio.create_task(request('chat', 'query')))
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()['nomic-embed-text']['queued'] == {'chat': 1, 'intent': 0, 'ingest': 3}
+    with pytest.raises(LLMQueueFull):
+        async with scheduler.aslot('nomic-embed-text', 'chat'):
+            pass
+
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    assert order == ['held', 'query', 'ingest0', 'ingest1', 'ingest2']
@@ -0,0 +1,531 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of text per entry in *pages*."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{off:010d} 00000 n \n" for off in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+    return str(path)
+
+
+class DummyLLM:
+    embed_model = 'dummy-embed'
+
+    def __init__(self):
+        self.batches = []
+        self.embedded = []
+
+    def embed(self, text):
+        self.embedded.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_batch(self, texts):
+        self.batches.append(list(texts))
+        return [self.embed(t) for t in texts]
+
+
+class DummyCollection:
+    def __init__(self):
+        self.adds = []
+        self.queries = []
+        self.items = {}
+        self.documents = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.adds.append(ids)
+        self.items.update(zip(ids, metadatas))
+        self.documents.update(zip(ids, documents))
+
+    def get(self, where=None, include=None, limit=None, offset=0):
+        ids = [i for i, m in self.items.items() if where is None or m['doc_id'] == where['doc_id']]
+        ids = ids[offset:offset + limit if limit else None]
+        return {
+            "ids": ids,
+            "documents": [self.documents[i] for i in ids],
+            "metadatas": [self.items[i] for i in ids],
+        }
+
+    def delete(self, ids=None, where=None):
+        if where is not None:
+            ids = [i for i, m in self.items.items() if m['doc_id'] == where['doc_id']]
+        for i in ids:
+            self.items.pop(i, None)
+            self.documents.pop(i, None)
+
+    def count(self):
+        return len(self.items)
+
+    def query(self, *args, **kwargs):
+        self.queries.append(kwargs)
+        return getattr(self, 'result', {"documents": [[]], "metadatas": [[]]})
+
+
+def make_rag(monkeypatch, llm, **kwargs):
+    import core.rag as rag_module
+
+    collections = {}
+
+    class DummyClient:
+        def get_or_create_collection(self, name):
+            return collections.setdefault(name, DummyCollection())
+
+        def list_collections(self):
+            return list(collections)
+
+        def delete_collection(self, name):
+            del collections[name]
+
+    monkeypatch.setattr(rag_module, "_lexical_indexes", {})
+    monkeypatch.setattr(rag_module, "chromadb", type("x", (), {"HttpClient": lambda *a, **k: DummyClient()})())
+    return rag_module.RAG(llm, 'http://chroma:8000', **kwargs), collections
+
+
+def test_embed_pdf_batches(tmp_path, monkeypatch):
+    llm = DummyLLM()
+    rag, collections = make_rag(monkeypatch, llm, embed_batch_size=4)
+    path = write_pdf(tmp_path / 'manual.pdf', [f'Page {i} pump error E{i}' for i in range(10)])
+
+    stats = rag.embed_pdf(path, 'global', is_temp=False, doc_id='7')
+
+    assert stats.pages == 10
+    assert stats.chunks == 10
+    assert all(len(b) <= 4 for b in llm.batches)
+    assert sum(len(b) for b in llm.batches) == stats.chunks
+    # one bulk add per embedding batch
+    assert len(collections['global'].adds) == len(llm.batches)
+
+
+def test_embed_pdf_reingests_only_changed_chunks(tmp_path, monkeypatch):
+    llm = DummyLLM()
+    rag, collections = make_rag(monkeypatch, llm)
+    pages = [f'Page {i} pump error E{i}' for i in range(5)]
+
+    first = rag.embed_pdf(write_pdf(tmp_path / 'a.pdf', pages), 'global', is_temp=False, doc_id='7')
+    again = rag.embed_pdf(write_pdf(tmp_path / 'b.pdf', pages), 'global', is_temp=False, doc_id='7')
+    assert (first.chunks, again.chunks, again.skipped) == (5, 0, 5)
+    assert again.file_hash == first.file_hash
+
+    pages[2] = 'Page 2 replaced valve V9'
+    changed = rag.embed_pdf(write_pdf(tmp_path / 'c.pdf', pages[:4]), 'global', is_temp=False, doc_id='7')
+    assert (changed.chunks, changed.skipped, changed.removed) == (1, 3, 1)
+    assert llm.batches[-1] == ['Page 2 replaced valve V9']
+    assert sorted(collections['global'].items) == [f'7:{i}:0' for i in range(4)]
+
+
+def test_extractor_process_pool_streams_in_page_order(tmp_path):
+    from core.extract import PdfExtractor
+
+    path = write_pdf(tmp_path / 'manual.pdf', [f'Page {i} pump error E{i}' for i in range(9)])
+    serial = list(PdfExtractor().iter_chunks(path))
+    pool = PdfExtractor(workers=2, pages_per_task=2, max_inflight=2)
+    try:
+        parallel = list(pool.iter_chunks(path))
+    finally:
+        pool.shutdown()
+
+    assert parallel == serial
+    assert [page for page, _, _ in serial] == list(range(9))
+    assert serial[3] == (3, 0, 'Page 3 pump error E3')
+
+
+def test_splitter_merges_pieces_with_overlap():
+    from core.splitter import RecursiveTextSplitter
+
+    splitter = RecursiveTextSplitter(chunk_size=20, chunk_overlap=8)
+    text = 'Check the pump seal.\n\nReplace bearing 6204-2RS if noisy.'
+
+    assert splitter.split_text(text) == [
+        'Check the pump seal.',
+        'Replace bearing',
+        'bearing 6204-2RS if',
+        'if noisy.',
+    ]
+    assert splitter.split_text('   ') == []
+
+
+def test_backend_imports_heavy_dependencies_lazily(tmp_path):
+    import os
+    import subprocess
+
+    backend = Path(__file__).resolve().parents[1]
+    # importing the app, running its lifespan and serving non-RAG routes
+    code = (
+        'import sys, main\n'
+        'from core import db\n'
+        'from fastapi.testclient import TestClient\n'
+        'db.SQLModel.metadata.create_all(db.engine)\n'
+        'with TestClient(main.app) as client:\n'
+        '    assert client.get("/health").status_code == 200\n'
+        '    assert client.post("/sessions/").status_code == 200\n'
+        'print(",".join(m for m in ("chromadb", "langchain", "pypdf") if m in sys.modules))'
+    )
+    env = {
+        **os.environ,
+        'POSTGRES_URL': f'sqlite:///{tmp_path}/db.db',
+        'VECTOR_STORE': 'chroma',
+        'CHROMA_URL': 'http://127.0.0.1:9',
+        'OLLAMA_URL': 'http://127.0.0.1:9',
+        'MODEL_CHECK_RETRY': '0',
+    }
+    proc = subprocess.run(
+        [sys.executable, '-c', code], cwd=backend, env=env, capture_output=True, text=True, check=True
+    )
+
+    assert proc.stdout.strip() == ''
+
+
+def test_query_embedding_cache(monkeypatch):
+    llm = DummyLLM()
+    rag, collections = make_rag(monkeypatch, llm)
+
+    rag.retrieve('How do I bleed the pump?', 'temp_1')
+    rag.retrieve('  how do I   bleed the PUMP? ', 'temp_1')
+
+    # embedded once, then served from the cache for both collections
+    assert llm.embedded == ['How do I bleed the pump?']
+    assert rag.query_cache.stats()['hits'] == 1
+    assert rag.query_cache.stats()['misses'] == 1
+    for name in ('global', 'temp_1'):
+        assert all(q['query_embeddings'] == [[24.0, 1.0]] for q in collections[name].queries)
+        assert all('query_texts' not in q for q in collections[name].queries)
+
+
+def test_concurrent_query_embeddings_share_one_request(monkeypatch):
+    import asyncio
+    import threading
+
+    class SlowLLM(DummyLLM):
+        def embed(self, text):
+            started.set()
+            release.wait(5)
+            return super().embed(text)
+
+    started, release = threading.Event(), threading.Event()
+    llm = SlowLLM()
+    rag, _ = make_rag(monkeypatch, llm)
+
+    async def both():
+        retrieval = asyncio.create_task(rag.aembed_query('pump seal?'))
+        await asyncio.to_thread(started.wait, 5)
+        classification = asyncio.create_task(rag.aembed_query('Pump  seal?'))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(retrieval, classification)
+
+    first, second = asyncio.run(both())
+    assert first == second
+    assert llm.embedded == ['pump seal?']
+
+
+def test_answer_cache_scoped_by_global_version(tmp_path, monkeypatch):
+    from core.cache import SemanticCache
+
+    class ChatLLM(DummyLLM):
+        chat_model = 'dummy-chat'
+
+        def __init__(self):
+            super().__init__()
+            self.chats = 0
+
+        def chat(self, messages):
+            self.chats += 1
+            return f'answer {self.chats}'
+
+    llm = ChatLLM()
+    rag, collections = make_rag(monkeypatch, llm, answer_cache=SemanticCache(threshold=0.95))
+
+    assert rag.query('How do I bleed the pump?', 'temp_1') == ('answer 1', [])
+    assert rag.query('how do I bleed the pump? ', 'temp_1') == ('answer 1', [])
+    assert llm.chats == 1
+
+    # new global content invalidates the cached answer
+    rag.embed_pdf(write_pdf(tmp_path / 'm.pdf', ['Bleed valve V2']), 'global', is_temp=False)
+    assert rag.query('How do I bleed the pump?', 'temp_1')[0] == 'answer 2'
+
+    # sessions with their own documents always go to the model
+    rag.embed_pdf(write_pdf(tmp_path / 't.pdf', ['Session notes']), 'temp_1', is_temp=False)
+    rag.query('How do I bleed the pump?', 'temp_1')
+    rag.query('How do I bleed the pump?', 'temp_1')
+    assert llm.chats == 4
+
+
+def test_retrieve_merges_collections_into_global_top_k(monkeypatch):
+    rag, collections = make_rag(monkeypatch, DummyLLM(), min_similarity=0.5)
+    rag._collection('global').result = {
+        'documents': [['g1', 'g2', 'g3']],
+        'metadatas': [[{'c': 'g1'}, {'c': 'g2'}, {'c': 'g3'}]],
+        'distances': [[0.2, 0.5, 1.2]],
+    }
+    rag._collection('temp_1').result = {
+        'documents': [['t1', 't2']],
+        'metadatas': [[{'c': 't1'}, {'c': 't2'}]],
+        'distances': [[0.1, 0.4]],
+    }
+
+    docs, sources, scores = rag.retrieve('pump?', 'temp_1', top_k=3)
+
+    assert docs == ['t1', 'g1', 't2']
+    assert scores == sorted(scores, reverse=True)
+    assert all('distances' in q['include'] for c in collections.values() for q in c.queries)
+
+    # g3 (similarity 0.4) falls under the cutoff even with room left
+    assert rag.retrieve('pump?', 'temp_1', top_k=10)[0] == ['t1', 'g1', 't2', 'g2']
+
+
+def test_hybrid_retrieve_fuses_bm25_with_vector_hits(tmp_path, monkeypatch):
+    rag, collections = make_rag(monkeypatch, DummyLLM(), hybrid=True, lexical_page_size=2)
+    pages = ['Bleed the pump before start', 'Fault E-42 means low pressure', 'Clean the filter']
+    rag.embed_pdf(write_pdf(tmp_path / 'a.pdf', pages), 'global', is_temp=False, doc_id='7')
+    # Chroma only returns the semantically closest chunk, not the exact code.
+    rag._collection('global').result = {
+        'documents': [['Bleed the pump before start']],
+        'metadatas': [[{'doc_id': '7', 'page': 0, 'chunk_id': 0}]],
+        'distances': [[0.2]],
+    }
+
+    docs, _, scores = rag.retrieve('what is E42?', None, top_k=2)
+    assert docs == ['Bleed the pump before start', 'Fault E-42 means low pressure']
+    assert scores[0] == scores[1] == 1 / 61
+
+    # the index built on first search follows later ingests and deletes
+    rag.embed_pdf(write_pdf(tmp_path / 'b.pdf', ['Valve V9 leaks']), 'global', is_temp=False, doc_id='8')
+    assert 'Valve V9 leaks' in rag.retrieve('v9', None)[0]
+    rag.delete_document_vectors('global', '7')
+    assert rag.lexical_index('global').stats()['chunks'] == 1
+    assert rag.retrieve('E-42', None)[0] == ['Bleed the pump before start']
+
+
+def test_bm25_index_ranks_and_compacts():
+    from core.lexical import BM25Index, tokenize
+
+    assert tokenize('Bearing 6205-2RS') == ['bearing', '6205-2rs', '62052rs', '6205', '2rs']
+    index = BM25Index()
+    for i in range(1500):
+        index.add(f'd{i}:0:0', f'filler text {i}', {'doc_id': f'd{i}'})
+    index.add('m:0:0', 'pump pump seal', {'doc_id': 'm'})
+    index.add('n:0:0', 'pump seal filler', {'doc_id': 'n'})
+    assert [hit.text for hit in index.search('pump seal', 2)] == ['pump pump seal', 'pump seal filler']
+
+    index.remove(f'd{i}:0:0' for i in range(1500))
+    assert index.stats()['tombstones'] == 0  # compacted
+    assert [hit.text for hit in index.search('filler', 5)] == ['pump seal filler']
+
+
+def test_local_vector_store_filters_and_persists(tmp_path):
+    from core.vectorstore import LocalVectorStore
+
+    store = LocalVectorStore(str(tmp_path))
+    col = store.get_or_create_collection('global')
+    col.upsert(
+        ids=['a', 'b', 'c'],
+        embeddings=[[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]],
+        documents=['pump', 'valve', 'seal'],
+        metadatas=[{'doc_id': '1', 'page': 0}, {'doc_id': '1', 'page': 3}, {'doc_id': '2', 'page': 1}],
+    )
+    res = col.query(query_embeddings=[[2.0, 0.1]], n_results=2, include=['documents', 'distances'])
+    assert res['documents'] == [['pump', 'valve']]
+    assert res['distances'][0][0] < res['distances'][0][1]
+
+    res = col.query(query_embeddings=[[1.0, 0.0]], n_results=5, where={'page': {'$gte': 1}})
+    assert res['ids'] == [['b', 'c']]
+    assert col.get(where={'doc_id': '1'}, limit=1, offset=1)['ids'] == ['b']
+
+    col.upsert(ids=['a'], embeddings=[[0.0, 1.0]], documents=['pump v2'], metadatas=[{'doc_id': '1', 'page': 0}])
+    col.delete(where={'doc_id': '2'})
+
+    reopened = LocalVectorStore(str(tmp_path)).get_or_create_collection('global')
+    assert reopened.count() == 2
+    assert reopened.query(query_embeddings=[[0.0, 1.0]], n_results=1)['documents'] == [['pump v2']]
+    assert store.list_collections() == ['global']
+    store.delete_collection('global')
+    assert store.list_collections() == []
+
+
+def test_local_vector_store_ivf_recall(tmp_path):
+    import numpy as np
+    from core.vectorstore import LocalVectorStore
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(2000, 16)).astype('float32')
+    queries = rng.normal(size=(20, 16)).astype('float32')
+    ids = [str(i) for i in range(len(vectors))]
+    flat = LocalVectorStore(str(tmp_path / 'flat')).get_or_create_collection('c')
+    ivf = LocalVectorStore(str(tmp_path / 'ivf'), index='ivf', ivf_min_rows=1000, nprobe=16).get_or_create_collection('c')
+    for col in (flat, ivf):
+        col.upsert(ids=ids, embeddings=vectors)
+
+    exact = flat.query(query_embeddings=queries, n_results=10)['ids']
+    approx = ivf.query(query_embeddings=queries, n_results=10)['ids']
+    recall = np.mean([len(set(e) & set(a)) / 10 for e, a in zip(exact, approx)])
+    assert recall >= 0.9
+
+    # re-upserting rows, within their bucket or across buckets and back,
+    # never yields the same id twice
+    for vector in (vectors[0], vectors[0], -vectors[0], vectors[0]):
+        ivf.upsert(ids=['0'], embeddings=[vector])
+    hits = ivf.query(query_embeddings=[vectors[0]], n_results=3)['ids'][0]
+    assert hits[0] == '0' and len(set(hits)) == 3
+
+
+def test_quantized_search_reranks_with_float_vectors(tmp_path):
+    import numpy as np
+    from core.vectorstore import LocalVectorStore
+
+    rng = np.random.default_rng(2)
+    topics = rng.normal(size=(20, 256))
+    vectors = (topics[rng.integers(0, 20, 3000)] + rng.normal(scale=0.5, size=(3000, 256))).astype('float32')
+    queries = vectors[:30] + rng.normal(scale=0.3, size=(30, 256)).astype('float32')
+    ids = [str(i) for i in range(len(vectors))]
+    flat = LocalVectorStore(str(tmp_path / 'flat')).get_or_create_collection('c')
+    flat.upsert(ids=ids, embeddings=vectors)
+    exact = flat.query(query_embeddings=queries, n_results=5, include=['distances'])
+
+    # one sign bit per dimension needs a deeper shortlist to re-rank
+    for mode, rerank, floor in (('int8', 4, 0.95), ('binary', 10, 0.7)):
+        store = LocalVectorStore(str(tmp_path / mode), quantization=mode, rerank_factor=rerank)
+        col = store.get_or_create_collection('c')
+        col.upsert(ids=ids, embeddings=vectors)
+        res = col.query(query_embeddings=queries, n_results=5, include=['distances'])
+        recall = np.mean([len(set(e) & set(r)) / 5 for e, r in zip(exact['ids'], res['ids'])])
+        assert recall >= floor, mode
+        # distances of returned rows come from the float vectors
+        assert res['distances'][0][0] == exact['distances'][0][0]
+        assert col.nbytes()['codes'] < col.nbytes()['vectors'] / 3
+
+    # switching quantization on for an existing collection encodes it on open
+    upgraded = LocalVectorStore(str(tmp_path / 'flat'), quantization='int8').get_or_create_collection('c')
+    assert upgraded.query(query_embeddings=queries[:1], n_results=5)['ids'] == exact['ids'][:1]
+
+
+def test_rag_runs_on_local_vector_store(tmp_path):
+    import core.rag as rag_module
+    from core.vectorstore import LocalVectorStore
+
+    store = LocalVectorStore(str(tmp_path / 'vectors'))
+    rag = rag_module.RAG(DummyLLM(), 'http://unused:8000', store=store)
+    pages = ['Bleed the pump', 'Replace the seal kit']
+    assert rag.embed_pdf(write_pdf(tmp_path / 'a.pdf', pages), 'global', is_temp=False, doc_id='7').chunks == 2
+    assert rag.embed_pdf(write_pdf(tmp_path / 'b.pdf', pages), 'global', is_temp=False, doc_id='7').skipped == 2
+
+    docs, sources, _ = rag.retrieve('Replace the seal kit', None, top_k=1)
+    assert docs == ['Replace the seal kit']
+    assert sources[0]['page'] == 1
+
+    # without the metadata copy, sources still carry the chunk text
+    rag.metadata_text = False
+    rag.embed_pdf(write_pdf(tmp_path / 'c.pdf', ['Drain the water tank now']), 'global', is_temp=False, doc_id='8')
+    assert 'text' not in store.get_or_create_collection('global').get(where={'doc_id': '8'})['metadatas'][0]
+    assert rag.retrieve('Drain the water tank now', None, top_k=1)[1][0]['text'] == 'Drain the water tank now'
+    rag.delete_document_vectors('global', '7')
+    assert store.get_or_create_collection('global').count() == 1
+
+
+def test_mmr_prefers_diverse_hits():
+    from core.retrieval import Hit, mmr
+
+    hits = [
+        Hit('a', {}, 0.9, [1.0, 0.0]),
+        Hit('a again', {}, 0.89, [1.0, 0.01]),
+        Hit('b', {}, 0.8, [0.0, 1.0]),
+    ]
+    assert [h.text for h in mmr(hits, 2, diversity=0.0)] == ['a', 'a again']
+    assert [h.text for h in mmr(hits, 2, diversity=0.5)] == ['a', 'b']
+
+
+def test_context_builder_drops_low_scores_then_history():
+    from core.context import ContextBuilder
+
+    docs = ['a' * 400, 'b' * 400, 'c' * 400]
+    sources = [{'chunk_id': i} for i in range(3)]
+    history = [{'role': 'user', 'content': 'x' * 200}, {'role': 'assistant', 'content': 'y' * 200}]
+
+    roomy = ContextBuilder(budget=10_000).build('q?', docs, sources, [-0.2, -0.9, -0.1], history)
+    assert (roomy.chunks_dropped, roomy.history_dropped) == (0, 0)
+    assert len(roomy.messages) == 4
+
+    # over budget: the worst chunk goes first, then the oldest history
+    tight = ContextBuilder(budget=300, min_chunks=2).build('q?', docs, sources, [-0.2, -0.9, -0.1], history)
+    assert tight.sources == [{'chunk_id': 0}, {'chunk_id': 2}]
+    assert (tight.chunks_dropped, tight.history_dropped) == (1, 1)
+    assert tight.messages[1]['content'] == 'y' * 200
+    assert tight.tokens <= 300
+
+
+def test_reaper_drops_orphaned_temp_collections_after_ttl(monkeypatch):
+    import core.cleanup as cleanup
+
+    rag, collections = make_rag(monkeypatch, DummyLLM())
+    for name in ('global', 'temp_1', 'temp_2'):
+        rag._collection(name)
+    monkeypatch.setattr(cleanup.db, 'existing_session_ids', lambda ids: {1} & set(ids))
+    reaper = cleanup.TempCollectionReaper(rag, ttl=60)
+
+    assert reaper.sweep(now=0) == []
+    assert reaper.sweep(now=59) == []
+    assert reaper.sweep(now=60) == ['temp_2']
+    assert sorted(collections) == ['global', 'temp_1']
+
+
+def test_stored_chunk_scores_as_identical_to_its_own_text(monkeypatch):
+    import numpy as np
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
+    from fake_ollama import FakeOllama
+    from core.llm import LLM
+
+    class L2Collection(DummyCollection):
+        """Reports squared L2 distances over the raw vectors, as Chroma does."""
+
+        def upsert(self, ids, embeddings, documents, metadatas):
+            super().upsert(ids, embeddings, documents, metadatas)
+            self.vectors = dict(getattr(self, 'vectors', {}), **dict(zip(ids, embeddings)))
+
+        def query(self, query_embeddings, n_results, include=None):
+            ids = list(self.vectors)
+            query = np.asarray(query_embeddings[0])
+            distances = [float(np.sum((np.asarray(self.vectors[i]) - query) ** 2)) for i in ids]
+            return {
+                'documents': [[self.documents[i] for i in ids]],
+                'metadatas': [[self.items[i] for i in ids]],
+                'distances': [distances],
+            }
+
+    fake = FakeOllama().start()
+    try:
+        llm = LLM(fake.url, 'llama3', 'nomic-embed-text')
+        rag, collections = make_rag(monkeypatch, llm)
+        collection = collections['global'] = L2Collection()
+        text = 'Bleed the pump before replacing the seal kit seal kit'
+        collection.upsert(['c1'], llm.embed_batch([text]), [text], [{'doc_id': '1'}])
+
+        _, _, scores = rag.retrieve(text, None, top_k=1)
+        legacy = llm._embed_legacy(text, 'chat')
+    finally:
+        fake.stop()
+
+    assert scores == [pytest.approx(1.0)]
+    assert float(np.linalg.norm(legacy)) == pytest.approx(1.0)